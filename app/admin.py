@@ -1,13 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from django.contrib import admin
-from app.models import File, CSVs
+from app.models import File, CSVs, CSVJob
+from app.models import AnalysisCache, AnalysisCacheStats
 from app.models import Coder, Organization, OrganizationHash
 from app.models import Comment, Activity, Discuss
 from app.models import Teacher, Student 
 
 admin.site.register(File)
 admin.site.register(CSVs)
+admin.site.register(CSVJob)
+admin.site.register(AnalysisCache)
+admin.site.register(AnalysisCacheStats)
 admin.site.register(Coder)
 admin.site.register(Organization)
 admin.site.register(OrganizationHash)
@@ -0,0 +1,64 @@
+"""Run every analyzer of Dr. Scratch over a parsed project"""
+
+import time
+
+import analyzer
+import spriteNaming
+import backdropNaming
+import duplicateScripts
+import deadCode
+import attributeInitialization
+import scratchProject
+
+# Part of the key of the cached results, increase it whenever a change in
+# the analyzers changes their results
+ANALYZER_VERSION = 1
+
+
+ANALYZERS = [('mastery', analyzer.run),
+             ('spriteNaming', spriteNaming.run),
+             ('backdropNaming', backdropNaming.run),
+             ('duplicateScript', duplicateScripts.run),
+             ('deadCode', deadCode.run),
+             ('initialization', attributeInitialization.run)]
+
+
+def run_analyzers(project, timings=None):
+    """Return the result dict of every analyzer for a ScratchProject
+
+    The seconds each analyzer takes are added to the dict timings, when
+    given, as "analyzer.<name>".
+    """
+
+    results = {}
+    for name, run in ANALYZERS:
+        start = time.time()
+        results[name] = run(project)
+        if timings is not None:
+            timings['analyzer.' + name] = time.time() - start
+    return results
+
+
+def analyze_json(json_string, filename=None, timings=None):
+    """Parse a project.json and return the results of every analyzer
+
+    The seconds of the parsing go to timings as "parse", see run_analyzers.
+    """
+
+    start = time.time()
+    project = scratchProject.loads(json_string, filename)
+    if timings is not None:
+        timings['parse'] = time.time() - start
+    return run_analyzers(project, timings)
+
+
+def analyze_file(sb3, filename=None, timings=None):
+    """Open a sb3 file and return the results of every analyzer
+
+    sb3 is the path or a file object of the sb3 file. The seconds to open
+    the zip go to timings as "zip.open", see scratchProject.load and
+    analyze_json.
+    """
+
+    project = scratchProject.load(sb3, filename, timings)
+    return run_analyzers(project, timings)
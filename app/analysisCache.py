@@ -0,0 +1,310 @@
+"""Cache of the results of the analyzers
+
+Results are stored in the database by the sha256 of project.json and the
+version of the analyzers, so the same project is analyzed only once no
+matter whether it comes from an upload, an URL or a CSV. Entries expire
+after ANALYSIS_CACHE_TTL seconds, and the least recently used ones are
+evicted when there are more than ANALYSIS_CACHE_SIZE. The eviction runs
+at most once every EVICT_INTERVAL seconds per process, not on every
+store, so the cache may hold some more entries for a while.
+
+The same project.json may come under other names, so the results are
+stored without the filename which some analyzers report, and it is set
+again on every hit.
+
+The hits, misses and evictions are counted in the memory of each process
+and added to the AnalysisCacheStats row every FLUSH_INTERVAL seconds, so
+the lookups do not all write the same row. A process which stops loses
+the counts of its last interval.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from app import analysis
+from app import metrics
+from app import scratchProject
+from app.executor import get_executor
+from app.models import AnalysisCache, AnalysisCacheStats
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two evictions, and between two writes of the counters
+EVICT_INTERVAL = 60
+FLUSH_INTERVAL = 60
+
+# Analyzers whose results include the filename of the project
+NAMED_RESULTS = ('mastery', 'deadCode')
+
+_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+_last_evict = _last_flush = time.time()
+
+
+def cache_key(json_string):
+    """Key of the results of a project.json"""
+
+    return "%d-%s" % (analysis.ANALYZER_VERSION, hashlib.sha256(json_string).hexdigest())
+
+
+def file_cache_key(sb3):
+    """Same as cache_key for the project.json of a sb3 file, read in chunks"""
+
+    sha256, size = scratchProject.json_digest(sb3)
+    return "%d-%s" % (analysis.ANALYZER_VERSION, sha256)
+
+
+def named(results, filename):
+    """Copy of results with filename in the results of NAMED_RESULTS"""
+
+    results = copy.copy(results)
+    for name in NAMED_RESULTS:
+        if name in results:
+            results[name] = copy.copy(results[name])
+            results[name]['filename'] = filename
+    return results
+
+
+def _count(**counters):
+    """Add to the counters of this process, written to the database every FLUSH_INTERVAL"""
+
+    with _lock:
+        for name, value in counters.items():
+            _counters[name] += value
+        flush = time.time() - _last_flush >= FLUSH_INTERVAL
+    if flush:
+        _flush()
+
+
+def _flush():
+    """Add the counters of this process to the AnalysisCacheStats row"""
+
+    global _last_flush
+
+    with _lock:
+        counters = dict(_counters)
+        for name in _counters:
+            _counters[name] = 0
+        _last_flush = time.time()
+    if not any(counters.values()):
+        return
+
+    updated = AnalysisCacheStats.objects.filter(pk=1).update(
+        **dict((name, F(name) + value) for name, value in counters.items()))
+    if not updated:
+        try:
+            with transaction.atomic():
+                AnalysisCacheStats.objects.create(pk=1, **counters)
+        except IntegrityError:
+            AnalysisCacheStats.objects.filter(pk=1).update(
+                **dict((name, F(name) + value) for name, value in counters.items()))
+
+
+def lookup(key):
+    """Return the cached results of key, or None"""
+
+    try:
+        entry = AnalysisCache.objects.get(key=key)
+    except AnalysisCache.DoesNotExist:
+        _count(misses=1)
+        return None
+
+    now = timezone.now()
+    if entry.created < now - timedelta(seconds=settings.ANALYSIS_CACHE_TTL):
+        entry.delete()
+        _count(misses=1, evictions=1)
+        return None
+
+    AnalysisCache.objects.filter(pk=entry.pk).update(last_used=now, hits=F('hits') + 1)
+    _count(hits=1)
+    # Same order of the dicts as the analyzers return them
+    return json.loads(entry.results, object_pairs_hook=OrderedDict)
+
+
+def lookup_many(keys):
+    """Return {key: results} of the cached keys among keys
+
+    Same as lookup, in the same few queries whatever the number of keys.
+    """
+
+    keys = set(keys)
+    if not keys:
+        return {}
+
+    now = timezone.now()
+    expired = now - timedelta(seconds=settings.ANALYSIS_CACHE_TTL)
+    found = {}
+    stale = []
+    for entry in AnalysisCache.objects.filter(key__in=keys):
+        if entry.created < expired:
+            stale.append(entry.pk)
+        else:
+            found[entry.key] = json.loads(entry.results, object_pairs_hook=OrderedDict)
+
+    if stale:
+        AnalysisCache.objects.filter(pk__in=stale).delete()
+    if found:
+        AnalysisCache.objects.filter(key__in=found.keys()).update(last_used=now,
+                                                                 hits=F('hits') + 1)
+    _count(hits=len(found), misses=len(keys) - len(found), evictions=len(stale))
+    return found
+
+
+def store(key, results):
+    """Cache the results of key and evict the entries over the limits"""
+
+    try:
+        AnalysisCache.objects.create(key=key, results=json.dumps(named(results, None)))
+    except IntegrityError:
+        # Analyzed at the same time by other request
+        return
+
+    _evict_periodically()
+
+
+def store_many(entries):
+    """Same as store for a dict {key: results}, in a single INSERT"""
+
+    if not entries:
+        return
+    entries = dict((key, named(results, None)) for key, results in entries.items())
+
+    try:
+        # In a savepoint, the transaction of the caller survives the IntegrityError
+        with transaction.atomic():
+            AnalysisCache.objects.bulk_create([AnalysisCache(key=key, results=json.dumps(results))
+                                               for key, results in entries.items()])
+    except IntegrityError:
+        # Some of them analyzed at the same time by other request
+        for key, results in entries.items():
+            try:
+                with transaction.atomic():
+                    AnalysisCache.objects.create(key=key, results=json.dumps(results))
+            except IntegrityError:
+                pass
+
+    _evict_periodically()
+
+
+def _evict_periodically():
+    """Run _evict when the last eviction of this process is EVICT_INTERVAL old"""
+
+    global _last_evict
+
+    with _lock:
+        if time.time() - _last_evict < EVICT_INTERVAL:
+            return
+        _last_evict = time.time()
+    _evict()
+
+
+def _evict():
+    """Remove the expired entries and the least recently used ones over the limit"""
+
+    expired = timezone.now() - timedelta(seconds=settings.ANALYSIS_CACHE_TTL)
+    evicted = AnalysisCache.objects.filter(created__lt=expired).delete()[0]
+
+    lru = AnalysisCache.objects.order_by('-last_used') \
+                               .values_list('pk', flat=True)[settings.ANALYSIS_CACHE_SIZE:]
+    lru = list(lru)
+    if lru:
+        evicted += AnalysisCache.objects.filter(pk__in=lru).delete()[0]
+
+    if evicted:
+        _count(evictions=evicted)
+
+
+def analyze_json(json_string, filename=None):
+    """Return the results of every analyzer for a project.json, from the cache if possible"""
+
+    key = cache_key(json_string)
+    with metrics.timer('cache.lookup'):
+        results = lookup(key)
+    if results is None:
+        results = get_executor().analyze_json(json_string, filename)
+        with metrics.timer('cache.store'):
+            store(key, results)
+    return named(results, filename)
+
+
+def analyze_many(json_strings, filenames):
+    """Same as analyze_json for several projects at a time
+
+    Returns a list with the results of every project, or the exception
+    raised by its analysis. The cache is queried and filled once for all
+    of them, and a project repeated in the list is analyzed only once.
+    """
+
+    keys = [cache_key(json_string) for json_string in json_strings]
+    cached = lookup_many(keys)
+
+    analyzed = {}
+    results = []
+    for key, json_string, filename in zip(keys, json_strings, filenames):
+        if key in cached:
+            results.append(named(cached[key], filename))
+        elif key in analyzed:
+            results.append(named(analyzed[key], filename))
+        else:
+            try:
+                analyzed[key] = get_executor().analyze_json(json_string, filename)
+            except Exception as e:
+                results.append(e)
+            else:
+                results.append(analyzed[key])
+
+    store_many(analyzed)
+    return results
+
+
+def analyze_file(sb3, filename=None):
+    """Same as analyze_json for a sb3 file, given by its path or a file object
+
+    Neither the key nor the analysis read the whole project.json in the
+    memory of this process, see AnalysisExecutor.analyze_file.
+    """
+
+    # The name given by scratchProject.load
+    if filename is None and isinstance(sb3, basestring):
+        filename = sb3
+
+    with metrics.timer('cache.key'):
+        key = file_cache_key(sb3)
+    with metrics.timer('cache.lookup'):
+        results = lookup(key)
+    if results is None:
+        results = get_executor().analyze_file(sb3, filename)
+        with metrics.timer('cache.store'):
+            store(key, results)
+    return named(results, filename)
+
+
+def stats():
+    """Counters of the cache, with the ones of this process not written yet"""
+
+    _flush()
+    try:
+        counters = AnalysisCacheStats.objects.get(pk=1)
+        hits, misses, evictions = counters.hits, counters.misses, counters.evictions
+    except AnalysisCacheStats.DoesNotExist:
+        hits = misses = evictions = 0
+
+    lookups = hits + misses
+    return {'hits': hits,
+            'misses': misses,
+            'evictions': evictions,
+            'hit_rate': round(float(hits) / lookups, 3) if lookups else 0.0,
+            'entries': AnalysisCache.objects.count(),
+            'size': settings.ANALYSIS_CACHE_SIZE,
+            'ttl': settings.ANALYSIS_CACHE_TTL}
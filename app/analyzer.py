@@ -2,7 +2,8 @@
 
 import json
 from collections import Counter
-import zipfile
+
+import scratchProject
 
 
 
@@ -15,29 +16,43 @@ class Mastery:
     self.mastery_dicc = {}		#New dict to save punctuation
     self.total_blocks = [] #List with blocks
     self.blocks_dicc = Counter()		#Dict with blocks
+    self.top_level_blocks = 0		#Blocks without parent
+    self.next_blocks = False		#Some block has a next block
+    self.mouse = False			#'go to mouse' or 'touching mouse-pointer?'
+    self.fields_dicc = {}		#Dict with the values of every field
+    self.fields_counts = {}		#Dict with a Counter of every field
 
 
 
-  """Start the analysis."""
-  def process(self, filename):
-        
+  """Start the analysis from an already parsed ScratchProject.
+
+  Every block is visited only once here; the skill methods then just read
+  the counters collected in this pass.
+  """
+  def process(self, project):
+
+   self.total_blocks = project.total_blocks
+   self.blocks_dicc = project.opcode_counts
 
-   zip_file = zipfile.ZipFile(filename, "r")
-   json_project = json.loads(zip_file.open("project.json").read())
-  
-   for key, value in json_project.iteritems():
-     if key == "targets":
-       for dicc in value:
-          for dicc_key, dicc_value in dicc.iteritems():
-            if dicc_key == "blocks":
-              for blocks, blocks_value in dicc_value.iteritems():
-                if type(blocks_value) is dict:
-                  self.total_blocks.append(blocks_value)
-  
    for block in self.total_blocks:
-     for key, value in block.iteritems():
-       if key == "opcode":
-          self.blocks_dicc[value] += 1
+     if block.get("parent") == None:
+       self.top_level_blocks += 1
+     if block.get("next") != None:
+       self.next_blocks = True
+
+     fields = block.get("fields")
+     if fields:
+       for key, value in fields.iteritems():
+         if (key == 'TO' or key == 'TOUCHINGOBJECTMENU') and value[0] == '_mouse_':
+           self.mouse = True
+         # The first value of a field keeps all its items, as it always did
+         if key in self.fields_dicc:
+           self.fields_dicc[key].append(value[0])
+         else:
+           self.fields_dicc[key] = list(value)
+
+   for key, values in self.fields_dicc.iteritems():
+     self.fields_counts[key] = Counter(values)
 
 
 
@@ -56,32 +71,34 @@ class Mastery:
 
 
 
-  """Output the overall programming competence"""
-  def finalize(self, filename):
-   result = ""
-
-   result += filename 
-   result += '\n'
+  """Return the overall programming competence as a dict"""
+  def result(self, filename):
 
-   result += json.dumps(self.mastery_dicc)
-   result += '\n'
-   
    total = 0
    for i in self.mastery_dicc.items():
      total += i[1]
-   result += ("Total mastery points: %d/21\n" % total)
-   
+
    average =  float (total) / 7
-   result += ("Average mastery points: %.2f/3\n" % average)
 
    if average > 2:
-    result += "Overall programming competence: Proficiency"
+    competence = "Proficiency"
    elif average > 1:
-    result += "Overall programming competence: Developing"
+    competence = "Developing"
    else:
-    result += "Overall programming competence: Basic"
+    competence = "Basic"
+
+   return {'filename': filename,
+           'mastery': self.mastery_dicc,
+           'points': total,
+           'maxi': 21,
+           'average': average,
+           'competence': competence}
 
-   return result
+
+
+  """Output the overall programming competence"""
+  def finalize(self, filename):
+   return render(self.result(filename))
 
 
 
@@ -115,14 +132,9 @@ class Mastery:
      score = 3
    elif (self.blocks_dicc['control_repeat'] or self.blocks_dicc['control_forever']):
      score = 2
-   else:
-     for block in self.total_blocks:
-       for key, value in block.iteritems():
-         if key == "next" and value != None:
-            score = 1
-            break
-       
-     
+   elif self.next_blocks:
+     score = 1
+
    self.mastery_dicc['FlowControl'] = score
 
 
@@ -157,14 +169,8 @@ class Mastery:
             score = 3
    elif self.blocks_dicc['procedures_definition']:
             score = 2
-   else:
-      count = 0
-      for block in self.total_blocks:
-        for key, value in block.iteritems():
-          if key == "parent" and value == None:
-            count += 1
-      if count > 1 :
-         score = 1
+   elif self.top_level_blocks > 1:
+            score = 1
 
    self.mastery_dicc['Abstraction'] = score
 
@@ -238,12 +244,8 @@ class Mastery:
   """Check whether there is a block 'go to mouse' or 'touching mouse-pointer?' """
   def check_mouse(self):
 
-   for block in self.total_blocks:
-     for key, value in block.iteritems():
-       if key == 'fields':
-         for mouse_key, mouse_val in value.iteritems():
-           if (mouse_key == 'TO' or mouse_key =='TOUCHINGOBJECTMENU') and mouse_val[0] == '_mouse_':
-                 return 1
+   if self.mouse:
+     return 1
 
    return 0
 
@@ -253,41 +255,24 @@ class Mastery:
   def parallelization (self):
        
    score = 0
-   keys = [] 
-   messages = []
-   backdrops = []
-   multimedia = []
-   dict_parall = {}
- 
-   dict_parall = self.parallelization_dict()
-
 
    if self.blocks_dicc['event_whenbroadcastreceived'] > 1:            # 2 Scripts start on the same received message
-     if dict_parall['BROADCAST_OPTION']:
-        var_list = set(dict_parall['BROADCAST_OPTION'])
-        for var in var_list:
-          if dict_parall['BROADCAST_OPTION'].count(var) > 1:
-            score = 3
-            self.mastery_dicc['Parallelization'] = score
-            return
+     if self.repeated_field('BROADCAST_OPTION'):
+        score = 3
+        self.mastery_dicc['Parallelization'] = score
+        return
 
    if self.blocks_dicc['event_whenbackdropswitchesto'] > 1:           # 2 Scripts start on the same backdrop change
-      if dict_parall['BACKDROP']:
-          backdrop_list = set(dict_parall['BACKDROP'])
-          for var in backdrop_list:
-            if dict_parall['BACKDROP'].count(var) > 1:
-                score = 3
-                self.mastery_dicc['Parallelization'] = score
-                return
+      if self.repeated_field('BACKDROP'):
+         score = 3
+         self.mastery_dicc['Parallelization'] = score
+         return
 
    if self.blocks_dicc['event_whengreaterthan'] > 1:                  # 2 Scripts start on the same multimedia (audio, timer) event
-      if dict_parall['WHENGREATERTHANMENU']:
-         var_list = set(dict_parall['WHENGREATERTHANMENU'])
-         for var in var_list:
-           if dict_parall['WHENGREATERTHANMENU'].count(var) > 1:
-             score = 3
-             self.mastery_dicc['Parallelization'] = score
-             return
+      if self.repeated_field('WHENGREATERTHANMENU'):
+         score = 3
+         self.mastery_dicc['Parallelization'] = score
+         return
 
    if self.blocks_dicc['videoSensing_whenMotionGreaterThan'] > 1:     # 2 Scripts start on the same multimedia (video) event
         score = 3
@@ -295,11 +280,8 @@ class Mastery:
         return
  
    if self.blocks_dicc['event_whenkeypressed'] > 1:                   # 2 Scripts start on the same key pressed
-     if dict_parall['KEY_OPTION']:
-        var_list = set(dict_parall['KEY_OPTION'])
-        for var in var_list:
-          if dict_parall['KEY_OPTION'].count(var) > 1:
-            score = 2
+     if self.repeated_field('KEY_OPTION'):
+        score = 2
 
                               
    if self.blocks_dicc['event_whenthisspriteclicked'] > 1:           # Sprite with 2 scripts on clicked
@@ -313,29 +295,47 @@ class Mastery:
 
 
 
-  def parallelization_dict(self):
-   dicc = {}
+  """Check whether some value of a field is used more than once"""
+  def repeated_field(self, field):
 
-   for block in self.total_blocks:
-     for key, value in block.iteritems():
-         if key == 'fields':
-           for key_pressed, val_pressed in value.iteritems():
-              if key_pressed in dicc:
-                dicc[key_pressed].append(val_pressed[0])
-              else:
-                dicc[key_pressed] = val_pressed
+   counts = self.fields_counts.get(field)
+   if counts:
+     for count in counts.itervalues():
+       if count > 1:
+         return True
 
-   return dicc
+   return False
 
 
 
-def main(filename):
-    """The entrypoint for the `Mastery` extension"""
+def render(result):
+    """Render the result of the `Mastery` extension as text"""
+
+    text = ""
+    text += result['filename']
+    text += '\n'
+    text += json.dumps(result['mastery'])
+    text += '\n'
+    text += ("Total mastery points: %d/%d\n" % (result['points'], result['maxi']))
+    text += ("Average mastery points: %.2f/3\n" % result['average'])
+    text += ("Overall programming competence: %s" % result['competence'])
+
+    return text
+
+
+def run(project):
+    """Run the `Mastery` extension over a parsed ScratchProject"""
 
     mastery = Mastery()
-    mastery.process(filename)
+    mastery.process(project)
     mastery.analyze()
-    return mastery.finalize(filename)
+    return mastery.result(project.filename)
+
+
+def main(filename):
+    """The entrypoint for the `Mastery` extension"""
+
+    return render(run(scratchProject.load(filename)))
 
 
 
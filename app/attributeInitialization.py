@@ -1,6 +1,5 @@
 
-import json
-import zipfile
+import scratchProject
 
 
 class AttributeInitialization():
@@ -38,69 +37,106 @@ class AttributeInitialization():
     def __init__(self):
 
       self.total_default = 0
-      self.list_default = []
+      self.dicc_default = {}		#Dict {sprite: [attributes not initialized]}
       self.attributes = ['costume', 'orientation', 'position', 'size', 'visibility']
 
-      
-   
-    """Output the default backdrop names found in the project."""
+      # Dict {opcode: (attribute, 'absolute' or 'relative')}
+      self.opcodes = {}
+      for attribute, blocks in self.BLOCKMAPPING.iteritems():
+        for opcode, kind in blocks:
+          self.opcodes[opcode] = (attribute, kind)
+
+
+
+    """Return the attributes not initialized, by sprite, as a dict."""
+    def result(self):
+
+       return {'number': self.total_default,
+               'sprites': self.dicc_default}
+
+
+    """Output the attributes not initialized found in the project."""
     def finalize(self):
-       result = ""
-       
-       result += ("%d default backdrop names found:\n" % self.total_default)
-       for name in self.list_default:
-            result += name
-            result += "\n"
-       
-       return result
-
-
-    """Run and return the results from the SpriteNaming module."""
-    def analyze(self, filename):
-       
-      zip_file = zipfile.ZipFile(filename, "r")
-      json_project = json.loads(zip_file.open("project.json").read())
-  
-      for key, value in json_project.iteritems():
-        if key == "targets":
-          for dicc in value:
-             blocks_set = dicc["blocks"]
-             block_list = self.iter_blocks(blocks_set)
-             for name in block_list:
-                for attribute in self.attributes:
-                   if (name, 'absolute') in self.BLOCKMAPPING[attribute]:
-                     print (name, 'absolute')
-                   elif (name, 'relative') in self.BLOCKMAPPING[attribute]:
-                     print (name, 'relative')
-                   else:
-                     print name
 
+       return render(self.result())
+
+
+    """Run and return the results from the AttributeInitialization module.
+
+    An attribute of a sprite is properly initialized when some script
+    of the sprite modifies it and a green flag script sets it with an
+    absolute block (e.g. 'go to x: y:') in its main sequence.
+    """
+    def analyze(self, project):
+
+      for target, blocks_set in zip(project.targets, project.target_blocks):
+         modified = set()
+         for block in blocks_set.itervalues():
+            if block.get('opcode') in self.opcodes:
+               modified.add(self.opcodes[block['opcode']][0])
+
+         if not modified:
+            continue
+
+         initialized = set()
+         for name in self.iter_blocks(blocks_set):
+            attribute, kind = self.opcodes.get(name, (None, None))
+            if kind == 'absolute':
+               initialized.add(attribute)
 
+         not_initialized = [attribute for attribute in self.attributes
+                            if attribute in modified and attribute not in initialized]
+         if not_initialized:
+            self.total_default += 1
+            self.dicc_default[target.get("name")] = not_initialized
 
+
+
+    """Opcodes of the green flag scripts, following every next link in the
+    dict {id: block} of the target, so each block is looked up once."""
     def iter_blocks(self, blocks_set):
 
        block_list = []
 
-       for _, block_value in blocks_set.iteritems():
+       for block_value in blocks_set.itervalues():
           if block_value['opcode'] == 'event_whenflagclicked':
+             visited = set()
              next_block = block_value["next"]
-             
-             for block_id, block in blocks_set.iteritems():
-                if block_id == next_block:
-                   block_list.append(str(block['opcode']))
-                   next_block = block['next']
+
+             while next_block in blocks_set and next_block not in visited:
+                visited.add(next_block)
+                block = blocks_set[next_block]
+                block_list.append(str(block['opcode']))
+                next_block = block['next']
 
 
        return block_list
-                  
 
 
-def main(filename):
-    """The entrypoint for the 'attributeInitialization' extension"""
+
+def render(result):
+    """Render the result of the 'attributeInitialization' extension as text"""
+
+    text = ""
+    text += ("%d sprites with attributes not initialized:\n" % result['number'])
+    for sprite, attributes in result['sprites'].iteritems():
+         text += sprite
+         text += ": "
+         text += ", ".join(attributes)
+         text += "\n"
+
+    return text
+
+
+def run(project):
+    """Run the 'attributeInitialization' extension over a parsed ScratchProject"""
 
     attinit = AttributeInitialization()
-    attinit.analyze(filename)
-    return attinit.finalize()
+    attinit.analyze(project)
+    return attinit.result()
 
 
+def main(filename):
+    """The entrypoint for the 'attributeInitialization' extension"""
 
+    return render(run(scratchProject.load(filename)))
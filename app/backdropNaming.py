@@ -2,8 +2,7 @@
 # -*- encoding: utf-8 -*-
 # -*- coding: utf-8 -*-
 
-import json
-import zipfile
+import scratchProject
 
 
 class BackdropNaming():
@@ -21,46 +20,54 @@ class BackdropNaming():
       self.default_names = ["backdrop", "fondo", "fons", "atzeko oihala"]
 
    
+    """Return the default backdrop names found in the project as a dict."""
+    def result(self):
+
+       return {'number': self.total_default,
+               'backdrop': self.list_default}
+
+
     """Output the default backdrop names found in the project."""
     def finalize(self):
-       result = ""
-       
-       result += ("%d default backdrop names found:\n" % self.total_default)
-       for name in self.list_default:
-            result += name
-            result += "\n"
 
-       return result
+       return render(self.result())
 
 
     """Run and return the results from the SpriteNaming module."""
-    def analyze(self, filename):
-       
-      zip_file = zipfile.ZipFile(filename, "r")
-      json_project = json.loads(zip_file.open("project.json").read())
+    def analyze(self, project):
 
-      for key, value in json_project.iteritems():
-        if key == "targets":
-          for dicc in value:
-            for dicc_key, dicc_value in dicc.iteritems():
-              if dicc_key == "costumes":
-                for backdrop in dicc_value:
-                  for name_key, name_value in backdrop.iteritems():
-                    if name_key == "name":
-                      for default in self.default_names:
-                        if default in name_value:
-                          self.total_default += 1
-                          self.list_default.append(name_value)
+      for dicc in project.targets:
+        for backdrop in dicc.get("costumes", []):
+          if "name" in backdrop:
+            name_value = backdrop["name"]
+            for default in self.default_names:
+              if default in name_value:
+                self.total_default += 1
+                self.list_default.append(name_value)
 
 
 
-def main(filename):
-    """The entrypoint for the 'backdropNaming' extension"""
+def render(result):
+    """Render the result of the 'backdropNaming' extension as text"""
 
-    naming = BackdropNaming()
-    naming.analyze(filename)
-    return naming.finalize()
+    text = ""
+    text += ("%d default backdrop names found:\n" % result['number'])
+    for name in result['backdrop']:
+         text += name
+         text += "\n"
+
+    return text
 
 
+def run(project):
+    """Run the 'backdropNaming' extension over a parsed ScratchProject"""
+
+    naming = BackdropNaming()
+    naming.analyze(project)
+    return naming.result()
 
 
+def main(filename):
+    """The entrypoint for the 'backdropNaming' extension"""
+
+    return render(run(scratchProject.load(filename)))
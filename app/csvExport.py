@@ -0,0 +1,162 @@
+"""Streaming downloads of CSVs
+
+file_response serves a CSV of csvs/Dr.Scratch/ in chunks, with support
+for Range requests and conditional GET, and stream_csv writes the rows
+of a CSV as they are generated, e.g. from the File rows in the database,
+without an intermediate file.
+"""
+
+import csv
+import os
+import re
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.encoding import smart_str
+from django.utils.http import http_date, quote_etag
+from django.views.static import was_modified_since
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def read_chunks(path, start, length):
+    """Yield length bytes of a file from start, CHUNK_SIZE at a time
+
+    The file is opened on the first chunk and closed when the response is
+    closed, even if the client goes away in the middle of the download.
+    """
+
+    with open(path, 'rb') as data:
+        data.seek(start)
+        while length > 0:
+            chunk = data.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def parse_range(header, size):
+    """Return (start, end) of a single "bytes=" range of a file of size bytes
+
+    Returns None when there is no range or it has a syntax we do not
+    support, so the whole file is sent, and raises ValueError when the
+    range is not satisfiable.
+    """
+
+    match = RANGE_RE.match(header or '')
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range, the last bytes of the file
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def attachment(response, filename):
+
+    response['Content-Disposition'] = 'attachment; filename=%s' % smart_str(filename)
+    return response
+
+
+def file_response(request, path, filename, content_type='text/csv'):
+    """Stream a file as an attachment, honoring Range and conditional GET
+
+    The size of the file is taken when the request arrives, so a CSV that
+    is still being written is served up to its last complete flush.
+    """
+
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = quote_etag('%x-%x' % (int(stat.st_mtime), size))
+    last_modified = http_date(stat.st_mtime)
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        not_modified = etag in [tag.strip() for tag in if_none_match.split(',')] \
+            or if_none_match.strip() == '*'
+    else:
+        not_modified = not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                                              stat.st_mtime, size)
+    if not_modified:
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        response['Last-Modified'] = last_modified
+        return response
+
+    # A range of an older version of the file is not valid anymore
+    if_range = request.META.get('HTTP_IF_RANGE')
+    ranged = if_range is None or if_range in (etag, last_modified)
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size) if ranged else None
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % size
+        return response
+
+    if byte_range is None:
+        start, end = 0, size - 1
+        response = StreamingHttpResponse(read_chunks(path, 0, size), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(read_chunks(path, start, end - start + 1),
+                                         content_type=content_type, status=206)
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+
+    response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    return attachment(response, filename)
+
+
+class Echo(object):
+
+    """File-like object whose write returns what it is given, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, filename):
+    """Stream the rows of a CSV as they are generated"""
+
+    writer = csv.writer(Echo())
+    response = StreamingHttpResponse((writer.writerow(row) for row in rows),
+                                     content_type='text/csv')
+    return attachment(response, filename)
+
+
+def files_rows(files, dic):
+    """CSV rows of the results stored in File rows, header first
+
+    files is a queryset of File, read with iterator() so that the rows are
+    not cached in memory.
+    """
+
+    yield ["File", "Date", dic["mastery"],
+           dic["abstraction"], dic["parallelism"],
+           dic["logic"], dic["sync"],
+           dic["flow_control"], dic["user_inter"], dic["data_rep"],
+           dic["dup_scripts"], dic["sprite_naming"],
+           dic["dead_code"], dic["attr_init"]]
+
+    for filename in files.order_by('time', 'id').iterator():
+        competences = [filename.abstraction, filename.parallelization,
+                       filename.logic, filename.synchronization,
+                       filename.flowControl, filename.userInteractivity,
+                       filename.dataRepresentation]
+        yield [smart_str(filename.filename), filename.time.isoformat(), sum(competences)] + \
+              competences + [filename.duplicateScript, filename.spriteNaming,
+                             filename.deadCode, filename.initialization]
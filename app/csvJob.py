@@ -0,0 +1,288 @@
+"""Background analysis of the CSVs uploaded by organizations and coders
+
+analyze_CSV only stores the uploaded file and creates a CSVJob. The jobs
+are run by the csvworker management command, which polls the database
+and analyzes the projects in batches of BATCH rows. Every batch is
+downloaded and looked up in the analysis cache at a time, its rows are
+appended to the output CSV, so the partial file can be downloaded while
+the job runs, and its File rows are inserted together with the progress
+of the job and the size of the output in a single transaction. An
+interrupted job goes on from its last saved batch when the worker is
+started again, and the rows written after that batch are dropped from
+the output first.
+"""
+
+import csv
+import logging
+import os
+import traceback
+from datetime import datetime
+
+from django.db import transaction
+
+from app import fetcher
+from app import org
+from app import views
+from app import analysisCache
+from app.models import CSVJob, CSVs, File
+
+logger = logging.getLogger(__name__)
+
+DIR_CSVS = os.path.dirname(os.path.dirname(__file__)) + "/csvs/"
+DIR_OUTPUT = DIR_CSVS + "Dr.Scratch/"
+
+# Rows downloaded, analyzed and saved at a time
+BATCH = 100
+
+
+def read_lines(path_csv):
+    """Return the non empty lines of an uploaded CSV"""
+
+    with open(path_csv, 'r') as csv_file:
+        return [line.rstrip("\r\n") for line in csv_file if line.strip()]
+
+
+def csv_type(lines):
+    """Return "2_row" when the lines have a code and an URL, else "1_row\""""
+
+    if lines and len(lines[0].split(",")) == 2:
+        return "2_row"
+    return "1_row"
+
+
+def parse_line(line):
+    """Return the code, the URL and the id of the project of a line"""
+
+    fields = line.split(",")
+    if len(fields) == 2:
+        code, url = fields
+    else:
+        code, url = None, fields[0]
+    url = url.strip()
+
+    if url.isdigit():
+        return code, url, url
+
+    slash_num = url.count('/')
+    if slash_num == 4:
+        return code, url, url.split("/")[-1]
+    elif slash_num == 5:
+        return code, url, url.split('/')[-2]
+    return code, url, None
+
+
+def csv_header(dic, type_csv):
+
+    header = [dic["url"], dic["mastery"],
+              dic["abstraction"], dic["parallelism"],
+              dic["logic"], dic["sync"],
+              dic["flow_control"], dic["user_inter"], dic["data_rep"],
+              dic["dup_scripts"], dic["sprite_naming"],
+              dic["dead_code"], dic["attr_init"]]
+    if type_csv == "2_row":
+        header.insert(0, dic["code"])
+    return header
+
+
+def new_file(job, id_project, results):
+    """File of a project of a job with the results of the analyzers, not saved yet
+
+    results is None when the project could not be analyzed.
+    """
+
+    filename = File(filename=id_project + ".sb3",
+                    organization=job.organization, coder=job.coder,
+                    method="csv", time=datetime.now(),
+                    score=0, abstraction=0, parallelization=0,
+                    logic=0, synchronization=0, flowControl=0,
+                    userInteractivity=0, dataRepresentation=0,
+                    spriteNaming=0, initialization=0,
+                    deadCode=0, duplicateScript=0)
+    if results is None:
+        filename.method = 'csv/error'
+        return filename
+
+    mastery = results['mastery']['mastery']
+    filename.score = results['mastery']['points']
+    filename.abstraction = mastery["Abstraction"]
+    filename.parallelization = mastery["Parallelization"]
+    filename.logic = mastery["Logic"]
+    filename.synchronization = mastery["Synchronization"]
+    filename.flowControl = mastery["FlowControl"]
+    filename.userInteractivity = mastery["UserInteractivity"]
+    filename.dataRepresentation = mastery["DataRepresentation"]
+    filename.spriteNaming = results['spriteNaming']['number']
+    filename.initialization = results['initialization']['number']
+    filename.deadCode = results['deadCode']['number']
+    filename.duplicateScript = results['duplicateScript']['number']
+    return filename
+
+
+def prefetch(lines):
+    """Download the projects of several lines at a time
+
+    Returns a dict {id: result of Fetcher.fetch_project or its exception}.
+    """
+
+    ids_projects = set()
+    for line in lines:
+        code, url, id_project = parse_line(line)
+        if id_project is not None:
+            ids_projects.add(id_project)
+
+    ids_projects = list(ids_projects)
+    return dict(zip(ids_projects, fetcher.get_fetcher().fetch_projects(ids_projects)))
+
+
+def result_row(line, results):
+    """CSV row of the results of the project of a line"""
+
+    code, url, id_project = parse_line(line)
+    mastery = results['mastery']['mastery']
+    competences = [mastery["Abstraction"], mastery["Parallelization"],
+                   mastery["Logic"], mastery["Synchronization"],
+                   mastery["FlowControl"], mastery["UserInteractivity"],
+                   mastery["DataRepresentation"]]
+    row = [url, sum(competences)] + competences + \
+          [results['duplicateScript']['number'], results['spriteNaming']['number'],
+           results['deadCode']['number'], results['initialization']['number']]
+    if code is not None:
+        row.insert(0, code)
+    return row
+
+
+def error_row(line, dic):
+
+    code, url, id_project = parse_line(line)
+    if code is not None:
+        return [code, url, dic["error"]]
+    return [url, dic["error"]]
+
+
+def output_path(job):
+    return DIR_OUTPUT + job.filename
+
+
+def analyze_batch(job, lines, dic):
+    """Analyze the projects of some lines of a job
+
+    Returns the CSV rows of the lines, the unsaved File of every downloaded
+    project and the number of lines which could not be analyzed.
+    """
+
+    downloaded = prefetch(lines)
+
+    projects = []
+    for line in lines:
+        code, url, id_project = parse_line(line)
+        try:
+            if id_project is None:
+                raise ValueError("Invalid project URL: %s" % url)
+            if isinstance(downloaded[id_project], Exception):
+                raise downloaded[id_project]
+            json_project, ext_type_project = views.download_scratch_project_from_servers(
+                id_project, downloaded[id_project])
+        except Exception:
+            logger.error('Impossible download project of line %s', line)
+            traceback.print_exc()
+            projects.append((line, id_project, None))
+        else:
+            # The analysis runs from memory, the sb3 is only kept as an archive
+            views.archive_projectsb3(json_project, id_project)
+            projects.append((line, id_project, json_project))
+
+    analyzed = [(line, id_project, json_project)
+                for line, id_project, json_project in projects if json_project is not None]
+    results = analysisCache.analyze_many([json_project for _, _, json_project in analyzed],
+                                         [id_project + ".sb3" for _, id_project, _ in analyzed])
+    results = dict((line, result) for (line, _, _), result in zip(analyzed, results))
+
+    rows = []
+    files = []
+    errors = 0
+    for line, id_project, json_project in projects:
+        if json_project is None:
+            rows.append(error_row(line, dic))
+            errors += 1
+        elif isinstance(results[line], Exception):
+            logger.error('Impossible analyze project of line %s: %s', line, results[line])
+            views.save_projectsb3(json_project, id_project, "/error_analyzing/")
+            rows.append(error_row(line, dic))
+            files.append(new_file(job, id_project, None))
+            errors += 1
+        else:
+            rows.append(result_row(line, results[line]))
+            files.append(new_file(job, id_project, results[line]))
+
+    return rows, files, errors
+
+
+def run_job(job):
+    """Analyze the projects of a job, going on from its last saved batch"""
+
+    lines = read_lines(job.upload)
+    type_csv = csv_type(lines)
+    dic = org.translate_CT(job.language)
+
+    job.total = len(lines)
+    job.save(update_fields=['total'])
+
+    # Rows of the saved batches of an interrupted run are kept, the rows
+    # written after its last saved batch are written again
+    if job.done == 0:
+        output = open(output_path(job), 'wb')
+        csv.writer(output).writerow(csv_header(dic, type_csv))
+    else:
+        output = open(output_path(job), 'r+b')
+        output.seek(job.output_size)
+        output.truncate()
+
+    try:
+        writer = csv.writer(output)
+        for first in range(job.done, job.total, BATCH):
+            batch = lines[first:first + BATCH]
+            rows, files, errors = analyze_batch(job, batch, dic)
+
+            writer.writerows(rows)
+            output.flush()
+
+            # The projects of the batch and the progress of the job are saved together
+            with transaction.atomic():
+                File.objects.bulk_create(files)
+                job.done = first + len(batch)
+                job.errors += errors
+                job.output_size = output.tell()
+                job.save(update_fields=['done', 'errors', 'output_size'])
+
+            for filename in files:
+                views.write_activity_in_logfile(filename)
+    finally:
+        output.close()
+
+    csv_save = CSVs(filename=job.filename, directory=output_path(job),
+                    organization=job.organization, coder=job.coder)
+    csv_save.save()
+
+    job.csv = csv_save
+    job.status = CSVJob.FINISHED
+    job.finished = datetime.now()
+    job.save(update_fields=['csv', 'status', 'finished'])
+
+
+def claim_job():
+    """Mark the oldest pending job as running and return it, or None"""
+
+    for job in CSVJob.objects.filter(status=CSVJob.PENDING).order_by('date'):
+        # Only one worker wins the update when several of them poll at once
+        claimed = CSVJob.objects.filter(pk=job.pk, status=CSVJob.PENDING) \
+                                .update(status=CSVJob.RUNNING)
+        if claimed:
+            job.status = CSVJob.RUNNING
+            return job
+    return None
+
+
+def requeue_interrupted_jobs():
+    """Put back in the queue the jobs left running by a stopped worker"""
+
+    return CSVJob.objects.filter(status=CSVJob.RUNNING).update(status=CSVJob.PENDING)
@@ -1,8 +1,7 @@
-import json
-import zipfile
-
 import logging
 
+import scratchProject
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,64 +22,84 @@ class DeadCode():
 
 
     """Run and return the results form the DeadCode plugin."""
-    def analyze(self, filename):
-
-        zip_file = zipfile.ZipFile(filename, "r")
-        json_project = json.loads(zip_file.open("project.json").read())
+    def analyze(self, project):
 
         sprites = {}
 
-        for key, value in json_project.iteritems():
-            if key == "targets":
-                for dicc in value:
-                    sprite = dicc["name"]
-                    blocks_list = []
-                    for _, blocks_dicc in dicc["blocks"].iteritems():
-                        if type(blocks_dicc) is dict:
-                            event_variable = any(blocks_dicc["opcode"] == event for event in self.event_variables)
-                            loop_block = any(blocks_dicc["opcode"] == loop for loop in self.loop_blocks)
-
-                            if event_variable == False:
-
-                                if not self.opcode_argument_reporter in blocks_dicc["opcode"]:
-
-                                    if blocks_dicc["parent"] == None and blocks_dicc["next"] == None:
-                                        blocks_list.append(str(blocks_dicc["opcode"]))
-
-                                    # Check dead loop blocks
-                                    if loop_block and blocks_dicc["opcode"] not in blocks_list:
-                                        if not blocks_dicc["inputs"]:
-                                            # Empty loop block, but inside of a block structure
-                                            blocks_list.append(str(blocks_dicc["opcode"]))
-                                        elif "SUBSTACK" not in blocks_dicc["inputs"]:
-                                            blocks_list.append(str(blocks_dicc["opcode"]))
-                                        else:
-                                            # Could be normal loop block
-                                            if blocks_dicc["inputs"]["SUBSTACK"][1] == None:
-                                                blocks_list.append(str(blocks_dicc["opcode"]))
-
-                    if blocks_list:
-                        sprites[sprite] = blocks_list
-                        self.dead_code_instances += 1
+        for target in project.targets:
+            sprite = target["name"]
+            blocks_list = []
+            for blocks_dicc in target["blocks"].itervalues():
+                if type(blocks_dicc) is not dict:
+                    continue
+                event_variable = any(blocks_dicc["opcode"] == event for event in self.event_variables)
+                loop_block = any(blocks_dicc["opcode"] == loop for loop in self.loop_blocks)
+
+                if event_variable == False:
+
+                    if not self.opcode_argument_reporter in blocks_dicc["opcode"]:
+
+                        if blocks_dicc["parent"] == None and blocks_dicc["next"] == None:
+                            blocks_list.append(str(blocks_dicc["opcode"]))
+
+                        # Check dead loop blocks
+                        if loop_block and blocks_dicc["opcode"] not in blocks_list:
+                            if not blocks_dicc["inputs"]:
+                                # Empty loop block, but inside of a block structure
+                                blocks_list.append(str(blocks_dicc["opcode"]))
+                            elif "SUBSTACK" not in blocks_dicc["inputs"]:
+                                blocks_list.append(str(blocks_dicc["opcode"]))
+                            else:
+                                # Could be normal loop block
+                                if blocks_dicc["inputs"]["SUBSTACK"][1] == None:
+                                    blocks_list.append(str(blocks_dicc["opcode"]))
+
+            if blocks_list:
+                sprites[sprite] = blocks_list
+                self.dead_code_instances += 1
 
         return sprites
 
+    """Return the dead code found, by sprite, as a dict."""
+    def result(self, dicc_deadCode, filename):
+
+        number = 0
+        for blocks_list in dicc_deadCode.itervalues():
+            number += len(blocks_list)
+
+        return {'filename': filename,
+                'number': number,
+                'instances': self.dead_code_instances,
+                'sprites': dicc_deadCode}
+
     """Output the number of instances that contained dead code."""
 
     def finalize(self, dicc_deadCode, filename):
 
-        result = ""
-        result += filename
-        if self.dead_code_instances > 0:
-            result += "\n"
-            result += str(dicc_deadCode)
+        return render(self.result(dicc_deadCode, filename))
+
 
-        return result
+def render(result):
+    """Render the result of the 'deadCode' extension as text"""
+
+    text = ""
+    text += result['filename']
+    if result['instances'] > 0:
+        text += "\n"
+        text += str(result['sprites'])
+
+    return text
+
+
+def run(project):
+    """Run the 'deadCode' extension over a parsed ScratchProject"""
+
+    deadCode = DeadCode()
+    sprites = deadCode.analyze(project)
+    return deadCode.result(sprites, project.filename)
 
 
 def main(filename):
     """The entrypoint for the 'deadCode' extension"""
 
-    deadCode = DeadCode()
-    result = deadCode.analyze(filename)
-    return deadCode.finalize(result, filename)
+    return render(run(scratchProject.load(filename)))
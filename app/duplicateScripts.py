@@ -1,112 +1,206 @@
 
-import json
-import zipfile
+import hashlib
+import random
+import zlib
+from collections import defaultdict
+
+import scratchProject
+
+
+MIN_BLOCKS = 5          #Only scripts with more than MIN_BLOCKS blocks count
+
+SHINGLE_SIZE = 3        #Opcodes per shingle for the near duplicates
+BANDS = 8               #MinHash signature of BANDS * ROWS hashes
+ROWS = 4
+PRIME = 4294967311      #Prime bigger than any crc32
+_rand = random.Random(0)
+PERMUTATIONS = [(_rand.randint(1, PRIME - 1), _rand.randint(0, PRIME - 1))
+                for _ in range(BANDS * ROWS)]
+
+
+def fingerprint(blocks_tuple):
+    """Stable fingerprint of the opcode sequence of a script"""
+
+    return hashlib.sha1(u"\n".join(blocks_tuple).encode('utf-8')).hexdigest()
+
+
+def shingles(blocks_tuple):
+    """Set of crc32 of the SHINGLE_SIZE-grams of a sequence of opcodes"""
+
+    size = min(SHINGLE_SIZE, len(blocks_tuple))
+    return set(zlib.crc32(u" ".join(blocks_tuple[i:i + size]).encode('utf-8')) & 0xffffffff
+               for i in range(len(blocks_tuple) - size + 1))
+
+
+def minhash(shingle_set):
+    """MinHash signature of a set of shingles"""
+
+    return tuple(min((a * shingle + b) % PRIME for shingle in shingle_set)
+                 for a, b in PERMUTATIONS)
 
 
 class DuplicateScripts():
 
    """Analyzer of duplicate scripts in projects sb3, the new version Scratch 3.0"""
 
-   def __init__(self):
+   def __init__(self, near_duplicates=False, threshold=0.8):
 
      self.total_duplicate = 0
      self.blocks_dicc = {}
      self.total_blocks = []
      self.list_duplicate = []
+     self.copies_dicc = {}      #Dict {fingerprint: [tuple of opcodes, copies]}
+     self.duplicate_fingerprints = []
+     self.near_duplicates = near_duplicates
+     self.threshold = threshold
+     self.list_near_duplicate = []
      #self.list_duplicate_string = []
 
 
    """Only takes into account scripts with more than 5 blocks"""
-   def analyze(self, filename):
-
-     zip_file = zipfile.ZipFile(filename, "r")
-     json_project = json.loads(zip_file.open("project.json").read())
-  
-     scripts_set = set()
+   def analyze(self, project):
 
-     for key, value in json_project.iteritems():
-       if key == "targets":
-         for dicc in value:
-           for dicc_key, dicc_value in dicc.iteritems():
-             if dicc_key == "blocks":
-               for blocks, blocks_value in dicc_value.iteritems():
-                 if type(blocks_value) is dict:
-                   self.blocks_dicc[blocks] = blocks_value
-                   self.total_blocks.append(blocks_value)
+     self.blocks_dicc = project.blocks
+     self.total_blocks = project.total_blocks
 
 
      for key_block in self.blocks_dicc:
        block = self.blocks_dicc[key_block]
 
        if block["topLevel"] == True:
-          block_list = []
-          block_list.append(block["opcode"])
-          next = block["next"]
-          aux_next = None
-          self.search_next(next, block_list, key_block, aux_next)
-
-          blocks_tuple = tuple(block_list)
-
-          if blocks_tuple in scripts_set:
-             if len(block_list) > 5:
-                if not block_list in self.list_duplicate:
-                   self.total_duplicate += 1
-                   self.list_duplicate.append(block_list)
+          blocks_tuple = self.search_next(key_block)
+          key = fingerprint(blocks_tuple)
+
+          if key in self.copies_dicc:
+             copies = self.copies_dicc[key]
+             copies[1] += 1
+             if copies[1] == 2 and len(blocks_tuple) > MIN_BLOCKS:
+                self.total_duplicate += 1
+                self.list_duplicate.append(list(blocks_tuple))
+                self.duplicate_fingerprints.append(key)
           else:
-             scripts_set.add(blocks_tuple)
-  
-
-
-   def search_next(self, next, block_list, key_block, aux_next):
-       if next == None:
-           try:
-              # Maybe is a control_forever block
-              next = self.blocks_dicc[key_block]["inputs"]["SUBSTACK"][1]
-              if next == None:
-                  return
-           except:
-              if aux_next != None:      #Check if there is a aux_next saved
-                next = aux_next
-                aux_next = None
-              else:
-                next = None
-                return
-       else:
-            # Maybe is a loop block
-            if "SUBSTACK" in self.blocks_dicc[key_block]["inputs"]:
-                loop_block = self.blocks_dicc[key_block]["inputs"]["SUBSTACK"][1]
-                #Check if is a loop block but EMPTY
-                if loop_block != None:
-                    aux_next = next          #Save the real next until the end of the loop
-                    next = loop_block
-
-
-       block = self.blocks_dicc[next]
-       block_list.append(block["opcode"])
-       key_block = next
-       next = block["next"]
-       self.search_next(next, block_list, key_block, aux_next)
+             self.copies_dicc[key] = [blocks_tuple, 1]
+
+     if self.near_duplicates:
+       self.search_near_duplicates()
+
+
+
+   """Find pairs of different scripts with similar opcode sequences.
+
+   The sequences never include literal inputs, so they already are a
+   normalized form of the scripts. Scripts are compared through the
+   Jaccard similarity of their shingles, and only the pairs that share a
+   band of their MinHash signature (LSH) are compared, so the search does
+   not grow quadratically with the number of scripts.
+   """
+   def search_near_duplicates(self):
+
+     scripts = [blocks_tuple for blocks_tuple, _ in self.copies_dicc.itervalues()
+                if len(blocks_tuple) > MIN_BLOCKS]
+     shingle_sets = [shingles(blocks_tuple) for blocks_tuple in scripts]
+
+     buckets = defaultdict(list)
+     for index, shingle_set in enumerate(shingle_sets):
+       signature = minhash(shingle_set)
+       for band in range(BANDS):
+         buckets[(band, signature[band * ROWS:(band + 1) * ROWS])].append(index)
+
+     compared = set()
+     for bucket in buckets.itervalues():
+       for i in range(len(bucket)):
+         for j in range(i + 1, len(bucket)):
+           pair = (bucket[i], bucket[j])
+           if pair in compared:
+             continue
+           compared.add(pair)
+
+           first = shingle_sets[pair[0]]
+           second = shingle_sets[pair[1]]
+           similarity = float(len(first & second)) / len(first | second)
+           if similarity >= self.threshold:
+             self.list_near_duplicate.append([list(scripts[pair[0]]),
+                                              list(scripts[pair[1]]),
+                                              round(similarity, 2)])
 
 
 
+   """Return the opcodes of the script that starts in key_block.
+
+   The blocks are visited in reading order with an explicit stack: every
+   block, then its SUBSTACK and SUBSTACK2 (loops and ifs, nested at any
+   depth) and then its next block. Each block is visited at most once, so
+   long scripts do not hit the recursion limit and broken links in the
+   project can not make it loop forever.
+   """
+   def search_next(self, key_block):
+
+       block_list = []
+       visited = set()
+       stack = [key_block]
+
+       while stack:
+           next = stack.pop()
+           if next == None or next in visited or next not in self.blocks_dicc:
+               continue
+           visited.add(next)
+
+           block = self.blocks_dicc[next]
+           block_list.append(block["opcode"])
+
+           # Pushed in reverse order: the loop contents go before the next block
+           stack.append(block["next"])
+           inputs = block.get("inputs") or {}
+           for substack in ("SUBSTACK2", "SUBSTACK"):
+               if substack in inputs and inputs[substack]:
+                   loop_block = inputs[substack][1]
+                   #Check if is a loop block but EMPTY
+                   if isinstance(loop_block, basestring):
+                       stack.append(loop_block)
+
+       return tuple(block_list)
+
+
+
+   """Return the duplicate scripts detected as a dict."""
+   def result(self):
+
+     result = {'number': self.total_duplicate,
+               'scripts': self.list_duplicate,
+               'copies': [self.copies_dicc[key][1] for key in self.duplicate_fingerprints]}
+     if self.near_duplicates:
+       result['near_duplicates'] = self.list_near_duplicate
+
+     return result
+
+
    """Output the duplicate scripts detected."""
    def finalize(self):
 
-     result = ("%d duplicate scripts found" % self.total_duplicate)
-     result += "\n"
-     for duplicate in self.list_duplicate:
-       result += str(duplicate)
-       result += "\n"
-     return result
+     return render(self.result())
 
 
 
-def main(filename):
-    """The entrypoint for the 'duplicateScripts' extension"""
+def render(result):
+    """Render the result of the 'duplicateScripts' extension as text"""
+
+    text = ("%d duplicate scripts found" % result['number'])
+    text += "\n"
+    for duplicate in result['scripts']:
+      text += str(duplicate)
+      text += "\n"
+    return text
 
- 
-    duplicate = DuplicateScripts()
-    duplicate.analyze(filename)
-    return duplicate.finalize()
 
+def run(project, near_duplicates=False):
+    """Run the 'duplicateScripts' extension over a parsed ScratchProject"""
+
+    duplicate = DuplicateScripts(near_duplicates)
+    duplicate.analyze(project)
+    return duplicate.result()
+
+
+def main(filename):
+    """The entrypoint for the 'duplicateScripts' extension"""
 
+    return render(run(scratchProject.load(filename)))
@@ -1,3 +1,20 @@
-
 class DrScratchException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class AnalysisTimeout(DrScratchException):
+    pass
+
+
+class FetchError(DrScratchException):
+
+    def __init__(self, url, status=None, error=None):
+        DrScratchException.__init__(self, url, status, error)
+        self.url = url
+        self.status = status
+        self.error = error
+
+    def __str__(self):
+        if self.status is not None:
+            return "%s: HTTP %d" % (self.url, self.status)
+        return "%s: %s" % (self.url, self.error)
@@ -0,0 +1,214 @@
+"""Worker processes where the projects are analyzed
+
+The analyzers are pure CPU work, so running them in the request thread
+stalls the Django worker for as long as the analysis lasts. Every job
+runs instead in a process of its own, at most ANALYSIS_WORKERS of them
+at a time, and the other jobs wait for a free slot. The timeout of a job
+starts when its process starts, not while it waits, and a job over its
+timeout gets only its own process killed, so the other analyses in
+flight go on. The memory of a job is given back when its process exits,
+and every process limits its address space to ANALYSIS_MEMORY_LIMIT
+megabytes. The slow analyses are profiled when ANALYSIS_PROFILE_THRESHOLD
+is set (see profiling).
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from django.conf import settings
+
+from app import analysis
+from app import metrics
+from app import profiling
+from app.exception import AnalysisTimeout, DrScratchException
+
+logger = logging.getLogger(__name__)
+
+# Seconds a job killed for its timeout has to leave its profile
+KILL_GRACE = 10
+
+
+def _limit_memory(megabytes):
+    """Limit the address space of the current worker process"""
+
+    if not megabytes:
+        return
+
+    try:
+        import resource
+        limit = megabytes * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError):
+        logger.error('Impossible to limit the memory of the analysis worker')
+
+
+def _run_job(connection, memory_limit, function, args):
+    """Body of a worker process, sends back (True, result) or (False, exception)"""
+
+    _limit_memory(memory_limit)
+    try:
+        answer = True, function(*args)
+    except Exception as e:
+        answer = False, e
+    try:
+        connection.send(answer)
+    except Exception as e:
+        # The result or the exception could not be pickled
+        connection.send((False, DrScratchException(repr(e))))
+    connection.close()
+
+
+def _analyze_json(json_string, filename, profile):
+    """Job run inside a worker process, returns the results and the timings of its stages"""
+
+    timings = {}
+    if profile is not None:
+        return profiling.analyze_json(json_string, filename, timings, profile), timings
+    return analysis.analyze_json(json_string, filename, timings), timings
+
+
+def _analyze_file(sb3, filename, profile):
+    """Same as _analyze_json for a sb3 file, parsed in the worker process"""
+
+    timings = {}
+    if profile is not None:
+        return profiling.analyze_file(sb3, filename, timings, profile), timings
+    return analysis.analyze_file(sb3, filename, timings), timings
+
+
+class AnalysisExecutor(object):
+
+    """Bounded number of worker processes, one per job, with per-job timeouts"""
+
+    def __init__(self, workers, timeout, memory_limit, profile=None):
+
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.profile = profile
+        self._slots = threading.BoundedSemaphore(workers)
+
+
+    """Kill the process of a job which runs away.
+
+    A profiled job gets KILL_GRACE seconds after SIGTERM to save its
+    profile, see profiling.
+    """
+    def _kill(self, process):
+
+        process.terminate()
+        process.join(KILL_GRACE)
+        if process.is_alive():
+            os.kill(process.pid, signal.SIGKILL)
+            process.join()
+
+
+    """Run function(*args) in a new worker process and return its result.
+
+    Waits for a free slot first. Raises AnalysisTimeout when the process
+    lasts more than the timeout, and the exception of function when it
+    fails.
+    """
+    def run(self, function, *args):
+
+        with self._slots:
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_run_job,
+                                              args=(sender, self.memory_limit, function, args))
+            process.daemon = True
+            process.start()
+            sender.close()
+            start = time.time()
+            try:
+                if not receiver.poll(self.timeout):
+                    self._kill(process)
+                    raise AnalysisTimeout(time.time() - start)
+                try:
+                    answer = receiver.recv()
+                except EOFError:
+                    answer = None
+            finally:
+                receiver.close()
+                process.join()
+
+        if answer is None:
+            # Died without an answer, e.g. killed for its memory
+            raise DrScratchException('Worker process exited with code %s' % process.exitcode)
+        succeeded, result = answer
+        if not succeeded:
+            raise result
+        return result
+
+
+    """Run a job of the analyzers and record the timings of its stages."""
+    def _analyze(self, job, project, filename):
+
+        start = time.time()
+        try:
+            results, timings = self.run(job, project, filename, self.profile)
+        except AnalysisTimeout:
+            logger.error('Analysis of %s killed after %.1f seconds',
+                         filename, time.time() - start)
+            raise AnalysisTimeout(filename)
+
+        # Measured in the worker, aggregated in this process
+        for stage, seconds in timings.items():
+            metrics.record(stage, seconds)
+        metrics.record('executor', time.time() - start)
+        return results
+
+
+    """Analyze a project.json in a worker process and return the results of every analyzer.
+
+    Raises AnalysisTimeout when the analysis lasts more than the timeout,
+    and the exception of the analyzer when it fails.
+    """
+    def analyze_json(self, json_string, filename=None):
+
+        return self._analyze(_analyze_json, json_string, filename)
+
+
+    """Same as analyze_json for a sb3 file, given by its path or a file object.
+
+    The project.json is read from the zip inside the worker process, and
+    streamed to the parser when it is big, so it is never whole in the
+    memory of this process.
+    """
+    def analyze_file(self, sb3, filename=None):
+
+        return self._analyze(_analyze_file, sb3, filename)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the AnalysisExecutor of this process, configured in settings"""
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = AnalysisExecutor(
+                workers=getattr(settings, 'ANALYSIS_WORKERS', 2),
+                timeout=getattr(settings, 'ANALYSIS_TIMEOUT', 60),
+                memory_limit=getattr(settings, 'ANALYSIS_MEMORY_LIMIT', 1024),
+                profile=get_profiling())
+    return _executor
+
+
+def get_profiling():
+    """Return the profiling.Profiling of the settings, None when it is disabled"""
+
+    threshold = getattr(settings, 'ANALYSIS_PROFILE_THRESHOLD', 0)
+    if not threshold:
+        return None
+    return profiling.Profiling(threshold,
+                               directory=getattr(settings, 'ANALYSIS_PROFILE_DIR',
+                                                 profiling.PROFILE_DIR),
+                               max_size=getattr(settings, 'ANALYSIS_PROFILE_MAX_SIZE', 100),
+                               rate=getattr(settings, 'ANALYSIS_PROFILE_RATE', 1.0))
@@ -0,0 +1,246 @@
+"""Download of the projects from the Scratch servers
+
+Connections are kept alive and reused per host, the number of requests in
+flight is bounded, failed requests are retried with exponential backoff
+and every host gets a minimum interval between requests, so a CSV with
+hundreds of projects neither opens hundreds of connections nor floods the
+Scratch servers.
+"""
+
+import httplib
+import logging
+import socket
+import threading
+import time
+import urlparse
+from Queue import Queue, Empty, Full
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from app.exception import FetchError
+
+logger = logging.getLogger(__name__)
+
+SCRATCH_PROJECT_URL = "https://projects.scratch.mit.edu/{}/get"
+
+# Statuses worth another try, anything else is the final answer
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ConnectionPool(object):
+
+    """Idle keep-alive connections to one host"""
+
+    def __init__(self, scheme, host, size, timeout):
+
+        self.scheme = scheme
+        self.host = host
+        self.timeout = timeout
+        self.idle = Queue(size)
+
+
+    def new(self):
+
+        if self.scheme == 'https':
+            return httplib.HTTPSConnection(self.host, timeout=self.timeout)
+        return httplib.HTTPConnection(self.host, timeout=self.timeout)
+
+
+    """Return an idle connection, or a new one, and whether it is reused."""
+    def get(self):
+
+        try:
+            return self.idle.get_nowait(), True
+        except Empty:
+            return self.new(), False
+
+
+    def put(self, connection):
+
+        try:
+            self.idle.put_nowait(connection)
+        except Full:
+            connection.close()
+
+
+class RateLimiter(object):
+
+    """Minimum interval between the requests to one host"""
+
+    def __init__(self, rate):
+
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_time = 0
+
+
+    def wait(self):
+
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.time()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class Fetcher(object):
+
+    """HTTP GET client with connection pooling, retries and rate limits.
+
+    concurrency bounds both the requests in flight and the idle connections
+    kept per host, rate is the maximum number of requests per second to
+    every host (0 for no limit). project_url and old_project_url are the
+    URLs of the projects, with {} for the id; without old_project_url the
+    projects are only looked for in the Scratch servers.
+    """
+
+    def __init__(self, concurrency=8, retries=3, backoff=0.5, rate=10, timeout=30,
+                 project_url=SCRATCH_PROJECT_URL, old_project_url=None):
+
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.rate = rate
+        self.timeout = timeout
+        self.project_url = project_url
+        self.old_project_url = old_project_url
+        self.lock = threading.Lock()
+        self.pools = {}
+        self.limiters = {}
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+
+    def _host(self, scheme, host):
+
+        with self.lock:
+            key = (scheme, host)
+            if key not in self.pools:
+                self.pools[key] = ConnectionPool(scheme, host, self.concurrency, self.timeout)
+                self.limiters[key] = RateLimiter(self.rate)
+            return self.pools[key], self.limiters[key]
+
+
+    """Send one GET, return the status and the body.
+
+    The server may have closed an idle connection, so a reused connection
+    that fails is replaced by a new one before giving up.
+    """
+    def _request(self, pool, path):
+
+        connection, reused = pool.get()
+        while True:
+            try:
+                connection.request('GET', path, headers={'Connection': 'keep-alive'})
+                response = connection.getresponse()
+                body = response.read()
+                break
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                if not reused:
+                    raise
+                connection, reused = pool.new(), False
+
+        if response.will_close:
+            connection.close()
+        else:
+            pool.put(connection)
+        return response.status, body
+
+
+    def get(self, url, retries=None):
+        """Return the body of url, raise FetchError when it fails
+
+        retries overrides the retries of the Fetcher for this request.
+        """
+
+        if retries is None:
+            retries = self.retries
+
+        parsed = urlparse.urlsplit(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        pool, limiter = self._host(parsed.scheme, parsed.netloc)
+
+        attempt = 0
+        while True:
+            limiter.wait()
+            try:
+                status, body = self._request(pool, path)
+            except (httplib.HTTPException, socket.error) as e:
+                status, body, error = None, None, e
+            else:
+                if status == 200:
+                    return body
+                error = None
+
+            if attempt >= retries or (status is not None and status not in RETRY_STATUSES):
+                raise FetchError(url, status, error)
+
+            delay = self.backoff * 2 ** attempt
+            logger.warning('GET %s failed (%s), retrying in %.1f seconds', url,
+                           status or error, delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+    def fetch_project(self, id_project):
+        """Return the project.json of a project and whether it comes from the old server
+
+        Projects missing in the Scratch servers are looked for in the
+        server of old projects, when there is one. It is asked only once,
+        without retries, so an unknown project fails at once when that
+        server is down.
+        """
+
+        try:
+            return self.get(self.project_url.format(id_project)), False
+        except FetchError as e:
+            # Two ways, id does not exist in servers or id is in other server
+            logger.error('Project %s not found in Scratch servers: %s', id_project, e)
+            if self.old_project_url is None:
+                raise
+        return self.get(self.old_project_url.format(id_project), retries=0), True
+
+
+    def map(self, function, items):
+        """Call function over items in the pool, return the results in order
+
+        The exception raised by an item is returned as its result.
+        """
+
+        def call(item):
+            try:
+                return function(item)
+            except Exception as e:
+                return e
+
+        return list(self.executor.map(call, items))
+
+
+    def fetch_projects(self, ids_projects):
+        """Download several projects at a time, see fetch_project"""
+
+        return self.map(self.fetch_project, ids_projects)
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher():
+    """Return the Fetcher of this process, configured in settings"""
+
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = Fetcher(concurrency=getattr(settings, 'FETCH_CONCURRENCY', 8),
+                               retries=getattr(settings, 'FETCH_RETRIES', 3),
+                               rate=getattr(settings, 'FETCH_RATE', 10),
+                               old_project_url=getattr(settings, 'FETCH_OLD_PROJECT_URL', None))
+    return _fetcher
@@ -0,0 +1,263 @@
+import csv
+import glob
+import io
+import json
+import os
+import tarfile
+import time
+from multiprocessing import cpu_count
+
+from concurrent.futures import ThreadPoolExecutor, ALL_COMPLETED, FIRST_COMPLETED, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.executor import AnalysisExecutor, get_profiling
+
+CSV_HEADER = ["name", "score", "abstraction", "parallelization", "logic", "synchronization",
+              "flowControl", "userInteractivity", "dataRepresentation", "duplicateScript",
+              "spriteNaming", "backdropNaming", "deadCode", "initialization", "error"]
+
+
+def is_tar(source):
+
+    return os.path.isfile(source) and tarfile.is_tarfile(source)
+
+
+def read_projects(source):
+    """Yield (name, sb3 or the exception reading it) of every sb3 of source
+
+    source is a directory, searched recursively, a tar archive, possibly
+    compressed, or a glob pattern. sb3 is the path of the file, or a file
+    object with its content for a tar archive; its project.json is only
+    read by the worker process that analyzes it.
+    """
+
+    if os.path.isdir(source):
+        paths = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            paths += [os.path.join(root, name) for name in sorted(files)
+                      if name.endswith(".sb3")]
+        names = [os.path.relpath(path, source) for path in paths]
+    elif is_tar(source):
+        for name, sb3 in read_tar(source):
+            yield name, sb3
+        return
+    else:
+        paths = names = sorted(glob.glob(source))
+
+    for name, path in zip(names, paths):
+        yield name, path
+
+
+def read_tar(path_tar):
+    """Same as read_projects for the sb3 files of a tar archive, read in order"""
+
+    archive = tarfile.open(path_tar, "r:*")
+    try:
+        for member in archive:
+            if not member.isfile() or not member.name.endswith(".sb3"):
+                continue
+            try:
+                # Still zipped, the project.json is decompressed by the worker
+                yield member.name, io.BytesIO(archive.extractfile(member).read())
+            except Exception as e:
+                yield member.name, e
+    finally:
+        archive.close()
+
+
+def result_row(name, results):
+
+    mastery = results['mastery']['mastery']
+    return [name, results['mastery']['points'],
+            mastery["Abstraction"], mastery["Parallelization"], mastery["Logic"],
+            mastery["Synchronization"], mastery["FlowControl"],
+            mastery["UserInteractivity"], mastery["DataRepresentation"],
+            results['duplicateScript']['number'], results['spriteNaming']['number'],
+            results['backdropNaming']['number'], results['deadCode']['number'],
+            results['initialization']['number'], ""]
+
+
+def error_row(name, error):
+
+    return [name] + [""] * (len(CSV_HEADER) - 2) + [error]
+
+
+def encode(value):
+
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+class Output(object):
+
+    """JSONL or CSV file of results, which is also the checkpoint of the run
+
+    Every result is flushed as soon as it is written, so an interrupted
+    run loses at most the line it was writing. That line is cut when the
+    file is opened again, and the projects already in the file are skipped.
+    """
+
+    def __init__(self, path, format):
+        self.path = path
+        self.format = format
+        self.done = set()
+        self.errors = set()
+
+        if os.path.exists(path):
+            self._truncate_partial_line()
+            self._read_done()
+            self.file = open(path, 'ab')
+        else:
+            self.file = open(path, 'wb')
+            if format == 'csv':
+                csv.writer(self.file).writerow(CSV_HEADER)
+        self.writer = csv.writer(self.file) if format == 'csv' else None
+
+    def _truncate_partial_line(self):
+
+        with open(self.path, 'rb+') as output:
+            content = output.read()
+            if content and not content.endswith("\n"):
+                output.truncate(content.rfind("\n") + 1)
+
+    def _read_done(self):
+
+        with open(self.path, 'rb') as output:
+            if self.format == 'csv':
+                rows = csv.reader(output)
+                next(rows, None)
+                lines = [(row[0], row[-1]) for row in rows if row]
+            else:
+                lines = [json.loads(line) for line in output if line.strip()]
+                lines = [(encode(line['name']), line.get('error')) for line in lines]
+
+        # A later line of the same project, e.g. a retried error, wins
+        for name, error in lines:
+            if error:
+                self.errors.add(name)
+                self.done.discard(name)
+            else:
+                self.done.add(name)
+                self.errors.discard(name)
+
+    def write(self, name, results=None, error=None):
+
+        if self.format == 'csv':
+            if error is None:
+                self.writer.writerow([encode(value) for value in result_row(name, results)])
+            else:
+                self.writer.writerow(error_row(name, error))
+        else:
+            line = {'name': name}
+            if error is None:
+                line['results'] = results
+            else:
+                line['error'] = error
+            self.file.write(json.dumps(line) + "\n")
+        self.file.flush()
+
+    def sync(self):
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+
+        self.sync()
+        self.file.close()
+
+
+class Command(BaseCommand):
+    help = ("Analyze a directory, glob or tar archive of sb3 files with every analyzer, "
+            "in parallel, and write the results to a JSONL or CSV file. An interrupted "
+            "run goes on from the projects already in the output file.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help="Directory, glob pattern or tar archive of sb3 files")
+        parser.add_argument('output', help="Results file, .csv for CSV, else JSONL")
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            help="Format of the output, by default from its extension")
+        parser.add_argument('--jobs', type=int, default=cpu_count(),
+                            help="Worker processes, by default one per core")
+        parser.add_argument('--timeout', type=int,
+                            default=getattr(settings, 'ANALYSIS_TIMEOUT', 60),
+                            help="Seconds before the analysis of a project is killed")
+        parser.add_argument('--retry-errors', action='store_true',
+                            help="Analyze again the projects which failed in a previous run")
+        parser.add_argument('--report', type=float, default=10,
+                            help="Seconds between throughput reports")
+
+    def report(self, processed, errors, start):
+
+        elapsed = time.time() - start
+        self.stdout.write("%d projects, %d errors, %.1f s, %.2f projects/s" % (
+            processed, errors, elapsed, processed / elapsed if elapsed else 0.0))
+
+    def handle(self, *args, **options):
+        source = options['source']
+        if not os.path.isdir(source) and not is_tar(source) and not glob.glob(source):
+            raise CommandError("No sb3 files in %s" % source)
+
+        format = options['format'] or ('csv' if options['output'].endswith('.csv') else 'jsonl')
+        jobs = options['jobs']
+
+        output = Output(options['output'], format)
+        skip = set(output.done)
+        if not options['retry_errors']:
+            skip |= output.errors
+        if skip:
+            self.stdout.write("Resuming, %d projects already in %s" % (len(skip),
+                                                                       options['output']))
+
+        executor = AnalysisExecutor(workers=jobs, timeout=options['timeout'],
+                                    memory_limit=getattr(settings, 'ANALYSIS_MEMORY_LIMIT', 1024),
+                                    profile=get_profiling())
+        # One thread per worker waits for its job, with some projects queued ahead.
+        # A project over the timeout has only its own worker killed.
+        threads = ThreadPoolExecutor(max_workers=jobs)
+        pending = {}
+
+        counters = {'processed': 0, 'errors': 0}
+        start = last_report = time.time()
+
+        def collect(return_when):
+            done, not_done = wait(pending.keys(), return_when=return_when)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    output.write(name, results=future.result())
+                except Exception as e:
+                    output.write(name, error=repr(e))
+                    counters['errors'] += 1
+                counters['processed'] += 1
+
+        try:
+            for name, sb3 in read_projects(source):
+                if name in skip:
+                    continue
+                if isinstance(sb3, Exception):
+                    output.write(name, error=repr(sb3))
+                    counters['processed'] += 1
+                    counters['errors'] += 1
+                    continue
+
+                pending[threads.submit(executor.analyze_file, sb3, name)] = name
+                if len(pending) >= 2 * jobs:
+                    collect(FIRST_COMPLETED)
+
+                if time.time() - last_report >= options['report']:
+                    output.sync()
+                    self.report(counters['processed'], counters['errors'], start)
+                    last_report = time.time()
+
+            if pending:
+                collect(ALL_COMPLETED)
+        finally:
+            threads.shutdown()
+            output.close()
+
+        self.report(counters['processed'], counters['errors'], start)
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import fetcher
+from app.stubServer import StubServer
+
+
+class BenchServer(StubServer):
+
+    """StubServer which answers every path, slow and sometimes failing"""
+
+    def __init__(self, latency, fail_every):
+        StubServer.__init__(self)
+        self.latency = latency
+        self.fail_every = fail_every
+
+    def answer(self, path):
+
+        with self.lock:
+            self.requests.append((path, time.time()))
+            number = len(self.requests)
+
+        if self.fail_every and number % self.fail_every == 0:
+            return 503, '', self.latency
+        return 200, '{"targets": [], "path": "%s"}' % path, self.latency
+
+
+class Command(BaseCommand):
+    help = "Time batch downloads of the Fetcher against a local stub server"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=200)
+        parser.add_argument('--concurrency', default='1,4,8,16',
+                            help="Comma separated list of concurrency limits")
+        parser.add_argument('--latency', type=float, default=0.05,
+                            help="Seconds the stub server takes per request")
+        parser.add_argument('--fail-every', type=int, default=10,
+                            help="Answer 503 to every n-th request, 0 never")
+
+    def handle(self, *args, **options):
+        server = BenchServer(options['latency'], options['fail_every'])
+        urls = [server.url(str(number)) for number in range(options['projects'])]
+
+        self.stdout.write("%12s %10s %12s %10s %8s" % ("concurrency", "time (s)", "requests",
+                                                      "conns", "errors"))
+        try:
+            for concurrency in [int(n) for n in options['concurrency'].split(',')]:
+                client = fetcher.Fetcher(concurrency=concurrency, backoff=0.01, rate=0)
+                with server.lock:
+                    server.requests = []
+                    server.connections = 0
+
+                start = time.time()
+                bodies = client.map(client.get, urls)
+                elapsed = time.time() - start
+
+                errors = len([body for body in bodies if isinstance(body, Exception)])
+                self.stdout.write("%12d %10.2f %12d %10d %8d" % (concurrency, elapsed,
+                                                               len(server.requests),
+                                                               server.connections, errors))
+                client.executor.shutdown()
+        finally:
+            server.stop()
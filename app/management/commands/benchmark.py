@@ -0,0 +1,245 @@
+import json
+import math
+import multiprocessing
+import platform
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import analyzer
+from app import attributeInitialization
+from app import backdropNaming
+from app import deadCode
+from app import duplicateScripts
+from app import scratchProject
+from app import spriteNaming
+from app import syntheticProject
+
+
+def bench_mastery(project):
+    mastery = analyzer.Mastery()
+    mastery.process(project)
+    mastery.analyze()
+
+
+def bench_duplicate_scripts(project):
+    duplicate = duplicateScripts.DuplicateScripts()
+    duplicate.analyze(project)
+
+
+def bench_near_duplicate_scripts(project):
+    duplicate = duplicateScripts.DuplicateScripts(near_duplicates=True)
+    duplicate.analyze(project)
+
+
+def bench_dead_code(project):
+    dead_code = deadCode.DeadCode()
+    dead_code.analyze(project)
+
+
+def bench_sprite_naming(project):
+    sprite_naming = spriteNaming.SpriteNaming()
+    sprite_naming.analyze(project)
+
+
+def bench_backdrop_naming(project):
+    backdrop_naming = backdropNaming.BackdropNaming()
+    backdrop_naming.analyze(project)
+
+
+def bench_attribute_initialization(project):
+    attinit = attributeInitialization.AttributeInitialization()
+    attinit.analyze(project)
+
+
+ANALYZERS = {
+    'mastery': bench_mastery,
+    'duplicateScripts': bench_duplicate_scripts,
+    'nearDuplicateScripts': bench_near_duplicate_scripts,
+    'deadCode': bench_dead_code,
+    'spriteNaming': bench_sprite_naming,
+    'backdropNaming': bench_backdrop_naming,
+    'attributeInitialization': bench_attribute_initialization,
+}
+
+# Run by default, the analyzers of every analysis
+DEFAULT_ANALYZERS = ['mastery', 'duplicateScripts', 'deadCode', 'spriteNaming',
+                     'backdropNaming', 'attributeInitialization']
+
+PERCENTILES = [50, 90, 99]
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of a sorted list"""
+
+    rank = int(math.ceil(percent / 100.0 * len(sorted_values)))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def _proc_status(field):
+    """Value in kB of a field of /proc/self/status, None out of Linux"""
+
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return None
+
+
+def _measure_memory(name, parameters, connection):
+
+    project = scratchProject.ScratchProject(syntheticProject.generate(**parameters))
+    try:
+        # Reset the peak of the resident memory to the current one
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except IOError:
+        connection.send(None)
+        return
+
+    baseline = _proc_status('VmRSS')
+    ANALYZERS[name](project)
+    peak = _proc_status('VmHWM')
+    connection.send(peak - baseline if peak is not None and baseline is not None else None)
+
+
+def peak_memory(name, parameters):
+    """kB of resident memory one run of an analyzer takes over the memory of the project
+
+    The project is generated with parameters and analyzed in a new process,
+    run before any timing so that no memory freed by previous runs and kept
+    by the allocator hides the new allocations. Returns None where the peak
+    can not be measured (Linux only).
+    """
+
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_measure_memory, args=(name, parameters, sender))
+    process.start()
+    kilobytes = receiver.recv() if receiver.poll(3600) else None
+    process.join()
+    return kilobytes
+
+
+class Command(BaseCommand):
+    help = ("Time the analyzers over synthetic projects of growing size, with latency "
+            "percentiles and peak memory, and optionally compare with a previous run")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyzer', default=",".join(DEFAULT_ANALYZERS),
+                            help="Comma separated list of: %s" % ", ".join(sorted(ANALYZERS)))
+        parser.add_argument('--blocks', default='10000,25000,50000,100000',
+                            help="Comma separated list of project sizes")
+        parser.add_argument('--targets', type=int, default=10)
+        parser.add_argument('--script-length', type=int, default=20,
+                            help="Blocks per script, e.g. 50000 for a single huge script")
+        parser.add_argument('--depth', type=int, default=0,
+                            help="Nested loops at the start of every script")
+        parser.add_argument('--broadcasts', type=int, default=0,
+                            help="Different broadcast messages of the project")
+        parser.add_argument('--duplicates', type=int, default=0,
+                            help="Scripts of every target that appear twice")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--no-memory', action='store_true',
+                            help="Skip the measure of the peak memory")
+        parser.add_argument('--output',
+                            help="Write the results as JSON to this file")
+        parser.add_argument('--baseline',
+                            help="JSON results of a previous run to compare with")
+        parser.add_argument('--max-regression', type=float, default=0.2,
+                            help="Fail when a median is this fraction slower than the baseline")
+
+    def run(self, bench, project, options):
+
+        bench(project)  # Warm up
+        times = []
+        for _ in range(options['repeat']):
+            start = time.time()
+            bench(project)
+            times.append(time.time() - start)
+        times.sort()
+
+        result = {'min_ms': times[0] * 1000, 'max_ms': times[-1] * 1000,
+                  'us_per_block': times[0] * 1e6 / max(len(project.total_blocks), 1)}
+        for percent in PERCENTILES:
+            result['p%d_ms' % percent] = percentile(times, percent) * 1000
+        return result
+
+    def compare(self, results, path_baseline, max_regression):
+        """Return the descriptions of the medians slower than in the baseline"""
+
+        with open(path_baseline) as baseline:
+            previous = dict(((result['analyzer'], result['blocks']), result)
+                            for result in json.load(baseline)['results'])
+
+        regressions = []
+        for result in results:
+            old = previous.get((result['analyzer'], result['blocks']))
+            if old is None or not old['p50_ms']:
+                continue
+            change = result['p50_ms'] / old['p50_ms'] - 1
+            if change > max_regression:
+                regressions.append("%s, %d blocks: %.2f ms -> %.2f ms (+%d%%)" % (
+                    result['analyzer'], result['blocks'], old['p50_ms'], result['p50_ms'],
+                    change * 100))
+        return regressions
+
+    def handle(self, *args, **options):
+        names = options['analyzer'].split(',')
+        for name in names:
+            if name not in ANALYZERS:
+                raise CommandError("Unknown analyzer %s" % name)
+        sizes = [int(size) for size in options['blocks'].split(',')]
+
+        self.stdout.write("%-24s %8s %10s %10s %10s %10s %12s" % (
+            "analyzer", "blocks", "p50 (ms)", "p90 (ms)", "p99 (ms)", "us/block", "peak (kB)"))
+
+        parameters = [dict(targets=options['targets'], blocks=size,
+                           script_length=options['script_length'], depth=options['depth'],
+                           seed=options['seed'], broadcasts=options['broadcasts'],
+                           duplicates=options['duplicates']) for size in sizes]
+
+        memory = {}
+        if not options['no_memory']:
+            for index, project_parameters in enumerate(parameters):
+                for name in names:
+                    memory[(index, name)] = peak_memory(name, project_parameters)
+
+        results = []
+        for index, project_parameters in enumerate(parameters):
+            project = scratchProject.ScratchProject(
+                syntheticProject.generate(**project_parameters))
+            total_blocks = len(project.total_blocks)
+
+            for name in names:
+                result = self.run(ANALYZERS[name], project, options)
+                result.update({'analyzer': name, 'blocks': total_blocks,
+                               'peak_memory_kb': memory.get((index, name))})
+                results.append(result)
+
+                peak = result['peak_memory_kb']
+                self.stdout.write("%-24s %8d %10.2f %10.2f %10.2f %10.3f %12s" % (
+                    name, total_blocks, result['p50_ms'], result['p90_ms'], result['p99_ms'],
+                    result['us_per_block'], "-" if peak is None else peak))
+
+        if options['output']:
+            parameters = dict((key, options[key]) for key in
+                              ['blocks', 'targets', 'script_length', 'depth', 'broadcasts',
+                               'duplicates', 'seed', 'repeat'])
+            with open(options['output'], 'w') as output:
+                json.dump({'date': datetime.now().isoformat(),
+                           'python': platform.python_version(),
+                           'machine': platform.machine(),
+                           'parameters': parameters,
+                           'results': results}, output, indent=2, sort_keys=True)
+
+        if options['baseline']:
+            regressions = self.compare(results, options['baseline'], options['max_regression'])
+            if regressions:
+                raise CommandError("Slower than the baseline:\n" + "\n".join(regressions))
+            self.stdout.write("No regression over %d%% against %s" % (
+                options['max_regression'] * 100, options['baseline']))
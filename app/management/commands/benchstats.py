@@ -0,0 +1,121 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count
+
+from app.models import File
+
+ORGANIZATION = "benchstats_org"
+CODER = "benchstats_coder"
+# Every synthetic row is named so, and only those rows are deleted
+PREFIX = "benchstats_"
+BATCH = 10000
+
+
+class Command(BaseCommand):
+    help = ("Time the queries of the stats pages over synthetic File rows. "
+            "Run it on a local database before and after migrating "
+            "app 0055_file_indexes to compare the latency without and with indexes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--days', type=int, default=3 * 365,
+                            help="Days the synthetic projects are spread over")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--keep', action='store_true',
+                            help="Keep the synthetic rows for the next run")
+
+    def load(self, rows, days):
+        """Insert rows File rows, one in two hundred for each benchmark user"""
+
+        rand = random.Random(0)
+        start = date.today() - timedelta(days=days)
+        others = ["user%d" % number for number in range(1000)]
+
+        for first in range(0, rows, BATCH):
+            files = []
+            for number in range(first, min(first + BATCH, rows)):
+                if number % 200 == 0:
+                    organization, coder = ORGANIZATION, 'drscratch'
+                elif number % 200 == 1:
+                    organization, coder = 'drscratch', CODER
+                else:
+                    organization, coder = 'drscratch', rand.choice(others)
+                files.append(File(filename=PREFIX + "project%d.sb3" % number,
+                                  organization=organization, coder=coder,
+                                  method=rand.choice(["url", "project", "csv"]),
+                                  time=start + timedelta(days=rand.randint(0, days)),
+                                  score=rand.randint(0, 21),
+                                  abstraction=rand.randint(0, 3),
+                                  parallelization=rand.randint(0, 3),
+                                  logic=rand.randint(0, 3),
+                                  synchronization=rand.randint(0, 3),
+                                  flowControl=rand.randint(0, 3),
+                                  userInteractivity=rand.randint(0, 3),
+                                  dataRepresentation=rand.randint(0, 3),
+                                  spriteNaming=rand.randint(0, 5),
+                                  initialization=rand.randint(0, 5),
+                                  deadCode=rand.randint(0, 5),
+                                  duplicateScript=rand.randint(0, 5)))
+            File.objects.bulk_create(files)
+
+    def best(self, query, repeat):
+
+        best = None
+        for _ in range(repeat):
+            start = time.time()
+            query()
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best
+
+    def handle(self, *args, **options):
+        days = options['days']
+        existing = File.objects.filter(filename__startswith=PREFIX).exists()
+        if not existing:
+            self.stdout.write("Loading %d rows..." % options['rows'])
+            self.load(options['rows'], days)
+
+        start = date.today() - timedelta(days=days)
+        today = date.today()
+
+        def daily(**user):
+            return list(File.objects.filter(time__gte=start, time__lte=today, **user)
+                        .values('time').annotate(avg=Avg('score')).order_by())
+
+        def skills(**user):
+            return File.objects.filter(**user).aggregate(Count('id'), Avg('parallelization'),
+                                                         Avg('abstraction'), Avg('logic'))
+
+        def last_day():
+            return list(File.objects.filter(time__gte=today)
+                        .values('time').annotate(avg=Avg('score')).order_by())
+
+        def one_day():
+            return File.objects.filter(time=today - timedelta(days=days / 2)) \
+                               .aggregate(Avg('score'))
+
+        def by_method():
+            return File.objects.filter(method='csv').count()
+
+        queries = [
+            ("stats: daily scores of an organization", lambda: daily(organization=ORGANIZATION)),
+            ("stats: daily scores of a coder", lambda: daily(coder=CODER)),
+            ("stats: skills of an organization", lambda: skills(organization=ORGANIZATION)),
+            ("stats: skills of a coder", lambda: skills(coder=CODER)),
+            ("statistics: projects of one day", one_day),
+            ("statistics: rollup since the last day", last_day),
+            ("projects by method", by_method),
+        ]
+
+        self.stdout.write("%-42s %12s" % ("query", "best (ms)"))
+        try:
+            for name, query in queries:
+                self.stdout.write("%-42s %12.2f" % (name, self.best(query, options['repeat'])
+                                                    * 1000))
+        finally:
+            if not options['keep']:
+                File.objects.filter(filename__startswith=PREFIX).delete()
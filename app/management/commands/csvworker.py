@@ -0,0 +1,41 @@
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+
+from app import csvJob
+from app.models import CSVJob
+
+
+class Command(BaseCommand):
+    help = "Run the pending analyses of the uploaded CSVs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sleep', type=float, default=5,
+                            help="Seconds between polls when there are no jobs")
+        parser.add_argument('--once', action='store_true',
+                            help="Run the pending jobs and exit")
+
+    def handle(self, *args, **options):
+        # Only one worker runs per server, a running job was interrupted
+        requeued = csvJob.requeue_interrupted_jobs()
+        if requeued:
+            self.stdout.write("Resuming %d interrupted jobs" % requeued)
+
+        while True:
+            job = csvJob.claim_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+
+            self.stdout.write("Job %d: %s" % (job.pk, job.filename))
+            try:
+                csvJob.run_job(job)
+            except Exception:
+                traceback.print_exc()
+                CSVJob.objects.filter(pk=job.pk).update(status=CSVJob.FAILED)
+                continue
+            self.stdout.write("Job %d: %d projects, %d errors" % (job.pk, job.done,
+                                                                   job.errors))
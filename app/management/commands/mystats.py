@@ -1,82 +1,91 @@
 from django.core.management.base import BaseCommand
-from app.models import Stats,File
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Max, Sum, When
+from app.models import Stats, File, DailyStats
 from app.views import date_range
-from datetime import datetime,timedelta,date
-from django.db.models import Avg
+from datetime import datetime, date
+
+SKILLS = ["parallelism", "abstraction", "logic", "synchronization", "flowControl",
+          "userInteractivity", "dataRepresentation"]
+SMELLS = ["deadCode", "duplicateScript", "spriteNaming", "initialization"]
+
+# Column of File of every field of DailyStats
+FILE_FIELDS = {"score": "score", "parallelism": "parallelization"}
+
+
+def level(condition):
+    """Number of projects of a CT level, counted in SQL"""
+
+    return Sum(Case(When(then=1, **condition), default=0, output_field=IntegerField()))
+
 
 class Command(BaseCommand):
     def handle(self,*args,**options):
-        """ Initializing variables """
-        daily_rate = []
-        daily_projects=[]
-        point_list=[]
+        """ Roll up the days not processed yet """
+
+        # The last day processed may have changed since the last run
+        last_day = DailyStats.objects.aggregate(last=Max("date"))["last"]
+        files = File.objects.all()
+        if last_day is not None:
+            files = files.filter(time__gte=last_day)
+
+        # Annotations can not be named as the columns of File
+        sums = dict(("sum_" + field, Sum(FILE_FIELDS.get(field, field)))
+                    for field in ["score"] + SKILLS + SMELLS)
+        days = files.values("time").order_by().annotate(projects=Count("id"),
+                                                       master=level({"score__gte": 15}),
+                                                       development=level({"score__gt": 7,
+                                                                          "score__lt": 15}),
+                                                       basic=level({"score__lte": 7}),
+                                                       **sums)
+
+        with transaction.atomic():
+            for day in days:
+                values = dict((field.replace("sum_", "", 1), value)
+                              for field, value in day.items())
+                DailyStats.objects.update_or_create(date=values.pop("time"), defaults=values)
+
+        """ Stats of the whole period from the rollup """
+
         start = date(2015,8,1)
         end = datetime.today()
-        y = end.year
-        m = end.month
-        d = end.day
-        end = date(y,m,d)
-        dateList = date_range(start, end)
-
-        """ Recolect data for daily_rate & daily_projects """
-
-        for n in dateList:
-            #mydates.append(n.strftime("%d/%m")) #used for x axis in stats
-            files = File.objects.filter(time=n)
-            daily_rate.append(files.aggregate(Avg("score"))["score__avg"])
-            for k in daily_rate:
-                if k == None:
-                    daily_rate[daily_rate.index(k)]= 0
-
-            for i in files:
-                #mastery_list.append(i.score)
-                point_list.append(i.score)
-            daily_projects.append(len(files))
+        end = date(end.year, end.month, end.day)
+
+        rollup = dict((day.date, day) for day in DailyStats.objects.filter(date__gte=start,
+                                                                           date__lte=end))
+        daily_rate = []
+        daily_projects = []
+        for n in date_range(start, end):
+            day = rollup.get(n)
+            if day is None or not day.projects:
+                daily_rate.append(0)
+                daily_projects.append(0)
+            else:
+                daily_rate.append(float(day.score) / day.projects)
+                daily_projects.append(day.projects)
+
+        totals = DailyStats.objects.aggregate(projects=Sum("projects"),
+                                              **dict((field, Sum(field)) for field in
+                                                     SKILLS + SMELLS))
+        totalProjects = totals["projects"] or 0
+        if not totalProjects:
+            self.stdout.write("No projects analyzed yet")
+            return
+
         """ Stats by CT level """
 
-        master = 0
-        development = 0
-        basic = 0
+        levels = DailyStats.objects.filter(date__gte=start, date__lte=end) \
+                                   .aggregate(basic=Sum("basic"),
+                                              development=Sum("development"),
+                                              master=Sum("master"))
+        basic = (levels["basic"] or 0)*100/totalProjects
+        development = (levels["development"] or 0)*100/totalProjects
+        master = (levels["master"] or 0)*100/totalProjects
 
-        totalProjects = File.objects.count()
-        for i in point_list:
-            if i >= 15:
-                master = master + 1
-            elif i > 7:
-                development = development + 1
-            else:
-                basic = basic + 1
-        basic = basic*100/totalProjects
-        development=development*100/totalProjects
-        master=master*100/totalProjects
-        """This section calculates the average score by programming skill """
-
-        parallelism = File.objects.all().aggregate(Avg("parallelization"))
-        parallelism = int(parallelism["parallelization__avg"])
-        abstraction = File.objects.all().aggregate(Avg("abstraction"))
-        abstraction = int(abstraction["abstraction__avg"])
-        logic = File.objects.all().aggregate(Avg("logic"))
-        logic = int(logic["logic__avg"])
-        synchronization = File.objects.all().aggregate(Avg("synchronization"))
-        synchronization = int(synchronization["synchronization__avg"])
-        flowControl = File.objects.all().aggregate(Avg("flowControl"))
-        flowControl = int(flowControl["flowControl__avg"])
-        userInteractivity = File.objects.all().aggregate(Avg("userInteractivity"))
-        userInteractivity = int(userInteractivity["userInteractivity__avg"])
-        dataRepresentation = File.objects.all().aggregate(Avg("dataRepresentation"))
-        dataRepresentation = int(dataRepresentation["dataRepresentation__avg"])
-
-        """This section calculates the average score by code smell"""
-        deadCode = File.objects.all().aggregate(Avg("deadCode"))
-        deadCode = int(deadCode["deadCode__avg"])
-        duplicateScript = File.objects.all().aggregate(Avg("duplicateScript"))
-        duplicateScript = int(duplicateScript["duplicateScript__avg"])
-        spriteNaming = File.objects.all().aggregate(Avg("spriteNaming"))
-        spriteNaming = int(spriteNaming["spriteNaming__avg"])
-        initialization = File.objects.all().aggregate(Avg("initialization"))
-        initialization = int(initialization["initialization__avg"])
-
-        """This section calculates the average score by code smell"""
+        """ Average score by programming skill and by code smell """
+
+        averages = dict((field, int(float(totals[field]) / totalProjects))
+                        for field in SKILLS + SMELLS)
 
         self.stdout.write("Doing all the stats!")
 
@@ -85,17 +94,6 @@ class Command(BaseCommand):
                             development = development,
                             master = master,
                             daily_projects=daily_projects,
-                            parallelism=parallelism,
-                            abstraction = abstraction,
-                            logic = logic,
-                            synchronization = synchronization,
-                            flowControl = flowControl,
-                            userInteractivity = userInteractivity,
-                            dataRepresentation = dataRepresentation,
-                            deadCode = deadCode,
-                            duplicateScript = duplicateScript,
-                            spriteNaming = spriteNaming,
-                            initialization = initialization
-                            )
+                            **averages)
 
         stats_today.save()
@@ -0,0 +1,62 @@
+import pstats
+import StringIO
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app import profiling
+
+
+class Command(BaseCommand):
+    help = ("List the profiles of the slow analyses, or summarize the functions where "
+            "they spend the time, all of them together or one of them")
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?',
+                            help="Name or sha256 prefix of a profile to summarize alone")
+        parser.add_argument('--summary', action='store_true',
+                            help="Summarize all the profiles together")
+        parser.add_argument('--sort', default='cumulative',
+                            help="pstats sort key, e.g. cumulative, tottime or calls")
+        parser.add_argument('--top', type=int, default=25,
+                            help="Functions shown in a summary")
+        parser.add_argument('--dir', default=getattr(settings, 'ANALYSIS_PROFILE_DIR',
+                                                     profiling.PROFILE_DIR))
+
+    def summarize(self, paths, sort, top):
+
+        output = StringIO.StringIO()
+        stats = pstats.Stats(*paths, stream=output)
+        stats.strip_dirs().sort_stats(sort).print_stats(top)
+        self.stdout.write(output.getvalue())
+
+    def handle(self, *args, **options):
+        found = profiling.profiles(options['dir'])
+
+        if options['name']:
+            found = [info for info in found
+                     if info['name'] == options['name']
+                     or info['sha256'].startswith(options['name'])]
+            if not found:
+                raise CommandError("No profile %s in %s" % (options['name'], options['dir']))
+
+        if not found:
+            self.stdout.write("No profiles in %s" % options['dir'])
+            return
+
+        self.stdout.write("%-40s %9s %10s %-16s %s" % ("name", "seconds", "size (kB)",
+                                                      "slowest stage", "filename"))
+        for info in found:
+            timings = info.get('timings') or {'-': 0}
+            slowest = max(timings, key=timings.get)
+            self.stdout.write("%-40s %9.2f %10d %-16s %s%s" % (
+                info['name'], info['seconds'], info['size'] / 1024,
+                slowest.replace('analyzer.', ''), info.get('filename') or '',
+                " (timed out)" if info.get('timed_out') else ""))
+
+        if options['name'] and len(found) == 1 and found[0].get('stack'):
+            self.stdout.write("\nTimed out in:\n" + "".join(found[0]['stack']))
+
+        if options['name'] or options['summary']:
+            self.stdout.write("")
+            self.summarize([info['path'] for info in found], options['sort'], options['top'])
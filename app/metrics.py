@@ -0,0 +1,130 @@
+"""Timings of the stages of the analyses
+
+Every stage (writing the upload, opening the zip, downloading from the
+Scratch servers, parsing, each analyzer, the DB saves, rendering...) is
+timed with timer() or recorded with record(). The durations are
+aggregated per stage in this process, with its last SAMPLES durations
+for the quantiles, and exported in the text format of Prometheus by the
+/metrics view. Each worker process of the web server keeps its own
+counters, as the client libraries of Prometheus do without a
+multiprocess setup.
+
+A request wrapped in trace() also writes one structured log line, JSON
+in the "app.metrics" logger, with the duration of each of its stages.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Durations kept per stage for the quantiles
+SAMPLES = 1024
+QUANTILES = [0.5, 0.95, 0.99]
+
+
+class Stage(object):
+
+    """Count, sum and last durations of a stage"""
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=SAMPLES)
+
+    def add(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        self.samples.append(seconds)
+
+    def quantiles(self):
+
+        samples = sorted(self.samples)
+        if not samples:
+            return dict((quantile, 0.0) for quantile in QUANTILES)
+        return dict((quantile, samples[min(int(quantile * len(samples)), len(samples) - 1)])
+                    for quantile in QUANTILES)
+
+
+_stages = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def record(stage, seconds):
+    """Add a duration of a stage, and to the trace of the current request"""
+
+    with _lock:
+        if stage not in _stages:
+            _stages[stage] = Stage()
+        _stages[stage].add(seconds)
+
+    stages = getattr(_local, 'stages', None)
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timer(stage):
+    """Time the block inside as a stage"""
+
+    start = time.time()
+    try:
+        yield
+    finally:
+        record(stage, time.time() - start)
+
+
+@contextmanager
+def trace(name, **fields):
+    """Time a request as the stage name and log the durations of its stages
+
+    Inside other trace it is only a timer, the outer one logs.
+    """
+
+    if getattr(_local, 'stages', None) is not None:
+        with timer(name):
+            yield
+        return
+
+    _local.stages = OrderedDict()
+    start = time.time()
+    try:
+        yield
+    finally:
+        total = time.time() - start
+        stages, _local.stages = _local.stages, None
+        record(name, total)
+
+        line = OrderedDict([('event', name), ('seconds', round(total, 6))])
+        line.update(fields)
+        line['stages'] = OrderedDict((stage, round(seconds, 6))
+                                     for stage, seconds in stages.items())
+        logger.info(json.dumps(line))
+
+
+def snapshot():
+    """{stage: (count, sum, {quantile: seconds})} of every stage so far"""
+
+    with _lock:
+        return dict((name, (stage.count, stage.sum, stage.quantiles()))
+                    for name, stage in _stages.items())
+
+
+def prometheus():
+    """Text exposition of the stages as a Prometheus summary"""
+
+    lines = ["# HELP drscratch_stage_seconds Duration of the stages of the analyses",
+             "# TYPE drscratch_stage_seconds summary"]
+    for name, (count, total, quantiles) in sorted(snapshot().items()):
+        label = name.replace('\\', '\\\\').replace('"', '\\"')
+        for quantile in QUANTILES:
+            lines.append('drscratch_stage_seconds{stage="%s",quantile="%s"} %.6f'
+                         % (label, quantile, quantiles[quantile]))
+        lines.append('drscratch_stage_seconds_sum{stage="%s"} %.6f' % (label, total))
+        lines.append('drscratch_stage_seconds_count{stage="%s"} %d' % (label, count))
+    return "\n".join(lines) + "\n"
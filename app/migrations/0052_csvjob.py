@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+import datetime
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0051_merge_20180924_0924'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CSVJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('filename', models.CharField(max_length=100)),
+                ('upload', models.CharField(max_length=200)),
+                ('organization', models.CharField(default=b'drscratch', max_length=100)),
+                ('coder', models.CharField(default=b'drscratch', max_length=100)),
+                ('language', models.CharField(default=b'en', max_length=10)),
+                ('status', models.CharField(default=b'pending', max_length=10, choices=[(b'pending', b'Pending'), (b'running', b'Running'), (b'finished', b'Finished'), (b'failed', b'Failed')])),
+                ('total', models.IntegerField(default=0)),
+                ('done', models.IntegerField(default=0)),
+                ('errors', models.IntegerField(default=0)),
+                ('date', models.DateTimeField(default=datetime.datetime.now)),
+                ('finished', models.DateTimeField(null=True, blank=True)),
+                ('csv', models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, blank=True, to='app.CSVs', null=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
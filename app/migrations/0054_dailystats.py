@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0053_analysiscache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('date', models.DateField(unique=True)),
+                ('projects', models.IntegerField(default=0)),
+                ('score', models.IntegerField(default=0)),
+                ('basic', models.IntegerField(default=0)),
+                ('development', models.IntegerField(default=0)),
+                ('master', models.IntegerField(default=0)),
+                ('parallelism', models.IntegerField(default=0)),
+                ('abstraction', models.IntegerField(default=0)),
+                ('logic', models.IntegerField(default=0)),
+                ('synchronization', models.IntegerField(default=0)),
+                ('flowControl', models.IntegerField(default=0)),
+                ('userInteractivity', models.IntegerField(default=0)),
+                ('dataRepresentation', models.IntegerField(default=0)),
+                ('deadCode', models.IntegerField(default=0)),
+                ('duplicateScript', models.IntegerField(default=0)),
+                ('spriteNaming', models.IntegerField(default=0)),
+                ('initialization', models.IntegerField(default=0)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
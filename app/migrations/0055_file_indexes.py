@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0054_dailystats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='method',
+            field=models.CharField(max_length=100, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='time',
+            field=models.DateField(db_index=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='file',
+            index_together=set([('organization', 'time'), ('coder', 'time')]),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0055_file_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='analysiscache',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='analysiscache',
+            name='last_used',
+            field=models.DateTimeField(default=django.utils.timezone.now, db_index=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-18 15:14
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0056_analysiscache_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvjob',
+            name='output_size',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
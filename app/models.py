@@ -1,6 +1,7 @@
 import datetime
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 # Models of drScratch
 
@@ -8,8 +9,8 @@ class File(models.Model):
     filename = models.CharField(max_length=100)
     organization = models.CharField(max_length=100, default='drscratch')
     coder = models.CharField(max_length=100, default='drscratch')
-    method = models.CharField(max_length=100)
-    time = models.DateField(auto_now=False)
+    method = models.CharField(max_length=100, db_index=True)
+    time = models.DateField(auto_now=False, db_index=True)
     language = models.TextField(default="en")
     score = models.IntegerField()
     abstraction = models.IntegerField()
@@ -24,6 +25,10 @@ class File(models.Model):
     deadCode = models.IntegerField()
     duplicateScript = models.IntegerField()
 
+    class Meta:
+        # Stats pages filter the projects of a user by day
+        index_together = [('organization', 'time'), ('coder', 'time')]
+
 class CSVs(models.Model):
     filename = models.CharField(max_length=100)
     directory = models.CharField(max_length=100)
@@ -31,6 +36,42 @@ class CSVs(models.Model):
     coder = models.CharField(max_length=100, default='drscratch')
     date = models.DateTimeField(default=datetime.datetime.now)
 
+class CSVJob(models.Model):
+    """Analysis of an uploaded CSV, run in background by the csvworker command"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+    STATUS_CHOICES = ((PENDING, 'Pending'), (RUNNING, 'Running'),
+                      (FINISHED, 'Finished'), (FAILED, 'Failed'))
+
+    filename = models.CharField(max_length=100)
+    upload = models.CharField(max_length=200)
+    organization = models.CharField(max_length=100, default='drscratch')
+    coder = models.CharField(max_length=100, default='drscratch')
+    language = models.CharField(max_length=10, default='en')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    total = models.IntegerField(default=0)
+    done = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0)
+    output_size = models.BigIntegerField(default=0)
+    date = models.DateTimeField(default=datetime.datetime.now)
+    finished = models.DateTimeField(null=True, blank=True)
+    csv = models.ForeignKey(CSVs, null=True, blank=True, on_delete=models.SET_NULL)
+
+class AnalysisCache(models.Model):
+    """Results of the analyzers by sha256 of project.json and analyzer version"""
+    key = models.CharField(max_length=100, unique=True)
+    results = models.TextField()
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+    last_used = models.DateTimeField(default=timezone.now, db_index=True)
+    hits = models.IntegerField(default=0)
+
+class AnalysisCacheStats(models.Model):
+    hits = models.IntegerField(default=0)
+    misses = models.IntegerField(default=0)
+    evictions = models.IntegerField(default=0)
+
 class Coder(User):
     birthmonth = models.CharField(max_length=100)
     birthyear = models.CharField(max_length=100)
@@ -83,6 +124,30 @@ class Stats(models.Model):
     spriteNaming = models.IntegerField(default=int(0))
     initialization = models.IntegerField(default=int(0))
 
+class DailyStats(models.Model):
+    """Rollup of the File rows of one day, kept by the mystats command
+
+    score and the skills are sums over the projects of the day, basic,
+    development and master are the projects of every CT level.
+    """
+    date = models.DateField(unique=True)
+    projects = models.IntegerField(default=0)
+    score = models.IntegerField(default=0)
+    basic = models.IntegerField(default=0)
+    development = models.IntegerField(default=0)
+    master = models.IntegerField(default=0)
+    parallelism = models.IntegerField(default=0)
+    abstraction = models.IntegerField(default=0)
+    logic = models.IntegerField(default=0)
+    synchronization = models.IntegerField(default=0)
+    flowControl = models.IntegerField(default=0)
+    userInteractivity = models.IntegerField(default=0)
+    dataRepresentation = models.IntegerField(default=0)
+    deadCode = models.IntegerField(default=0)
+    duplicateScript = models.IntegerField(default=0)
+    spriteNaming = models.IntegerField(default=0)
+    initialization = models.IntegerField(default=0)
+
 ######################### UNDERDEVELOPMENT ####################################
 
 
@@ -0,0 +1,204 @@
+"""Profiles of the slow analyses
+
+When ANALYSIS_PROFILE_THRESHOLD is set, the worker processes run the
+analyzers under cProfile. Every analysis slower than the threshold
+leaves in profiles/ a pstats dump, <name>.prof, and a <name>.json with
+the sha256 and size of its project.json, its timings and its seconds,
+so the hot path can be found later even when the project itself is not
+kept. An analysis killed for its timeout leaves its profile up to that
+moment, with the stack where it was interrupted. The oldest profiles are
+removed when all of them take more than ANALYSIS_PROFILE_MAX_SIZE
+megabytes, and a project already profiled is not profiled again. The
+profiles command lists and summarizes them.
+"""
+
+import cProfile
+import glob
+import hashlib
+import json
+import logging
+import os
+import random
+import signal
+import tempfile
+import time
+import traceback
+from datetime import datetime
+
+from app import analysis
+from app import scratchProject
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "profiles")
+
+
+class Profiling(object):
+
+    """Settings of the profiles, passed to the worker processes with every job"""
+
+    def __init__(self, threshold, directory=PROFILE_DIR, max_size=100, rate=1.0):
+        self.threshold = threshold
+        self.directory = directory
+        self.max_size = max_size
+        self.rate = rate
+
+
+def analyze_json(json_string, filename, timings, profiling):
+    """Same as analysis.analyze_json, saving a profile when it is slower than the threshold
+
+    Only a fraction profiling.rate of the analyses run under the profiler.
+    """
+
+    return _analyze(analysis.analyze_json, json_string, filename, timings, profiling,
+                    lambda: (hashlib.sha256(json_string).hexdigest(), len(json_string)))
+
+
+def analyze_file(sb3, filename, timings, profiling):
+    """Same as analyze_json for a sb3 file, see analysis.analyze_file"""
+
+    return _analyze(analysis.analyze_file, sb3, filename, timings, profiling,
+                    lambda: scratchProject.json_digest(sb3))
+
+
+def _analyze(analyze, project, filename, timings, profiling, digest):
+    """Run analyze(project, filename, timings) under the profiler
+
+    digest returns the sha256 and the size of the project.json, only
+    computed for the analyses slower than the threshold. The executor
+    sends SIGTERM to a job over its timeout, which then saves its profile,
+    or logs its stack when it is not profiled, before exiting.
+    """
+
+    start = time.time()
+
+    if random.random() >= profiling.rate:
+        def timed_out(signum, frame):
+            logger.error('Analysis of %s timed out after %.1f seconds in:\n%s', filename,
+                         time.time() - start, "".join(traceback.format_stack(frame)))
+            os._exit(1)
+
+        _on_terminate(timed_out)
+        return analyze(project, filename, timings)
+
+    profiler = cProfile.Profile()
+
+    def timed_out(signum, frame):
+        profiler.disable()
+        try:
+            save(profiler, digest(), filename, time.time() - start, timings, profiling,
+                 stack=traceback.format_stack(frame))
+        except (IOError, OSError):
+            pass
+        os._exit(1)
+
+    _on_terminate(timed_out)
+    results = profiler.runcall(analyze, project, filename, timings)
+    seconds = time.time() - start
+
+    if seconds >= profiling.threshold:
+        try:
+            save(profiler, digest(), filename, seconds, timings, profiling)
+        except (IOError, OSError):
+            pass
+    return results
+
+
+def _on_terminate(handler):
+    """Call handler on SIGTERM, only possible in the main thread of the worker"""
+
+    try:
+        signal.signal(signal.SIGTERM, handler)
+    except ValueError:
+        pass
+
+
+def save(profiler, digest, filename, seconds, timings, profiling, stack=None):
+    """Write the profile of an analysis and remove the oldest ones over the limit
+
+    digest is the sha256 and the size of the project.json, stack the
+    lines of the stack of an analysis killed for its timeout.
+    """
+
+    sha256, size = digest
+    if not os.path.isdir(profiling.directory):
+        try:
+            os.makedirs(profiling.directory)
+        except OSError:
+            # Created at the same time by other worker
+            pass
+    if glob.glob(os.path.join(profiling.directory, "*_%s.json" % sha256[:16])):
+        return
+
+    name = "%s_%s" % (datetime.now().strftime("%Y%m%d_%H%M%S_%f"), sha256[:16])
+    info = {'sha256': sha256,
+            'size': size,
+            'filename': filename,
+            'seconds': round(seconds, 6),
+            'timings': dict((stage, round(stage_seconds, 6))
+                            for stage, stage_seconds in timings.items()),
+            'analyzer_version': analysis.ANALYZER_VERSION,
+            'date': datetime.now().isoformat()}
+    if stack is not None:
+        info['timed_out'] = True
+        info['stack'] = stack
+
+    # Written with unique names and renamed, readers never see half a profile
+    fd, path_tmp = tempfile.mkstemp(dir=profiling.directory, suffix=".tmp")
+    os.close(fd)
+    profiler.dump_stats(path_tmp)
+    os.rename(path_tmp, os.path.join(profiling.directory, name + ".prof"))
+
+    fd, path_tmp = tempfile.mkstemp(dir=profiling.directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as output:
+        json.dump(info, output, indent=2, sort_keys=True)
+    os.rename(path_tmp, os.path.join(profiling.directory, name + ".json"))
+
+    _evict(profiling)
+
+
+def _evict(profiling):
+    """Remove the oldest profiles while all of them take more than profiling.max_size MB
+
+    The newest one is always kept.
+    """
+
+    profiles = []
+    for path in sorted(glob.glob(os.path.join(profiling.directory, "*.json"))):
+        paths = [path, path[:-len(".json")] + ".prof"]
+        size = 0
+        for path_profile in paths:
+            try:
+                size += os.path.getsize(path_profile)
+            except OSError:
+                pass
+        profiles.append((paths, size))
+
+    total = sum(size for paths, size in profiles)
+    for paths, size in profiles[:-1]:
+        if total <= profiling.max_size * 1024 * 1024:
+            break
+        for path_profile in paths:
+            try:
+                os.remove(path_profile)
+            except OSError:
+                pass
+        total -= size
+
+
+def profiles(directory=PROFILE_DIR):
+    """Return the info of every profile, the newest first, with the path of its dump"""
+
+    found = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json")), reverse=True):
+        try:
+            with open(path) as info_file:
+                info = json.load(info_file)
+        except (IOError, ValueError):
+            continue
+        info['name'] = os.path.basename(path)[:-len(".json")]
+        info['path'] = path[:-len(".json")] + ".prof"
+        if os.path.exists(info['path']):
+            found.append(info)
+    return found
@@ -1,34 +1,202 @@
 # -*- coding: utf-8 -*-
 # Este generador de diplomas lee una lista con nombre, dni y calificación para
 # rellenarlos en una plantilla LaTeX con un marcador para cada campo.
-# Opcionalemente compila los ficheros LaTeX generados y los une en uno solo.
-# Si la plantilla LaTeX da error de compilación, pulsar intro varias veces.
+# Cada diploma se compila en su propio directorio temporal, sin cambiar el
+# directorio de trabajo del proceso, así que varios hilos pueden generar
+# diplomas a la vez. Los diplomas generados se guardan en certificates/ y
+# se sirven desde allí las siguientes veces.
 
+import errno
+import glob
+import hashlib
 import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+
+from app.exception import DrScratchException
+
+CERTIFICATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "certificate")
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(CERTIFICATE_DIR)), "certificates")
+
+MARK_NAME = "%pointname"
+MARK_CALIFICATION = "%pointcalification"
+
+
+class CertificateTimeout(DrScratchException):
+    pass
+
+
+class CertificateError(DrScratchException):
+    pass
+
+
+def _load_templates():
+    """Read the LaTeX templates once, {language: template}"""
+
+    templates = {}
+    for path in glob.glob(os.path.join(CERTIFICATE_DIR, "certi-*.tex")):
+        language = os.path.basename(path)[len("certi-"):-len(".tex")]
+        with open(path) as template:
+            templates[language] = template.read()
+    return templates
+
+TEMPLATES = _load_templates()
+
+
+def render(filename, level, language):
+    """Return the LaTeX of a certificate"""
+
+    text = TEMPLATES[language]
+
+    # Values go two characters after their marks, the last one first so
+    # that the position of the other one does not move
+    fields = [(text.find(MARK_NAME) + len(MARK_NAME) + 2, filename),
+              (text.find(MARK_CALIFICATION) + len(MARK_CALIFICATION) + 2, level)]
+    for position, value in sorted(fields, reverse=True):
+        text = text[:position] + value + text[position:]
+
+    return text
+
+
+def compile_pdf(tex, timeout):
+    """Compile a LaTeX document, return the content of the PDF
+
+    pdflatex is killed when it lasts more than timeout seconds. Raises
+    CertificateError when it can not be run or leaves no PDF.
+    """
+
+    output_dir = tempfile.mkdtemp(prefix="certificate_")
+    try:
+        path_tex = os.path.join(output_dir, "output.tex")
+        with open(path_tex, "w") as salida:
+            salida.write(tex)
+
+        # pdflatex runs in the certificate directory to find background1.jpg,
+        # its output goes to the temporary directory
+        with open(os.devnull, "w") as devnull:
+            try:
+                process = subprocess.Popen(["pdflatex", "-interaction=nonstopmode",
+                                            "-output-directory", output_dir, path_tex],
+                                           cwd=CERTIFICATE_DIR, stdout=devnull, stderr=devnull)
+            except OSError as e:
+                raise CertificateError("pdflatex could not be run: %s" % e)
+            deadline = time.time() + timeout
+            while process.poll() is None:
+                if time.time() > deadline:
+                    process.kill()
+                    process.wait()
+                    raise CertificateTimeout(tex)
+                time.sleep(0.05)
+
+        try:
+            with open(os.path.join(output_dir, "output.pdf"), "rb") as pdf:
+                return pdf.read()
+        except IOError:
+            raise CertificateError("pdflatex exited with code %s and no PDF" %
+                                   process.returncode)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
 
 def generate(filename,level,language):
-    """Generator of certificates"""
+    """Generator of certificates, returns the content of the PDF"""
+
+    return compile_pdf(render(filename, level, language), settings.CERTIFICATE_TIMEOUT)
+
+
+def cache_path(filename, level, language):
+
+    key = hashlib.sha1("\n".join([filename, level, language])).hexdigest()
+    return os.path.join(CACHE_DIR, key + ".pdf")
+
+
+def _generate_and_store(filename, level, language, path_pdf):
+
+    pdf = generate(filename, level, language)
+
+    try:
+        os.makedirs(CACHE_DIR)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    # Written with a unique name and renamed, a reader never sees half a PDF
+    fd, path_tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "wb") as output:
+        output.write(pdf)
+    os.rename(path_tmp, path_pdf)
+
+    _evict()
+    return pdf
+
+
+def _evict():
+    """Remove the oldest certificates over CERTIFICATE_CACHE_SIZE"""
+
+    paths = glob.glob(os.path.join(CACHE_DIR, "*.pdf"))
+    if len(paths) <= settings.CERTIFICATE_CACHE_SIZE:
+        return
+
+    paths.sort(key=lambda path: os.stat(path).st_mtime)
+    for path in paths[:len(paths) - settings.CERTIFICATE_CACHE_SIZE]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_pool = None
+_pending = {}       # Dict {path of the PDF: future} of the certificates in progress
+_lock = threading.Lock()
+
+
+def certificate(filename, level, language):
+    """Return the PDF of a certificate, from the cache if it was already generated
+
+    New certificates are compiled in a pool of CERTIFICATE_WORKERS threads,
+    and the requests for a certificate in progress wait for the same job.
+    Raises CertificateTimeout when the certificate is not ready in twice
+    CERTIFICATE_TIMEOUT, counting the time waiting for a free worker.
+    """
+
+    global _pool
+
+    path_pdf = cache_path(filename, level, language)
+    try:
+        with open(path_pdf, "rb") as pdf:
+            return pdf.read()
+    except IOError:
+        pass
 
-    base_dir = os.path.dirname(os.path.dirname(__file__))
-    os.chdir(base_dir + "/app/certificate")
+    with _lock:
+        future = _pending.get(path_pdf)
+        if future is None:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=settings.CERTIFICATE_WORKERS)
+            future = _pool.submit(_generate_and_store, filename, level, language, path_pdf)
+            _pending[path_pdf] = future
+            submitted = True
+        else:
+            submitted = False
 
-    salida = open("output.tex", "w") # crea fichero LaTeX para cada persona
-    person = [filename,level] # pasar la cadena en lista ["testing.sb2","21"]
-    text = open("certi-" + language + ".tex") # abrir documento LaTeX
-    text = text.read() # leer documento LaTeX
-    text_list = list(text) # pasa a lista
+    # Out of the lock, the callback runs right away if the job is already done
+    if submitted:
+        future.add_done_callback(lambda done: _forget(path_pdf))
 
-    y_cali = text.find("%pointcalification") # busca marcador de calificación
-    z_cali = len("%pointcalification")+2
-    text_list[y_cali+z_cali:y_cali+z_cali] = list(person[1]) # inserta calificación
+    try:
+        return future.result(timeout=2 * settings.CERTIFICATE_TIMEOUT)
+    except TimeoutError:
+        raise CertificateTimeout(path_pdf)
 
-    y_name = text.find("%pointname") # lo mismo para el nombre
-    z_name = len("%pointname")+2
-    text_list[y_name+z_name:y_name+z_name] = list(person[0])
 
-    text_final = "".join(text_list) # de lista a cadena
+def _forget(path_pdf):
 
-    salida.write(text_final) # guarda los cambio en el fichero creado
-    salida.close() # cierra el fichero creado
-    os.system(str("pdflatex " + "output.tex")) # compila el fichero LaTeX a pdf (opcional)
-    os.chdir(base_dir)
+    with _lock:
+        _pending.pop(path_pdf, None)
@@ -0,0 +1,243 @@
+import hashlib
+import io
+import json
+import time
+import zipfile
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
+# Bigger project.json files are parsed incrementally when ijson is installed
+STREAMING_THRESHOLD = 2 * 1024 * 1024
+
+# Sections of a target read by the analyzers, the rest is skipped
+TARGET_KEYS = frozenset(["name", "isStage", "blocks", "costumes"])
+
+# Bytes of a project.json read at a time when it is hashed
+CHUNK_SIZE = 1024 * 1024
+
+
+class ScratchProject(object):
+
+    """Parsed project.json of a sb3 project, shared by all the analyzers.
+
+    The project is decompressed and parsed only once per analysis. Blocks are
+    indexed per target, by id and by opcode, so the plugins do not need to
+    walk the raw json again. The parent/next/children links are built on
+    first use, since most analyzers only need the blocks themselves.
+
+    """
+
+    def __init__(self, json_project, filename=None):
+
+        self.filename = filename
+        self.json_project = json_project
+        self.targets = json_project.get("targets", [])
+
+        self.target_blocks = []         # One dict {id: block} per target
+        self.blocks = {}                # Dict {id: block} of all targets
+        self.total_blocks = []          # List with all blocks
+        self.opcode_index = defaultdict(list)   # Dict {opcode: [block]}
+        self.opcode_counts = Counter()  # Dict {opcode: number of blocks}
+        self.top_level = []             # Ids of the top level blocks
+
+        self._parent = None             # Dict {id: parent id}
+        self._next = None               # Dict {id: next id}
+        self._children = None           # Dict {id: [child id]}
+
+        self._index()
+
+
+    """Index the blocks of every target."""
+    def _index(self):
+
+        # Local names, this loop runs once per block of the project
+        all_blocks = self.blocks
+        total_blocks = self.total_blocks.append
+        opcode_index = self.opcode_index
+        top_level = self.top_level.append
+
+        for target in self.targets:
+            blocks = {}
+            for block_id, block in target.get("blocks", {}).iteritems():
+                # Top level variables and lists are stored as lists, not blocks
+                if type(block) is not dict:
+                    continue
+                blocks[block_id] = block
+                all_blocks[block_id] = block
+                total_blocks(block)
+                opcode_index[block.get("opcode")].append(block)
+                if block.get("topLevel"):
+                    top_level(block_id)
+
+            self.target_blocks.append(blocks)
+
+        for opcode, opcode_blocks in opcode_index.iteritems():
+            self.opcode_counts[opcode] = len(opcode_blocks)
+
+
+    """Build the parent, next and children links of every block."""
+    def _link(self):
+
+        self._parent = {}
+        self._next = {}
+        self._children = defaultdict(list)
+
+        for block_id, block in self.blocks.iteritems():
+            parent = block.get("parent")
+            self._parent[block_id] = parent
+            self._next[block_id] = block.get("next")
+            if parent is not None:
+                self._children[parent].append(block_id)
+
+
+    @property
+    def parent(self):
+        if self._parent is None:
+            self._link()
+        return self._parent
+
+
+    @property
+    def next(self):
+        if self._next is None:
+            self._link()
+        return self._next
+
+
+    @property
+    def children(self):
+        if self._children is None:
+            self._link()
+        return self._children
+
+
+def parse_streaming(stream):
+    """Parse a project.json from a file object, keeping only what the analyzers use
+
+    Only the TARGET_KEYS of every target are built, the other sections of
+    the targets (variables, lists, sounds...) and of the project
+    (monitors, extensions...) are read as a stream of events and never
+    held in memory as a whole.
+    """
+
+    targets = []
+    target = None
+    key = None          # Key of the target whose value is being built
+    builder = None
+    depth = 0
+
+    for prefix, event, value in ijson.parse(stream):
+        if builder is not None:
+            if event == 'number' and isinstance(value, Decimal):
+                value = float(value)
+            builder.event(event, value)
+            if event in ('start_map', 'start_array'):
+                depth += 1
+            elif event in ('end_map', 'end_array'):
+                depth -= 1
+            if depth == 0:
+                target[key] = builder.value
+                builder = None
+            continue
+
+        if prefix == 'targets.item':
+            if event == 'start_map':
+                target = {}
+            elif event == 'end_map':
+                targets.append(target)
+            elif event == 'map_key' and value in TARGET_KEYS:
+                key = value
+                builder = ObjectBuilder()
+
+    return {"targets": targets}
+
+
+def parse(json_string):
+    """Parse a project.json, incrementally when it is bigger than STREAMING_THRESHOLD"""
+
+    if ijson is not None and len(json_string) > STREAMING_THRESHOLD:
+        if isinstance(json_string, unicode):
+            json_string = json_string.encode('utf-8')
+        return parse_streaming(io.BytesIO(json_string))
+    return json.loads(json_string)
+
+
+def loads(json_string, filename=None):
+    """Build a ScratchProject from the content of a project.json"""
+
+    return ScratchProject(parse(json_string), filename)
+
+
+def read_json(filename):
+    """Return the content of the project.json of a sb3 file"""
+
+    zip_file = zipfile.ZipFile(filename, "r")
+    try:
+        return zip_file.open("project.json").read()
+    finally:
+        zip_file.close()
+
+
+def json_digest(sb3):
+    """Return the sha256 and the size of the project.json of a sb3 file
+
+    sb3 is the path or a file object of the sb3 file. The project.json is
+    read from the zip in chunks, never whole in memory.
+    """
+
+    zip_file = zipfile.ZipFile(sb3, "r")
+    try:
+        member = zip_file.open("project.json")
+        sha256 = hashlib.sha256()
+        size = 0
+        for chunk in iter(lambda: member.read(CHUNK_SIZE), ''):
+            sha256.update(chunk)
+            size += len(chunk)
+        return sha256.hexdigest(), size
+    finally:
+        zip_file.close()
+
+
+def load(sb3, filename=None, timings=None):
+    """Open a sb3 file and build its ScratchProject
+
+    sb3 is the path or a file object of the sb3 file, filename its name,
+    by default its path. A big project.json is parsed straight from the
+    zip, without reading it whole in memory first.
+
+    The seconds to open the zip go to the dict timings, when given, as
+    "zip.open" and the seconds to parse the project.json as "parse". A
+    small project.json is decompressed in "zip.open", a big one while it
+    is parsed.
+    """
+
+    if filename is None and isinstance(sb3, basestring):
+        filename = sb3
+
+    start = time.time()
+    zip_file = zipfile.ZipFile(sb3, "r")
+    try:
+        streaming = ijson is not None and \
+            zip_file.getinfo("project.json").file_size > STREAMING_THRESHOLD
+        member = zip_file.open("project.json")
+        if not streaming:
+            member = member.read()
+        opened = time.time()
+
+        if streaming:
+            project = ScratchProject(parse_streaming(member), filename)
+        else:
+            project = loads(member, filename)
+    finally:
+        zip_file.close()
+
+    if timings is not None:
+        timings['zip.open'] = opened - start
+        timings['parse'] = time.time() - opened
+    return project
@@ -1,5 +1,4 @@
-import json
-import zipfile
+import scratchProject
 
 
 class SpriteNaming:
@@ -17,43 +16,53 @@ class SpriteNaming:
       self.default_names = ["Sprite", "Objeto", "Personatge", "Figura", "o actor", "Personaia"]
 
    
+    """Return the default sprite names found in the project as a dict."""
+    def result(self):
+
+       return {'number': self.total_default,
+               'sprite': self.list_default}
+
+
     """Output the default sprite names found in the project."""
     def finalize(self):
-       result = ""
-       
-       result += ("%d default sprite names found:\n" % self.total_default)
-       for name in self.list_default:
-            result += name
-            result += "\n"
 
-       return result
+       return render(self.result())
 
 
     """Run and return the results from the SpriteNaming module."""
-    def analyze(self, filename):
-       
-      zip_file = zipfile.ZipFile(filename, "r")
-      json_project = json.loads(zip_file.open("project.json").read())
-  
-      for key, value in json_project.iteritems():
-        if key == "targets":
-          for dicc in value:
-            for dicc_key, dicc_value in dicc.iteritems():
-              if dicc_key == "name":
-                for default in self.default_names:
-                   if default in dicc_value:
-                      self.total_default += 1
-                      self.list_default.append(dicc_value)
+    def analyze(self, project):
 
+      for dicc in project.targets:
+        if "name" in dicc:
+          dicc_value = dicc["name"]
+          for default in self.default_names:
+             if default in dicc_value:
+                self.total_default += 1
+                self.list_default.append(dicc_value)
 
 
-def main(filename):
-    """The entrypoint for the 'spriteNaming' extension"""
 
-    naming = SpriteNaming()
-    naming.analyze(filename)
-    return naming.finalize()
+def render(result):
+    """Render the result of the 'spriteNaming' extension as text"""
 
+    text = ""
+    text += ("%d default sprite names found:\n" % result['number'])
+    for name in result['sprite']:
+         text += name
+         text += "\n"
 
+    return text
 
 
+def run(project):
+    """Run the 'spriteNaming' extension over a parsed ScratchProject"""
+
+    naming = SpriteNaming()
+    naming.analyze(project)
+    return naming.result()
+
+
+def main(filename):
+    """The entrypoint for the 'spriteNaming' extension"""
+
+    return render(run(scratchProject.load(filename)))
@@ -0,0 +1,91 @@
+"""Local stand-in of the Scratch servers, for the tests and the benchmarks
+
+StubServer answers in a thread of its own, with keep-alive connections,
+and records the requests and connections it gets, so the Fetcher can be
+checked and timed without the network.
+"""
+
+import socket
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+
+    """Local stand-in of the Scratch servers, run in a thread
+
+    responses maps a path to the list of its answers in order, (status,
+    body, seconds before answering); the last one is repeated. Any other
+    path gets a 404. Subclasses may answer otherwise by overriding answer.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, responses=None):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.responses = responses or {}
+        self.lock = threading.Lock()
+        self.requests = []
+        self.connections = 0
+        self.sockets = []
+        self.handlers = []
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def url(self, path=""):
+        return "http://127.0.0.1:%d/%s" % (self.server_address[1], path)
+
+    def answer(self, path):
+        """Record a request of path, return its (status, body, seconds before answering)"""
+
+        with self.lock:
+            self.requests.append((path, time.time()))
+            answers = self.responses.get(path)
+            if not answers:
+                return 404, '', 0
+            if len(answers) > 1:
+                return answers.pop(0)
+            return answers[0]
+
+    def handle_error(self, request, client_address):
+        # Clients which give up on a slow answer, as the timeout tests do
+        pass
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        # The handlers of the idle keep-alive connections end too
+        for connection in self.sockets:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        for handler in self.handlers:
+            handler.join(1)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+            self.server.sockets.append(self.connection)
+            self.server.handlers.append(threading.current_thread())
+
+    def do_GET(self):
+        status, body, delay = self.server.answer(self.path)
+        time.sleep(delay)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
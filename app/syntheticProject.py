@@ -0,0 +1,179 @@
+"""Generator of synthetic Scratch 3.0 projects, used by the benchmarks"""
+
+import json
+import random
+import zipfile
+
+
+HATS = ['event_whenflagclicked', 'event_whenbroadcastreceived', 'event_whenkeypressed',
+        'event_whenthisspriteclicked', 'control_start_as_clone']
+
+STACK_BLOCKS = ['motion_movesteps', 'motion_turnright', 'motion_gotoxy', 'motion_setx',
+                'looks_show', 'looks_hide', 'looks_nextcostume', 'looks_setsizeto',
+                'control_wait', 'data_setvariableto', 'data_changevariableby',
+                'event_broadcast', 'sound_play']
+
+LOOP_BLOCKS = ['control_forever', 'control_repeat', 'control_repeat_until']
+
+KEYS = ['space', 'up arrow', 'down arrow', 'a']
+
+
+class Generator:
+
+    """Build the json of a project block by block with reproducible ids"""
+
+    def __init__(self, seed=0, broadcasts=0):
+
+        self.random = random.Random(seed)
+        self.counter = 0
+        # (name, id) of the messages, by default the single message1
+        self.broadcasts = [("message%d" % i, "broadcast%d" % i) for i in range(1, broadcasts + 1)]
+
+
+    def new_id(self):
+
+        self.counter += 1
+        return "block%d" % self.counter
+
+
+    def block(self, opcode, parent, top_level=False):
+
+        block = {"opcode": opcode, "next": None, "parent": parent,
+                 "inputs": {}, "fields": {}, "shadow": False,
+                 "topLevel": top_level}
+        if top_level:
+            block["x"] = 0
+            block["y"] = 0
+        return block
+
+
+    """Link block_id after previous, or inside its SUBSTACK for a loop."""
+    def attach(self, blocks, previous, block_id, substack):
+
+        if substack:
+            blocks[previous]["inputs"]["SUBSTACK"] = [2, block_id]
+        else:
+            blocks[previous]["next"] = block_id
+
+
+    def message(self):
+
+        if not self.broadcasts:
+            return ("message1", "broadcast1")
+        return self.random.choice(self.broadcasts)
+
+
+    """Add a script of a hat block followed by `length` blocks.
+
+    The first `depth` blocks are loops nested one inside the other.
+    Returns the template of the script, with which copy adds the same
+    script again.
+    """
+    def script(self, blocks, length, depth=0):
+
+        hat = self.random.choice(HATS)
+        fields = {}
+        if hat == 'event_whenbroadcastreceived':
+            fields["BROADCAST_OPTION"] = list(self.message())
+        elif hat == 'event_whenkeypressed':
+            fields["KEY_OPTION"] = [self.random.choice(KEYS), None]
+
+        opcodes = []
+        for i in range(length):
+            if i < depth:
+                opcodes.append((self.random.choice(LOOP_BLOCKS), None))
+            else:
+                opcode = self.random.choice(STACK_BLOCKS)
+                message = None
+                if opcode == 'event_broadcast' and self.broadcasts:
+                    message = self.message()
+                opcodes.append((opcode, message))
+
+        template = (hat, fields, opcodes, depth)
+        self.copy(blocks, template)
+        return template
+
+
+    """Add the blocks of a script template with new ids."""
+    def copy(self, blocks, template):
+
+        hat, fields, opcodes, depth = template
+        hat_id = self.new_id()
+        blocks[hat_id] = self.block(hat, None, top_level=True)
+        blocks[hat_id]["fields"] = dict(fields)
+
+        previous = hat_id
+        substack = False
+        for i, (opcode, message) in enumerate(opcodes):
+            block_id = self.new_id()
+            blocks[block_id] = self.block(opcode, previous)
+            if message is not None:
+                blocks[block_id]["inputs"]["BROADCAST_INPUT"] = [1, [11] + list(message)]
+            self.attach(blocks, previous, block_id, substack)
+            substack = i < depth
+            previous = block_id
+
+        return hat_id
+
+
+    """Build a target of about total_blocks blocks.
+
+    The first `duplicates` scripts are added twice, on top of total_blocks.
+    """
+    def target(self, name, is_stage, total_blocks, script_length, depth, duplicates=0):
+
+        blocks = {}
+        templates = []
+        while len(blocks) < total_blocks:
+            length = min(script_length, max(total_blocks - len(blocks) - 1, 0))
+            templates.append(self.script(blocks, length, depth))
+
+        for template in templates[:duplicates]:
+            self.copy(blocks, template)
+
+        broadcasts = {}
+        if is_stage:
+            broadcasts = dict((broadcast_id, message)
+                              for message, broadcast_id in self.broadcasts)
+
+        return {"isStage": is_stage, "name": name, "blocks": blocks,
+                "variables": {}, "lists": {}, "broadcasts": broadcasts,
+                "costumes": [{"name": "backdrop1" if is_stage else "costume1"}],
+                "sounds": []}
+
+
+def generate(targets=4, blocks=1000, script_length=20, depth=0, seed=0,
+             broadcasts=0, duplicates=0):
+    """Return the json of a project with `blocks` blocks spread over `targets` targets
+
+    Every script has `script_length` blocks after its hat, and its first
+    `depth` blocks are nested loops. With `broadcasts` the broadcast blocks
+    and hats use that many different messages, declared in the stage, and
+    the first `duplicates` scripts of every target appear twice.
+
+    """
+
+    generator = Generator(seed, broadcasts)
+    per_target = max(blocks / max(targets, 1), 1)
+
+    json_targets = []
+    for i in range(targets):
+        if i == 0:
+            json_targets.append(generator.target("Stage", True, per_target, script_length, depth,
+                                                 duplicates))
+        else:
+            json_targets.append(generator.target("Sprite%d" % i, False, per_target,
+                                                 script_length, depth, duplicates))
+
+    return {"targets": json_targets, "monitors": [], "extensions": [],
+            "meta": {"semver": "3.0.0", "vm": "0.2.0", "agent": "drscratch-benchmark"}}
+
+
+def write_sb3(json_project, filename):
+    """Write the json of a project as a sb3 file"""
+
+    zip_file = zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED)
+    try:
+        zip_file.writestr("project.json", json.dumps(json_project))
+    finally:
+        zip_file.close()
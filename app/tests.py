@@ -1,3 +1,944 @@
-from django.test import TestCase
+import csv
+import glob
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import pstats
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from StringIO import StringIO
 
-# Create your tests here.
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from app import analysis
+from app import analysisCache
+from app import attributeInitialization
+from app import csvExport
+from app import csvJob
+from app import duplicateScripts
+from app import executor
+from app import fetcher
+from app import metrics
+from app import profiling
+from app import pyploma
+from app import scratchProject
+from app.stubServer import StubServer
+from app import syntheticProject
+from app import userKind
+from app import views
+from app.exception import AnalysisTimeout, DrScratchException, FetchError
+from app.models import (AnalysisCache, AnalysisCacheStats, CSVJob, CSVs, Coder, File,
+                        Organization)
+
+
+class FetcherTest(TestCase):
+
+    def setUp(self):
+        self.server = StubServer()
+        self.client = fetcher.Fetcher(concurrency=4, retries=3, backoff=0.01, rate=0,
+                                      timeout=0.5)
+
+    def tearDown(self):
+        self.client.executor.shutdown()
+        self.server.stop()
+
+    def test_retries_server_errors(self):
+        self.server.responses['/project'] = [(503, '', 0), (502, '', 0), (200, '{}', 0)]
+
+        self.assertEqual(self.client.get(self.server.url("project")), '{}')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_retries_timeouts(self):
+        self.server.responses['/project'] = [(200, '{}', 1), (200, '{}', 0)]
+
+        self.assertEqual(self.client.get(self.server.url("project")), '{}')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_gives_up(self):
+        self.server.responses['/project'] = [(503, '', 0)]
+
+        with self.assertRaises(FetchError):
+            self.client.get(self.server.url("project"))
+        # The first try and the retries
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_no_retry_when_not_found(self):
+        with self.assertRaises(FetchError):
+            self.client.get(self.server.url("missing"))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_reuses_connections(self):
+        self.server.responses['/project'] = [(200, '{}', 0)]
+
+        for _ in range(10):
+            self.client.get(self.server.url("project"))
+        self.assertEqual(len(self.server.requests), 10)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_rate_limit(self):
+        client = fetcher.Fetcher(concurrency=4, rate=20)
+        self.server.responses['/project'] = [(200, '{}', 0)]
+
+        start = time.time()
+        try:
+            bodies = client.map(client.get, [self.server.url("project")] * 8)
+        finally:
+            client.executor.shutdown()
+
+        self.assertEqual(bodies, ['{}'] * 8)
+        # 20 requests per second, one every 50 ms even with 4 in flight
+        self.assertGreaterEqual(time.time() - start, 7 * 0.05)
+
+    def test_fetch_project_from_old_server(self):
+        client = fetcher.Fetcher(rate=0, backoff=0.01,
+                                 project_url=self.server.url("new/{}"),
+                                 old_project_url=self.server.url("old/{}"))
+        self.server.responses['/old/1'] = [(200, '{"old": true}', 0)]
+
+        try:
+            self.assertEqual(client.fetch_project("1"), ('{"old": true}', True))
+        finally:
+            client.executor.shutdown()
+
+    def test_old_server_not_retried(self):
+        client = fetcher.Fetcher(rate=0, backoff=1, project_url=self.server.url("new/{}"),
+                                 old_project_url="http://127.0.0.1:1/{}")
+
+        start = time.time()
+        try:
+            with self.assertRaises(FetchError):
+                client.fetch_project("1")
+        finally:
+            client.executor.shutdown()
+        # The 404 and the refused connection, no backoff
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_no_old_server(self):
+        client = fetcher.Fetcher(rate=0, project_url=self.server.url("new/{}"))
+
+        try:
+            with self.assertRaises(FetchError):
+                client.fetch_project("1")
+        finally:
+            client.executor.shutdown()
+        self.assertEqual([path for path, _ in self.server.requests], ["/new/1"])
+
+
+def project_json(seed, blocks=50):
+    return json.dumps(syntheticProject.generate(blocks=blocks, seed=seed))
+
+
+@override_settings(ARCHIVE_PROJECTS=False)
+class CSVWorkerTest(TestCase):
+
+    def setUp(self):
+        self.server = StubServer()
+        for id_project in ["1", "2"]:
+            self.server.responses['/%s/get' % id_project] = [(200, project_json(int(id_project)),
+                                                              0)]
+        self.fetcher, fetcher._fetcher = fetcher._fetcher, fetcher.Fetcher(
+            rate=0, backoff=0.01, project_url=self.server.url("{}/get"),
+            old_project_url=self.server.url("old/{}"))
+
+        fd, self.upload = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, 'w') as upload:
+            upload.write("https://scratch.mit.edu/projects/1\n"
+                         "2\n"
+                         "https://scratch.mit.edu/projects/3\n")
+        self.filename = "csvworker_test_%d.csv" % os.getpid()
+
+    def tearDown(self):
+        fetcher._fetcher.executor.shutdown()
+        fetcher._fetcher = self.fetcher
+        self.server.stop()
+        for path in [self.upload, csvJob.DIR_OUTPUT + self.filename]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def run_worker(self, status, **fields):
+        job = CSVJob.objects.create(filename=self.filename, upload=self.upload,
+                                    coder="csvworker_test", status=status, **fields)
+        call_command('csvworker', '--once', stdout=StringIO())
+        job.refresh_from_db()
+        return job
+
+    def test_runs_pending_job(self):
+        job = self.run_worker(CSVJob.PENDING)
+
+        self.assertEqual(job.status, CSVJob.FINISHED)
+        self.assertEqual((job.total, job.done, job.errors), (3, 3, 1))
+        self.assertEqual(job.csv, CSVs.objects.get(filename=self.filename))
+        self.assertEqual(sorted(File.objects.filter(coder="csvworker_test")
+                                            .values_list('filename', 'method')),
+                         [("1.sb3", "csv"), ("2.sb3", "csv")])
+        with open(csvJob.DIR_OUTPUT + self.filename) as output:
+            # The header and a row per line
+            self.assertEqual(len(output.readlines()), 4)
+        self.assertEqual(job.output_size, os.path.getsize(csvJob.DIR_OUTPUT + self.filename))
+
+    def test_resumes_interrupted_job(self):
+        job = self.run_worker(CSVJob.RUNNING)
+
+        self.assertEqual(job.status, CSVJob.FINISHED)
+        self.assertEqual(job.done, 3)
+
+    def test_resume_drops_unsaved_rows(self):
+        # Killed after writing the rows of a batch, before saving its progress
+        saved = "header\r\nrow 1\r\n"
+        with open(csvJob.DIR_OUTPUT + self.filename, 'wb') as output:
+            output.write(saved + "unsaved row 2\r\nunsaved row 3\r\n")
+        job = self.run_worker(CSVJob.RUNNING, done=1, output_size=len(saved))
+
+        self.assertEqual(job.done, 3)
+        with open(csvJob.DIR_OUTPUT + self.filename) as output:
+            lines = output.read().splitlines()
+        self.assertEqual(lines[:2], ["header", "row 1"])
+        self.assertEqual(len(lines), 4)
+        self.assertFalse([line for line in lines if line.startswith("unsaved")])
+
+    def test_batch_queries(self):
+        job = CSVJob(filename=self.filename, upload=self.upload, coder="csvworker_test")
+
+        def batch_queries(size, seed):
+            json_strings = [project_json(seed + number) for number in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                results = analysisCache.analyze_many(json_strings,
+                                                     ["%d.sb3" % number for number in range(size)])
+                File.objects.bulk_create([csvJob.new_file(job, str(number), result)
+                                          for number, result in enumerate(results)])
+            return len(queries)
+
+        # No periodic eviction or write of the counters of the cache in between
+        analysisCache._last_evict = analysisCache._last_flush = time.time()
+        # Small enough for a single INSERT within the variables limit of SQLite
+        self.assertEqual(batch_queries(1, 100), batch_queries(40, 200))
+
+
+def sleep_job(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def failing_job():
+    raise ValueError("analyzer error")
+
+
+def exiting_job():
+    os._exit(1)
+
+
+class ExecutorTest(TestCase):
+
+    def setUp(self):
+        self.executor = executor.AnalysisExecutor(workers=2, timeout=1, memory_limit=0)
+
+    def test_result(self):
+        self.assertEqual(self.executor.run(sleep_job, 0), 0)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            self.executor.run(failing_job)
+        with self.assertRaises(DrScratchException):
+            self.executor.run(exiting_job)
+
+    def test_timeout_kills_only_its_job(self):
+        threads = ThreadPoolExecutor(max_workers=6)
+        start = time.time()
+        try:
+            runaway = threads.submit(self.executor.run, sleep_job, 30)
+            time.sleep(0.1)
+            # More jobs than workers, some of them wait for a slot longer than the timeout
+            others = [threads.submit(self.executor.run, sleep_job, 0.6) for _ in range(5)]
+
+            with self.assertRaises(AnalysisTimeout):
+                runaway.result()
+            self.assertEqual([future.result() for future in others], [0.6] * 5)
+        finally:
+            threads.shutdown()
+        # The runaway job is killed after its timeout, not after its 30 seconds
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+
+class AnalyzeBatchTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name in ["a", "b", "d", "e"]:
+            syntheticProject.write_sb3(syntheticProject.generate(blocks=300),
+                                       os.path.join(self.directory, name + ".sb3"))
+        # Some seconds to analyze, over the timeout of the run
+        syntheticProject.write_sb3(syntheticProject.generate(blocks=50000),
+                                   os.path.join(self.directory, "c.sb3"))
+        self.output = os.path.join(self.directory, "results.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_output(self):
+        with open(self.output) as output:
+            return dict((line['name'], line) for line in map(json.loads, output))
+
+    def test_timeout_only_fails_its_project(self):
+        call_command('analyzebatch', self.directory, self.output, jobs=3, timeout=1,
+                     stdout=StringIO())
+
+        lines = self.read_output()
+        self.assertEqual(sorted(lines), ["a.sb3", "b.sb3", "c.sb3", "d.sb3", "e.sb3"])
+        self.assertIn("AnalysisTimeout", lines["c.sb3"]["error"])
+        for name in ["a.sb3", "b.sb3", "d.sb3", "e.sb3"]:
+            self.assertNotIn("error", lines[name])
+            self.assertIn("mastery", lines[name]["results"])
+
+    def test_resumes(self):
+        call_command('analyzebatch', self.directory, self.output, jobs=3, timeout=1,
+                     stdout=StringIO())
+        os.remove(os.path.join(self.directory, "c.sb3"))
+        # A line cut by an interrupted run
+        with open(self.output, 'a') as output:
+            output.write('{"name": "f.sb3", "res')
+        syntheticProject.write_sb3(syntheticProject.generate(blocks=300),
+                                   os.path.join(self.directory, "f.sb3"))
+
+        call_command('analyzebatch', self.directory, self.output, jobs=3, stdout=StringIO())
+
+        lines = self.read_output()
+        self.assertEqual(sorted(lines), ["a.sb3", "b.sb3", "c.sb3", "d.sb3", "e.sb3", "f.sb3"])
+        self.assertNotIn("error", lines["f.sb3"])
+
+
+class AnalyzeFileTest(TestCase):
+
+    def check_project(self, json_project):
+        json_string = json.dumps(json_project)
+        sb3 = io.BytesIO()
+        syntheticProject.write_sb3(json_project, sb3)
+
+        self.assertEqual(scratchProject.json_digest(sb3),
+                         (hashlib.sha256(json_string).hexdigest(), len(json_string)))
+        self.assertEqual(analysisCache.file_cache_key(sb3), analysisCache.cache_key(json_string))
+
+        worker = executor.AnalysisExecutor(workers=1, timeout=60, memory_limit=0)
+        self.assertEqual(worker.analyze_file(sb3, "project.sb3"),
+                         analysis.analyze_json(json_string, "project.sb3"))
+
+    def test_small_project(self):
+        self.check_project(syntheticProject.generate(blocks=500))
+
+    def test_streamed_project(self):
+        json_project = syntheticProject.generate(blocks=20000)
+        self.assertGreater(len(json.dumps(json_project)), scratchProject.STREAMING_THRESHOLD)
+        self.check_project(json_project)
+
+
+class ProfilingTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_timed_out_analysis_leaves_profile(self):
+        profile = profiling.Profiling(threshold=100, directory=self.directory)
+        worker = executor.AnalysisExecutor(workers=1, timeout=1, memory_limit=0,
+                                           profile=profile)
+
+        with self.assertRaises(AnalysisTimeout):
+            worker.analyze_json(project_json(0, blocks=50000), "slow.sb3")
+
+        found = profiling.profiles(self.directory)
+        self.assertEqual(len(found), 1)
+        self.assertTrue(found[0]['timed_out'])
+        self.assertEqual(found[0]['filename'], "slow.sb3")
+        self.assertGreaterEqual(found[0]['seconds'], 1)
+        self.assertTrue(found[0]['stack'])
+        self.assertTrue(pstats.Stats(found[0]['path']).total_calls)
+
+    def test_evicts_by_size(self):
+        for number in range(5):
+            name = os.path.join(self.directory, "2026010%d_000000_000000_%016d" % (number, number))
+            for extension in [".prof", ".json"]:
+                with open(name + extension, 'w') as profile:
+                    profile.write("{}" + " " * 510)
+
+        # Room for three profiles of 1 kB
+        profiling._evict(profiling.Profiling(threshold=1, directory=self.directory,
+                                             max_size=3.5 / 1024))
+
+        self.assertEqual(sorted(os.listdir(self.directory))[::2],
+                         ["2026010%d_000000_000000_%016d.json" % (number, number)
+                          for number in [2, 3, 4]])
+
+
+class AnalysisCacheTest(TestCase):
+
+    def setUp(self):
+        # Counts of other tests, and no periodic work in the middle of a test
+        analysisCache._flush()
+        analysisCache._last_evict = analysisCache._last_flush = time.time()
+
+    def test_queries(self):
+        json_string = project_json(1)
+
+        # The lookup and the store
+        with self.assertNumQueries(2):
+            analysisCache.analyze_json(json_string)
+        # The lookup and the update of its last use
+        with self.assertNumQueries(2):
+            analysisCache.analyze_json(json_string)
+
+    def test_counters_written_in_batches(self):
+        json_string = project_json(1)
+        for _ in range(3):
+            analysisCache.analyze_json(json_string)
+        self.assertFalse(AnalysisCacheStats.objects.exists())
+
+        stats = analysisCache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+        self.assertEqual(AnalysisCacheStats.objects.get(pk=1).hits, 2)
+
+    def test_hits_get_their_filename(self):
+        json_string = project_json(1)
+        analysisCache.analyze_json(json_string, "first.sb3")
+
+        results = analysisCache.analyze_json(json_string, "second.sb3")
+        self.assertEqual(results['mastery']['filename'], "second.sb3")
+        self.assertEqual(results['deadCode']['filename'], "second.sb3")
+        # The stored results have no name
+        stored = json.loads(AnalysisCache.objects.get().results)
+        self.assertIsNone(stored['mastery']['filename'])
+
+        results = analysisCache.analyze_many([json_string, project_json(2), project_json(2)],
+                                             ["1.sb3", "2.sb3", "copy.sb3"])
+        self.assertEqual([result['deadCode']['filename'] for result in results],
+                         ["1.sb3", "2.sb3", "copy.sb3"])
+
+    @override_settings(ANALYSIS_CACHE_SIZE=2)
+    def test_periodic_eviction(self):
+        for seed in range(4):
+            analysisCache.analyze_json(project_json(seed))
+        self.assertEqual(AnalysisCache.objects.count(), 4)
+
+        analysisCache._last_evict = 0
+        analysisCache.analyze_json(project_json(4))
+        self.assertEqual(AnalysisCache.objects.count(), 2)
+        self.assertEqual(analysisCache.stats()['evictions'], 3)
+
+
+class StatsQueriesTest(TestCase):
+
+    def stats_queries(self, days):
+        """Render the stats page of a coder who joined days ago with a project every few days"""
+
+        username = "stats%d" % days
+        joined = timezone.now() - timedelta(days=days)
+        Coder.objects.create(username=username, date_joined=joined)
+        joined = joined.date()
+        File.objects.bulk_create([
+            File(filename="project%d.sb3" % day, coder=username, method="url",
+                 time=joined + timedelta(days=day), score=day % 22, abstraction=1,
+                 parallelization=2, logic=1, synchronization=3, flowControl=2,
+                 userInteractivity=1, dataRepresentation=2, spriteNaming=0,
+                 initialization=1, deadCode=0, duplicateScript=1)
+            for day in range(0, days, max(days / 20, 1))])
+
+        # The coder, the daily scores, the skills and the smells
+        with self.assertNumQueries(4):
+            response = self.client.get('/coder/stats/' + username)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_queries_do_not_grow_with_age(self):
+        for days in [1, 30, 365, 3000]:
+            self.stats_queries(days)
+
+    def test_daily_scores(self):
+        response = self.stats_queries(30)
+        self.assertEqual(len(response.context['date']), 31)
+        self.assertEqual(response.context['daily_score'][3], 3)
+
+
+class UploadQueriesTest(TestCase):
+
+    def setUp(self):
+        sb3 = io.BytesIO()
+        syntheticProject.write_sb3(syntheticProject.generate(blocks=500), sb3)
+        self.sb3 = sb3.getvalue()
+        # Counts of other tests, and no periodic work of the cache in the middle
+        analysisCache._flush()
+        analysisCache._last_evict = analysisCache._last_flush = time.time()
+
+    def tearDown(self):
+        path_uploads = os.path.dirname(os.path.dirname(views.__file__)) + "/uploads/"
+        for path in glob.glob(path_uploads + "uploadtest_*.sb3"):
+            os.remove(path)
+
+    def upload(self, queries):
+        upload = io.BytesIO(self.sb3)
+        upload.name = "uploadtest.sb3"
+        with self.assertNumQueries(queries) as context:
+            response = self.client.post('/show_dashboard', {'_upload': '', 'zipFile': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateNotUsed(response, 'error/analyzing.html')
+
+        # One INSERT when the upload arrives and one UPDATE with the results
+        writes = [query['sql'] for query in context.captured_queries
+                  if query['sql'].split()[0] in ("INSERT", "UPDATE") and "app_file" in query['sql']]
+        self.assertEqual(len(writes), 2)
+
+    def test_upload(self):
+        # The File twice, the lookup and the store in the cache
+        self.upload(4)
+
+    def test_cached_upload(self):
+        self.upload(4)
+        # The File twice, the lookup and the update of the cache entry
+        self.upload(4)
+
+
+class UserKindTest(TestCase):
+
+    def setUp(self):
+        Organization.objects.create(username="userkind_org")
+        Coder.objects.create(username="userkind_coder")
+
+    def test_resolved_with_one_query(self):
+        for username, page in [("userkind_org", "organization"), ("userkind_coder", "coder"),
+                               ("userkind_none", "main")]:
+            with self.assertNumQueries(1):
+                user_kind = userKind.resolve(username)
+                user_kind.profile
+            self.assertEqual(user_kind.page, page)
+
+    def test_owner(self):
+        self.assertEqual(userKind.resolve("userkind_org").owner(),
+                         {"organization": "userkind_org"})
+        self.assertEqual(userKind.resolve("userkind_none").owner(), {})
+
+
+# Stand-in of pdflatex, the "PDF" is the LaTeX it was given. It fails out
+# of the certificate directory, where background1.jpg is not found.
+FAKE_PDFLATEX = """#!/bin/sh
+test -f background1.jpg || exit 1
+{ echo "%PDF"; cat "$4"; } > "$3/output.pdf"
+"""
+
+
+def use_pdflatex(test, script):
+    """Run script as pdflatex, with an empty cache of certificates, for the rest of test"""
+
+    directory = tempfile.mkdtemp()
+    pdflatex = os.path.join(directory, "pdflatex")
+    with open(pdflatex, "w") as output:
+        output.write(script)
+    os.chmod(pdflatex, stat.S_IRWXU)
+    test.addCleanup(shutil.rmtree, directory)
+    test.addCleanup(os.environ.__setitem__, "PATH", os.environ["PATH"])
+    os.environ["PATH"] = directory + os.pathsep + os.environ["PATH"]
+
+    test.addCleanup(setattr, pyploma, "CACHE_DIR", pyploma.CACHE_DIR)
+    pyploma.CACHE_DIR = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, pyploma.CACHE_DIR)
+
+
+@override_settings(ARCHIVE_PROJECTS=True, ARCHIVE_ASYNC=True, CERTIFICATE_WORKERS=4)
+class ConcurrencyTest(TransactionTestCase):
+
+    """Simultaneous URL analyses and certificates through the real views"""
+
+    threads = 32
+
+    def setUp(self):
+        self.projects = dict(("9%03d" % number, project_json(number, blocks=300))
+                             for number in range(self.threads))
+        self.server = StubServer(dict(("/%s/get" % id_project, [(200, json_string, 0.01)])
+                                      for id_project, json_string in self.projects.items()))
+        self.fetcher, fetcher._fetcher = fetcher._fetcher, fetcher.Fetcher(
+            concurrency=self.threads, rate=0, project_url=self.server.url("{}/get"),
+            old_project_url=self.server.url("old/{}"))
+
+        use_pdflatex(self, FAKE_PDFLATEX)
+
+    def tearDown(self):
+        fetcher._fetcher.executor.shutdown()
+        fetcher._fetcher = self.fetcher
+        self.server.stop()
+        for path in self.archived():
+            os.remove(path)
+
+    def archived(self, id_project="9???"):
+        path_uploads = os.path.dirname(os.path.dirname(views.__file__)) + "/uploads/"
+        return glob.glob(path_uploads + id_project + "_*.sb3")
+
+    def in_threads(self, function, args):
+        """Map function over args in simultaneous threads, each with its own Client"""
+
+        def run(arg):
+            try:
+                return function(Client(), arg)
+            finally:
+                # Every thread has its own connection to the database
+                connection.close()
+
+        pool = ThreadPoolExecutor(max_workers=len(args))
+        try:
+            return list(pool.map(run, args))
+        finally:
+            pool.shutdown()
+
+    def analyze_url(self, client, id_project):
+        return client.post('/show_dashboard', {
+            '_url': '', 'urlProject': 'https://scratch.mit.edu/projects/%s/' % id_project})
+
+    def download_certificate(self, client, number):
+        return client.post('/download_certificate',
+                           {'certificate': 'project%d.sb3,%d' % (number, number % 22)})
+
+    def test_url_analyses(self):
+        cwd = os.getcwd()
+        responses = self.in_threads(self.analyze_url, sorted(self.projects))
+        self.assertEqual(os.getcwd(), cwd)
+
+        # The contexts of the responses come from a signal of every render, in
+        # any thread, so the results are checked in the File of every project
+        for id_project, response in zip(sorted(self.projects), responses):
+            self.assertEqual(response.status_code, 200)
+            results = analysis.analyze_json(self.projects[id_project])
+            saved = File.objects.get(filename=id_project + ".sb3")
+            self.assertEqual((saved.method, saved.score, saved.deadCode, saved.duplicateScript),
+                             ("url", results['mastery']['points'], results['deadCode']['number'],
+                              results['duplicateScript']['number']))
+
+        # Every project archived by the thread pool of the views, whole
+        views._archiver.shutdown()
+        views._archiver = None
+        for id_project, json_string in self.projects.items():
+            paths = self.archived(id_project)
+            self.assertEqual(len(paths), 1)
+            self.assertEqual(scratchProject.read_json(paths[0]), json_string)
+
+    def test_certificates(self):
+        cwd = os.getcwd()
+        temp_dirs = set(os.listdir(tempfile.gettempdir()))
+
+        # Every certificate twice, the second request waits for the first one
+        numbers = range(self.threads / 2) * 2
+        responses = self.in_threads(self.download_certificate, numbers)
+
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertFalse([name for name in set(os.listdir(tempfile.gettempdir())) - temp_dirs
+                          if name.startswith("certificate_")])
+        for number, response in zip(numbers, responses):
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/pdf')
+            self.assertTrue(response.content.startswith("%PDF"))
+            self.assertIn("project%d.sb3" % number, response.content)
+        self.assertEqual(len(os.listdir(pyploma.CACHE_DIR)), self.threads / 2)
+
+
+class DeepScriptTest(TestCase):
+
+    def test_analyzes_deep_script(self):
+        # A single script of 50000 blocks, its first 20000 nested loops
+        json_project = syntheticProject.generate(targets=1, blocks=50000, script_length=49999,
+                                                 depth=20000)
+        project = scratchProject.ScratchProject(json_project)
+        self.assertEqual(len(project.top_level), 1)
+
+        duplicate = duplicateScripts.DuplicateScripts()
+        duplicate.analyze(project)
+        self.assertEqual([len(blocks_tuple) for blocks_tuple, _ in duplicate.copies_dicc.values()],
+                         [50000])
+
+        # Every analyzer, in this process so that a RecursionError is not hidden
+        results = analysis.analyze_json(json.dumps(json_project))
+        self.assertEqual(results['duplicateScript']['number'], 0)
+
+
+class CertificateErrorTest(TestCase):
+
+    def download_certificate(self):
+        return self.client.post('/download_certificate', {'certificate': 'project.sb3,10'})
+
+    def test_pdflatex_fails(self):
+        use_pdflatex(self, "#!/bin/sh\nexit 1\n")
+
+        response = self.download_certificate()
+        self.assertEqual(response.status_code, 500)
+        self.assertTemplateUsed(response, 'error/500.html')
+
+    @override_settings(CERTIFICATE_TIMEOUT=1)
+    def test_pdflatex_times_out(self):
+        use_pdflatex(self, "#!/bin/sh\nsleep 5\n")
+
+        start = time.time()
+        response = self.download_certificate()
+        self.assertEqual(response.status_code, 503)
+        self.assertLess(time.time() - start, 3)
+
+    def test_certificate_after_failure(self):
+        use_pdflatex(self, "#!/bin/sh\nexit 1\n")
+        self.assertEqual(self.download_certificate().status_code, 500)
+
+        # The failure is not cached
+        use_pdflatex(self, FAKE_PDFLATEX)
+        response = self.download_certificate()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith("%PDF"))
+
+
+class CSVDownloadTest(TestCase):
+
+    def setUp(self):
+        coder = Coder(username="csvdownload")
+        coder.set_password("password")
+        coder.save()
+        self.client.login(username="csvdownload", password="password")
+
+        # Longer than a chunk of the download
+        self.data = "".join("https://scratch.mit.edu/projects/%d,%d\r\n" % (number, number % 22)
+                            for number in range(3000))
+        self.filename = "csvdownload_test_%d.csv" % os.getpid()
+        with open(csvJob.DIR_OUTPUT + self.filename, 'wb') as output:
+            output.write(self.data)
+        job = CSVJob.objects.create(filename=self.filename, upload="", coder="csvdownload")
+        self.url = '/analyze_CSV/jobs/%d/csv' % job.pk
+
+    def tearDown(self):
+        os.remove(csvJob.DIR_OUTPUT + self.filename)
+
+    def download(self, **headers):
+        response = self.client.get(self.url, **headers)
+        content = "".join(response.streaming_content) if response.streaming else \
+            response.content
+        return response, content
+
+    def test_full(self):
+        response, content = self.download()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content, self.data)
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=' + self.filename)
+
+    def test_range(self):
+        start = csvExport.CHUNK_SIZE - 10
+        response, content = self.download(HTTP_RANGE='bytes=%d-%d' % (start, start + 19))
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(content, self.data[start:start + 20])
+        self.assertEqual(response['Content-Range'],
+                         'bytes %d-%d/%d' % (start, start + 19, len(self.data)))
+
+    def test_suffix_range(self):
+        response, content = self.download(HTTP_RANGE='bytes=-10')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(content, self.data[-10:])
+
+    def test_unsatisfiable_range(self):
+        response, content = self.download(HTTP_RANGE='bytes=%d-' % len(self.data))
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */%d' % len(self.data))
+
+    def test_not_modified(self):
+        response, content = self.download()
+
+        response, content = self.download(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(content, "")
+
+        response, content = self.download(HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_stale_if_range(self):
+        response, content = self.download(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"0-0"')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content, self.data)
+
+    def test_projects_csv(self):
+        for day in [3, 1, 2]:
+            File.objects.create(filename="project%d.sb3" % day, coder="csvdownload",
+                                method="url", time=date(2026, 1, day), score=0,
+                                abstraction=1, parallelization=2, logic=1, synchronization=3,
+                                flowControl=2, userInteractivity=1, dataRepresentation=day,
+                                spriteNaming=0, initialization=1, deadCode=4,
+                                duplicateScript=1)
+        File.objects.create(filename="other.sb3", coder="other", method="url",
+                            time=date(2026, 1, 1), score=0, abstraction=0, parallelization=0,
+                            logic=0, synchronization=0, flowControl=0, userInteractivity=0,
+                            dataRepresentation=0, spriteNaming=0, initialization=0,
+                            deadCode=0, duplicateScript=0)
+
+        response = self.client.get('/analyze_CSV/projects')
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename=csvdownload_projects.csv')
+        rows = list(csv.reader(StringIO("".join(response.streaming_content))))
+
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1:], [["project%d.sb3" % day, "2026-01-0%d" % day, str(10 + day),
+                                     "1", "2", "1", "3", "2", "1", str(day), "1", "0", "4", "1"]
+                                    for day in [1, 2, 3]])
+
+
+def script(prefix, opcodes):
+    """Blocks {id: block} of a script with opcodes, its ids prefix0, prefix1..."""
+
+    blocks = {}
+    for number, opcode in enumerate(opcodes):
+        blocks["%s%d" % (prefix, number)] = {
+            "opcode": opcode, "topLevel": number == 0, "inputs": {}, "fields": {},
+            "parent": "%s%d" % (prefix, number - 1) if number else None,
+            "next": "%s%d" % (prefix, number + 1) if number + 1 < len(opcodes) else None}
+    return blocks
+
+
+def project(*targets):
+    """ScratchProject with a sprite of blocks per argument"""
+
+    return scratchProject.ScratchProject({"targets": [
+        {"name": "Sprite%d" % number, "isStage": False, "blocks": blocks, "costumes": []}
+        for number, blocks in enumerate(targets)]})
+
+
+class DuplicateScriptsTest(TestCase):
+
+    def test_near_duplicates(self):
+        opcodes = ["event_whenflagclicked"] + ["opcode_%d" % number for number in range(40)]
+        changed = opcodes[:-1] + ["opcode_changed"]
+        unrelated = ["event_whenflagclicked"] + ["other_%d" % number for number in range(40)]
+        blocks = script("a", opcodes)
+        blocks.update(script("b", changed))
+        blocks.update(script("c", unrelated))
+
+        results = duplicateScripts.run(project(blocks), near_duplicates=True)
+
+        self.assertEqual(results['number'], 0)
+        self.assertEqual(len(results['near_duplicates']), 1)
+        first, second, similarity = results['near_duplicates'][0]
+        self.assertEqual(sorted([first, second]), sorted([opcodes, changed]))
+        # 39 shingles of 3 opcodes each, all of them but the last one in common
+        self.assertEqual(similarity, round(38.0 / 40, 2))
+
+    def test_exact_duplicates(self):
+        opcodes = ["event_whenflagclicked"] + ["opcode_%d" % number for number in range(10)]
+        blocks = script("a", opcodes)
+        blocks.update(script("b", opcodes))
+
+        results = duplicateScripts.run(project(blocks), near_duplicates=True)
+
+        self.assertEqual(results['number'], 1)
+        self.assertEqual(results['copies'], [2])
+        self.assertEqual(results['near_duplicates'], [])
+
+
+class AttributeInitializationTest(TestCase):
+
+    def test_initialized_attributes(self):
+        # Moved and turned, only the position is set when the green flag is clicked
+        sprite = script("a", ["event_whenflagclicked", "motion_gotoxy", "looks_show"])
+        sprite.update(script("b", ["event_whenkeypressed", "motion_movesteps",
+                                   "motion_turnright", "looks_hide"]))
+        # Resized, the size is set after a link to a missing block
+        broken = script("c", ["event_whenflagclicked", "looks_setsizeto"])
+        broken["c1"]["next"] = "missing"
+        broken.update(script("d", ["event_whenthisspriteclicked", "looks_changesizeby"]))
+        # Hidden, in a green flag script whose links go round in a loop
+        loop = script("e", ["event_whenflagclicked", "looks_switchcostumeto", "looks_hide"])
+        loop["e2"]["next"] = "e1"
+        # Nothing modified
+        still = script("f", ["event_whenflagclicked", "control_wait"])
+
+        results = attributeInitialization.run(project(sprite, broken, loop, still))
+
+        self.assertEqual(results, {'number': 1, 'sprites': {'Sprite0': ['orientation']}})
+
+    def test_not_in_green_flag_script(self):
+        sprite = script("a", ["event_whenkeypressed", "motion_gotoxy", "motion_movesteps"])
+
+        results = attributeInitialization.run(project(sprite))
+
+        self.assertEqual(results, {'number': 1, 'sprites': {'Sprite0': ['position']}})
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        self.stages, metrics._stages = metrics._stages, {}
+        self.lines = []
+        self.handler = logging.Handler()
+        self.handler.emit = lambda record: self.lines.append(record.getMessage())
+        logging.getLogger('app.metrics').addHandler(self.handler)
+
+    def tearDown(self):
+        logging.getLogger('app.metrics').removeHandler(self.handler)
+        metrics._stages = self.stages
+
+    def test_trace(self):
+        with metrics.trace('dashboard', upload=True):
+            with metrics.timer('download'):
+                pass
+            metrics.record('analyzer.mastery', 0.25)
+            metrics.record('analyzer.mastery', 0.5)
+            with metrics.trace('render'):
+                pass
+
+        # A single line, of the outer trace
+        self.assertEqual(len(self.lines), 1)
+        line = json.loads(self.lines[0])
+        self.assertEqual((line['event'], line['upload']), ('dashboard', True))
+        self.assertEqual(sorted(line['stages']), ['analyzer.mastery', 'download', 'render'])
+        self.assertEqual(line['stages']['analyzer.mastery'], 0.75)
+        self.assertEqual(metrics.snapshot()['dashboard'][0], 1)
+
+    def test_prometheus(self):
+        for number in range(1, 101):
+            metrics.record('parse', number / 100.0)
+        metrics.record('a "quoted" stage', 1)
+
+        lines = metrics.prometheus().splitlines()
+        self.assertEqual(lines[:2], [
+            "# HELP drscratch_stage_seconds Duration of the stages of the analyses",
+            "# TYPE drscratch_stage_seconds summary"])
+        self.assertIn('drscratch_stage_seconds{stage="parse",quantile="0.5"} 0.510000', lines)
+        self.assertIn('drscratch_stage_seconds{stage="parse",quantile="0.99"} 1.000000', lines)
+        self.assertIn('drscratch_stage_seconds_sum{stage="parse"} 50.500000', lines)
+        self.assertIn('drscratch_stage_seconds_count{stage="parse"} 100', lines)
+        self.assertIn('drscratch_stage_seconds_count{stage="a \\"quoted\\" stage"} 1', lines)
+
+    def test_metrics_view(self):
+        metrics.record('parse', 1)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('drscratch_stage_seconds_count{stage="parse"} 1', response.content)
+
+        response = self.client.get('/metrics', REMOTE_ADDR='192.0.2.1')
+        self.assertEqual(response.status_code, 403)
+
+    def test_stages_of_file_analysis(self):
+        sb3 = io.BytesIO()
+        syntheticProject.write_sb3(syntheticProject.generate(blocks=100), sb3)
+        timings = {}
+        analysis.analyze_file(sb3, "project.sb3", timings)
+
+        self.assertEqual(sorted(timings), ['analyzer.' + name for name, _ in
+                                           sorted(analysis.ANALYZERS)] + ['parse', 'zip.open'])
@@ -0,0 +1,82 @@
+"""Kind of account of a user: organization, coder or none
+
+Organization and Coder extend User, so a single query of the User with
+both of them joined tells which one an account is and returns its
+profile. The kind of the user logged in is resolved once per request
+and kept in the request for the rest of the views it goes through.
+"""
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist
+
+ORGANIZATION = 'organization'
+CODER = 'coder'
+
+
+class UserKind(object):
+
+    """Kind of account and profile (Organization or Coder) of an username"""
+
+    def __init__(self, username=None, kind=None, profile=None):
+        self.username = username
+        self.kind = kind
+        self.profile = profile
+
+    @property
+    def is_organization(self):
+        return self.kind == ORGANIZATION
+
+    @property
+    def is_coder(self):
+        return self.kind == CODER
+
+    @property
+    def page(self):
+        """Directory of the templates of the user: organization, coder or main"""
+
+        return self.kind or 'main'
+
+    def owner(self):
+        """Fields of the File, CSVs and CSVJob rows that belong to the user"""
+
+        if self.kind is None:
+            return {}
+        return {self.kind: self.username}
+
+
+def resolve(username):
+    """Return the UserKind of an username with at most one query"""
+
+    if not username:
+        return UserKind()
+
+    try:
+        user = User.objects.select_related(ORGANIZATION, CODER).get(username=username)
+    except User.DoesNotExist:
+        return UserKind(username)
+
+    for kind in (ORGANIZATION, CODER):
+        try:
+            return UserKind(username, kind, getattr(user, kind))
+        except ObjectDoesNotExist:
+            pass
+    return UserKind(username)
+
+
+def of_request(request):
+    """UserKind of the user logged in, resolved once per request"""
+
+    if not hasattr(request, '_user_kind'):
+        if request.user.is_authenticated():
+            request._user_kind = resolve(request.user.username)
+        else:
+            request._user_kind = UserKind()
+    return request._user_kind
+
+
+def of_username(request, username):
+    """UserKind of username, without a query when it is the user logged in"""
+
+    if request.user.is_authenticated() and request.user.username == username:
+        return of_request(request)
+    return resolve(username)
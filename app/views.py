@@ -2,7 +2,7 @@
 # -*- encoding: utf-8 -*-
 # -*- coding: utf-8 -*-
 
-from django.http import HttpResponseRedirect, HttpResponse
+from django.http import HttpResponseRedirect, HttpResponse, Http404
 from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
 from django.contrib.auth import logout, login, authenticate,get_user_model
@@ -10,8 +10,8 @@ from django.contrib.auth.tokens import default_token_generator
 from django.utils.encoding import force_bytes
 from django.utils import timezone
 from django.utils.http import urlsafe_base64_encode,urlsafe_base64_decode
-from django.db.models import Avg
-from app.models import File, CSVs
+from django.db.models import Avg, Count
+from app.models import File, CSVs, CSVJob
 from app.models import Organization, OrganizationHash, Coder
 from app.models import Discuss, Stats
 from app.forms import UploadFileForm, UserForm, NewUserForm, UrlForm
@@ -20,29 +20,26 @@ from app.forms import TeacherForm, LoginOrganizationForm
 from app.forms import CoderForm, LoginCoderForm
 from app.forms import DiscussForm
 from django.contrib.auth.models import User
-from django.utils.encoding import smart_str
 from django.shortcuts import render
+from django.conf import settings as django_settings
 
 import os
-import ast
 import json
-import urllib2
 import shutil
 import unicodedata
-import csv
 import zipfile
-import uuid
 from datetime import datetime, timedelta, date
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 from app import pyploma
+from app import fetcher
+from app import metrics
 from app import org
 
-import analyzer
-import spriteNaming
-import backdropNaming
-import duplicateScripts
-import deadCode
+import analysisCache
+import csvExport
+import userKind
 
 from exception import DrScratchException
 
@@ -69,10 +66,7 @@ def main(request):
         username = request.user.username
         #Find which is authenticated (organization or coder or none)
         page = segmentation(request)
-        if page == 'coder':
-            user = Coder.objects.get(username=username)
-        elif page == 'organization':
-            user = Organization.objects.get(username=username)
+        user = userKind.of_request(request).profile
         img = user.img
         dic = {'username': username, "img": str(img)}
         return render(request, page + '/main.html', dic)
@@ -146,31 +140,32 @@ def show_dashboard(request):
     """Shows the different dashboards"""
 
     if request.method == 'POST':
+        with metrics.trace('dashboard', upload="_upload" in request.POST):
+            d = build_dictionary_with_automatic_analysis(request)
 
-        d = build_dictionary_with_automatic_analysis(request)
+            user = str(segmentation(request))
 
-        user = str(segmentation(request))
+            with metrics.timer('render'):
+                if d['Error'] == 'analyzing':
+                    return render(request, 'error/analyzing.html')
 
-        if d['Error'] == 'analyzing':
-            return render(request, 'error/analyzing.html')
+                elif d['Error'] == 'MultiValueDict':
+                    return render(request, user + '/main.html', {'error': True})
 
-        elif d['Error'] == 'MultiValueDict':
-            return render(request, user + '/main.html', {'error': True})
+                elif d['Error'] == 'id_error':
+                    return render(request, user + '/main.html', {'id_error': True})
 
-        elif d['Error'] == 'id_error':
-            return render(request, user + '/main.html', {'id_error': True})
-
-        elif d['Error'] == 'no_exists':
-            return render(request, user + '/main.html', {'no_exists': True})
-        else:
-            if d["mastery"]["points"] >= 15:
-                return render(request, user + '/dashboard-master.html', d)
+                elif d['Error'] == 'no_exists':
+                    return render(request, user + '/main.html', {'no_exists': True})
+                else:
+                    if d["mastery"]["points"] >= 15:
+                        return render(request, user + '/dashboard-master.html', d)
 
-            elif d["mastery"]["points"] > 7:
-                return render(request, user + '/dashboard-developing.html', d)
+                    elif d["mastery"]["points"] > 7:
+                        return render(request, user + '/dashboard-developing.html', d)
 
-            else:
-                return render(request, user + '/dashboard-basic.html', d)
+                    else:
+                        return render(request, user + '/dashboard-basic.html', d)
 
     else:
         return HttpResponseRedirect('/')
@@ -201,15 +196,7 @@ def build_dictionary_with_automatic_analysis(request):
 def segmentation(request):
     """Find which is authenticated (organization or coder or none)"""
 
-    if request.user.is_authenticated():
-        username = request.user.username
-        if Organization.objects.filter(username=username.encode('utf-8')):
-            user = 'organization'
-        elif Coder.objects.filter(username=username.encode('utf-8')):
-            user = 'coder'
-    else:
-        user = 'main'
-    return user
+    return userKind.of_request(request).page
 
 
 ###############################################################################
@@ -230,39 +217,17 @@ def _make_analysis_by_upload(request):
         now = datetime.now()
         method = "project"
 
-        if request.user.is_authenticated():
-            username = request.user.username
-        else:
-            username = None
-
-        if Organization.objects.filter(username=username):
-            filename = File(filename=file.name.encode('utf-8'),
-                            organization=username,
-                            method=method, time=now,
-                            score=0, abstraction=0, parallelization=0,
-                            logic=0, synchronization=0, flowControl=0,
-                            userInteractivity=0, dataRepresentation=0,
-                            spriteNaming=0, initialization=0,
-                            deadCode=0, duplicateScript=0)
-        elif Coder.objects.filter(username=username):
-            filename = File(filename=file.name.encode('utf-8'),
-                            coder=username,
-                            method=method, time=now,
-                            score=0, abstraction=0, parallelization=0,
-                            logic=0, synchronization=0, flowControl=0,
-                            userInteractivity=0, dataRepresentation=0,
-                            spriteNaming=0, initialization=0,
-                            deadCode=0, duplicateScript=0)
-        else:
-            filename = File(filename=file.name.encode('utf-8'),
-                            method=method, time=now,
-                            score=0, abstraction=0, parallelization=0,
-                            logic=0, synchronization=0, flowControl=0,
-                            userInteractivity=0, dataRepresentation=0,
-                            spriteNaming=0, initialization=0,
-                            deadCode=0, duplicateScript=0)
+        filename = File(filename=file.name.encode('utf-8'),
+                        method=method, time=now,
+                        score=0, abstraction=0, parallelization=0,
+                        logic=0, synchronization=0, flowControl=0,
+                        userInteractivity=0, dataRepresentation=0,
+                        spriteNaming=0, initialization=0,
+                        deadCode=0, duplicateScript=0,
+                        **userKind.of_request(request).owner())
 
-        filename.save()
+        with metrics.timer('db.file'):
+            filename.save()
 
         dir_zips = os.path.dirname(os.path.dirname(__file__)) + "/uploads/"
 
@@ -286,31 +251,35 @@ def _make_analysis_by_upload(request):
             file_saved = dir_zips + unique_id + ".sb3"
 
         # Create log
-        pathLog = os.path.dirname(os.path.dirname(__file__)) + "/log/"
-        logFile = open (pathLog + "logFile.txt", "a")
-        logFile.write("FileName: " + str(filename.filename) + "\t\t\t" + \
-            "ID: " + str(filename.id) + "\t\t\t" + \
-            "Method: " + str(filename.method) + \
-            "\t\t\tTime: " + str(filename.time) + "\n")
-
-        # Save file in server
-        counter = 0
-        file_name = handler_upload(file_saved, counter)
+        write_activity_in_logfile(filename)
+
+        # Save file in server, created exclusively so that two requests
+        # never write the same file
+        with metrics.timer('upload.write'):
+            counter = 0
+            while True:
+                file_name = handler_upload(file_saved, counter)
+                try:
+                    fd = os.open(file_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+                    break
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise
 
-        with open(file_name, 'wb+') as destination:
-            for chunk in file.chunks():
-                destination.write(chunk)
+            with os.fdopen(fd, 'wb') as destination:
+                for chunk in file.chunks():
+                    destination.write(chunk)
 
         try:
             d = analyze_project(request, file_name, filename, ext_type_project=None)
         except Exception:
             traceback.print_exc()
             filename.method = 'project/error'
-            filename.save()
-            old_path_project = file_saved
-            new_path_project = file_saved.split("/uploads/")[0] + \
+            filename.save(update_fields=['method'])
+            old_path_project = file_name
+            new_path_project = file_name.split("/uploads/")[0] + \
                              "/error_analyzing/" + \
-                             file_saved.split("/uploads/")[1]
+                             file_name.split("/uploads/")[1]
             shutil.copy(old_path_project, new_path_project)
             d = {'Error': 'analyzing'}
             return d
@@ -378,12 +347,9 @@ def generator_dic(request, id_project):
     """Returns dictionary with analyzes and errors"""
 
     try:
-        if request.user.is_authenticated():
-            username = request.user.username
-        else:
-            username = None
-
-        path_project, file, ext_type_project = send_request_getsb3(id_project, username, method="url")
+        json_project, file, ext_type_project = send_request_getsb3(id_project,
+                                                                   userKind.of_request(request),
+                                                                   method="url")
     except DrScratchException:
         logger.error('DrScratchException')
         d = {'Error': 'no_exists'}
@@ -395,18 +361,14 @@ def generator_dic(request, id_project):
         return d
 
     try:
-        d = analyze_project(request, path_project, file, ext_type_project)
+        d = analyze_project_json(request, json_project, file)
     except Exception:
         logger.error('Impossible analyze project')
         traceback.print_exc()
 
         file.method = 'url/error'
-        file.save()
-        oldPathProject = path_project
-        newPathProject = path_project.split("/uploads/")[0] + \
-                         "/error_analyzing/" + \
-                         path_project.split("/uploads/")[1]
-        shutil.copy(oldPathProject, newPathProject)
+        file.save(update_fields=['method'])
+        save_projectsb3(json_project, id_project, "/error_analyzing/")
         d = {'Error': 'analyzing'}
 
         return d
@@ -423,36 +385,44 @@ def generate_uniqueid_for_saving(id_project):
     return id_project + "_" + date_now_string
 
 
-def save_projectsb3(path_file_temporary, id_project):
+def save_projectsb3(json_project, id_project, directory="/uploads/"):
+    """Zip a project.json as a sb3 file in directory, return its path"""
 
-    dir_zips = os.path.dirname(os.path.dirname(__file__)) + "/uploads/"
+    dir_zips = os.path.dirname(os.path.dirname(__file__)) + directory
 
     unique_id = generate_uniqueid_for_saving(id_project)
     unique_file_name_for_saving = dir_zips + unique_id + ".sb3"
 
-    dir_utemp = path_file_temporary.split(id_project)[0].encode('utf-8')
-    path_project = os.path.dirname(os.path.dirname(__file__))
+    with zipfile.ZipFile(unique_file_name_for_saving, 'w') as myzip:
+        myzip.writestr('project.json', json_project)
 
-    if '_new_project.json' in path_file_temporary:
-        ext_project = '_new_project.json'
-    else:
-        ext_project = '_old_project.json'
+    return unique_file_name_for_saving
 
-    temporary_file_name = id_project + ext_project
 
-    os.chdir(dir_utemp)
+_archiver = None
 
-    with zipfile.ZipFile(unique_file_name_for_saving, 'w') as myzip:
-        os.rename(temporary_file_name, 'project.json')
-        myzip.write('project.json')
 
-    try:
-        os.remove('project.json')
-        os.chdir(path_project)
-    except:
-        logger.error('Error removing temporary project.json')
+def archive_projectsb3(json_project, id_project):
+    """Save a downloaded project in uploads/, in background if so configured"""
+
+    global _archiver
+
+    if not django_settings.ARCHIVE_PROJECTS:
+        return
+    if not django_settings.ARCHIVE_ASYNC:
+        save_projectsb3(json_project, id_project)
+        return
+
+    if _archiver is None:
+        _archiver = ThreadPoolExecutor(max_workers=1)
+    future = _archiver.submit(save_projectsb3, json_project, id_project)
+    future.add_done_callback(_log_archive_error)
+
 
-    return unique_file_name_for_saving, ext_project
+def _log_archive_error(future):
+
+    if future.exception() is not None:
+        logger.error('Error archiving project: %s', future.exception())
 
 
 def send_request_getstudio(id_studio):
@@ -464,102 +434,70 @@ def write_activity_in_logfile(file_name):
     path_log = os.path.dirname(os.path.dirname(__file__)) + "/log/"
 
     try:
-        log_file = open(path_log + "logFile.txt", "a")
-        log_file.write("FileName: " + str(file_name.filename) + "\t\t\t" + "ID: " + str(file_name.id) + "\t\t\t" +
-                       "Method: " + str(file_name.method) + "\t\t\t" + "Time: " + str(file_name.time) + "\n")
-    except OSError:
+        with open(path_log + "logFile.txt", "a") as log_file:
+            log_file.write("FileName: " + str(file_name.filename) + "\t\t\t" + "ID: " + str(file_name.id) + "\t\t\t" +
+                           "Method: " + str(file_name.method) + "\t\t\t" + "Time: " + str(file_name.time) + "\n")
+    except (IOError, OSError):
         logger.error('FileNotFoundError')
     except Exception:
         traceback.print_exc()
-    finally:
-        log_file.close()
 
 
-def download_scratch_project_from_servers(path_project, id_project):
+def download_scratch_project_from_servers(id_project, downloaded=None):
+    """Return the project.json of a project and from which server it comes
 
-    random_string = uuid.uuid4().hex
-    url_json_scratch = "https://projects.scratch.mit.edu/{}/get?foo={}".format(id_project, random_string)
+    downloaded is the result of Fetcher.fetch_project when the project
+    was already fetched, e.g. by a CSV batch.
+    """
 
-    path_utemp = path_project + '/utemp/' + str(id_project)
-    path_json_file = path_utemp + '_new_project.json'
+    if downloaded is None:
+        downloaded = fetcher.get_fetcher().fetch_project(id_project)
+    json_string_format, old_server = downloaded
 
-    try:
-        response_from_scratch = urllib2.urlopen(url_json_scratch)
-    except urllib2.HTTPError as e:
-        # Two ways, id does not exist in servers or id is in other server
-        logger.error('HTTPError %s', e.message)
-        url_json_scratch = "http://127.0.0.1:3030/api/{}".format(id_project)
-        response_from_scratch = urllib2.urlopen(url_json_scratch)
-        path_json_file = path_utemp + '_old_project.json'
-    except urllib2.URLError as e:
-        logger.error('URLError: %s', e.message)
-        traceback.print_exc()
-    except:
-        traceback.print_exc()
+    if old_server:
+        ext_project = '_old_project.json'
+    else:
+        ext_project = '_new_project.json'
 
     try:
-
-        json_string_format = response_from_scratch.read()
-        json_data = json.loads(json_string_format)
-
-        resulting_file = open(path_json_file, 'wb')
-        resulting_file.write(json_string_format)
-        resulting_file.close()
-
+        json.loads(json_string_format)
     except ValueError as e:
         logger.error('ValueError: %s', e.message)
         raise DrScratchException
-    except IOError as e:
-        logger.error('IOError %s' % e.message)
-        raise IOError
 
-    return path_json_file
+    return json_string_format, ext_project
+
 
+def send_request_getsb3(id_project, user_kind, method):
+    """First request to getSb3, return the project.json, its File and its type
 
-def send_request_getsb3(id_project, username, method):
-    """First request to getSb3"""
+    user_kind is the UserKind of the user the File belongs to.
+    """
 
     file_url = id_project + ".sb3"
 
-    path_project = os.path.dirname(os.path.dirname(__file__))
-    path_json_file_temporary = download_scratch_project_from_servers(path_project, id_project)
+    with metrics.timer('download'):
+        json_project, ext_type_project = download_scratch_project_from_servers(id_project)
 
     now = datetime.now()
 
-    if Organization.objects.filter(username=username):
-        fileName = File(filename=file_url,
-                        organization=username,
-                        method=method, time=now,
-                        score=0, abstraction=0, parallelization=0,
-                        logic=0, synchronization=0, flowControl=0,
-                        userInteractivity=0, dataRepresentation=0,
-                        spriteNaming=0, initialization=0,
-                        deadCode=0, duplicateScript=0)
-    elif Coder.objects.filter(username=username):
-        fileName = File(filename=file_url,
-                        coder=username,
-                        method=method, time=now,
-                        score=0, abstraction=0, parallelization=0,
-                        logic=0, synchronization=0, flowControl=0,
-                        userInteractivity=0, dataRepresentation=0,
-                        spriteNaming=0, initialization=0,
-                        deadCode=0, duplicateScript=0)
-    else:
-        fileName = File(filename=file_url,
-                        method=method, time=now,
-                        score=0, abstraction=0, parallelization=0,
-                        logic=0, synchronization=0, flowControl=0,
-                        userInteractivity=0, dataRepresentation=0,
-                        spriteNaming=0, initialization=0,
-                        deadCode=0, duplicateScript=0)
-    
-    fileName.save()
+    fileName = File(filename=file_url,
+                    method=method, time=now,
+                    score=0, abstraction=0, parallelization=0,
+                    logic=0, synchronization=0, flowControl=0,
+                    userInteractivity=0, dataRepresentation=0,
+                    spriteNaming=0, initialization=0,
+                    deadCode=0, duplicateScript=0,
+                    **user_kind.owner())
+    with metrics.timer('db.file'):
+        fileName.save()
 
     write_activity_in_logfile(fileName)
 
-    path_scratch_project_sb3, ext_type_project = save_projectsb3(path_json_file_temporary, id_project)
+    # The analysis runs from memory, the sb3 is only kept as an archive
+    archive_projectsb3(json_project, id_project)
 
-    return path_scratch_project_sb3, fileName, ext_type_project
+    return json_project, fileName, ext_type_project
 
 
 def handler_upload(file_saved, counter):
@@ -614,45 +552,74 @@ def check_version(filename):
     return version
 
 
-def analyze_project(request, path_projectsb3, filename, ext_type_project):
+# Fields of File filled by the analysis
+FILE_ANALYSIS_FIELDS = ['score', 'abstraction', 'parallelization', 'logic',
+                        'synchronization', 'flowControl', 'userInteractivity',
+                        'dataRepresentation', 'spriteNaming', 'initialization',
+                        'deadCode', 'duplicateScript', 'language']
 
-    dictionary = {}
+
+def analyze_project(request, path_projectsb3, filename, ext_type_project):
 
     if os.path.exists(path_projectsb3):
+        # The project.json is streamed from the sb3 in the worker process,
+        # this one never reads it whole
+        with metrics.timer('analysis'):
+            results = analysisCache.analyze_file(path_projectsb3, filename.filename)
+        return process_results(request, results, filename)
+    else:
+        raise Exception
+
+
+def analyze_project_json(request, json_project, filename):
+
+    # Cached results of the same project.json, else the analyzers run
+    # in the worker processes of the executor, a runaway analysis
+    # raises AnalysisTimeout instead of blocking here
+    with metrics.timer('analysis'):
+        results = analysisCache.analyze_json(json_project, filename.filename)
+    return process_results(request, results, filename)
 
-        result_mastery = analyzer.main(path_projectsb3)
-        result_sprite_naming = spriteNaming.main(path_projectsb3)
-        result_backdrop_naming = backdropNaming.main(path_projectsb3)
-        result_duplicate_script = duplicateScripts.main(path_projectsb3)
-        resultDeadCode = deadCode.main(path_projectsb3)
 
+def process_results(request, results, filename):
+    """Fill and save the File of an analysis, return the dictionary of the dashboard"""
+
+    dictionary = {}
+
+    result_mastery = results['mastery']
+    result_sprite_naming = results['spriteNaming']
+    result_backdrop_naming = results['backdropNaming']
+    result_duplicate_script = results['duplicateScript']
+    resultDeadCode = results['deadCode']
+    result_initialization = results['initialization']
+
+    with metrics.timer('process'):
         dictionary.update(proc_mastery(request, result_mastery, filename))
         dictionary.update(proc_sprite_naming(result_sprite_naming, filename))
         dictionary.update(proc_backdrop_naming(result_backdrop_naming, filename))
         dictionary.update(proc_duplicate_script(result_duplicate_script, filename))
         dictionary.update(proc_dead_code(resultDeadCode, filename))
-        # dictionary.update(proc_initialization(resultInitialization, filename))
+        dictionary.update(proc_initialization(result_initialization, filename))
         code = {'dupCode': duplicate_script_scratch_block(result_duplicate_script)}
         dictionary.update(code)
-        # code = {'dCode':dead_code_scratch_block(resultDeadCode)}
-        # dictionary.update(code)
-        return dictionary
-    else:
-        raise Exception
+
+    # The processors only fill the File, it is written once here
+    with metrics.timer('db.save'):
+        filename.save(update_fields=FILE_ANALYSIS_FIELDS)
+    # code = {'dCode':dead_code_scratch_block(resultDeadCode)}
+    # dictionary.update(code)
+    return dictionary
 
 
 # _______________________________ PROCESSORS _________________________________#
 
-def proc_mastery(request, lines, filename):
+def proc_mastery(request, result, filename):
     """Returns the information of Mastery"""
 
     dic = {}
-    lLines = lines.split('\n')
-    d = {}
-    d = ast.literal_eval(lLines[1])
-    lLines = lLines[2].split(':')[1]
-    points = int(lLines.split('/')[0])
-    maxi = int(lLines.split('/')[1])
+    d = result["mastery"]
+    points = result["points"]
+    maxi = result["maxi"]
 
     #Save in DB
     filename.score = points
@@ -663,7 +630,6 @@ def proc_mastery(request, lines, filename):
     filename.flowControl = d["FlowControl"]
     filename.userInteractivity = d["UserInteractivity"]
     filename.dataRepresentation = d["DataRepresentation"]
-    filename.save()
 
     #Translation
     d_translated = translate(request, d, filename)
@@ -675,148 +641,86 @@ def proc_mastery(request, lines, filename):
     return dic
 
 
-def proc_duplicate_script(lines, filename):
+def proc_duplicate_script(result, filename):
 
     dic = {}
-    number = 0
-    lLines = lines.split('\n')
-    number = lLines[0].split(" ")[0]
+    number = result["number"]
     dic["duplicateScript"] = dic
     dic["duplicateScript"]["number"] = number
-    # if number != "0":
-    #     dic["duplicateScript"]["duplicated"] = lLines[1:-1]
 
     #Save in DB
     filename.duplicateScript = number
-    filename.save()
 
     return dic
 
 
-def proc_sprite_naming(lines, filename):
+def proc_sprite_naming(result, filename):
 
     dic = {}
-    lLines = lines.split('\n')
-    number = lLines[0].split(' ')[0]
-    lObjects = lLines[1:]
-    lfinal = lObjects[:-1]
+    number = result["number"]
     dic['spriteNaming'] = dic
-    dic['spriteNaming']['number'] = int(number)
-    dic['spriteNaming']['sprite'] = lfinal
+    dic['spriteNaming']['number'] = number
+    dic['spriteNaming']['sprite'] = result["sprite"]
 
     #Save in DB
     filename.spriteNaming = number
-    filename.save()
 
     return dic
 
 
-def proc_backdrop_naming(lines, filename):
+def proc_backdrop_naming(result, filename):
 
     dic = {}
-    lLines = lines.split('\n')
-    number = lLines[0].split(' ')[0]
-    lObjects = lLines[1:]
-    lfinal = lObjects[:-1]
+    number = result["number"]
     dic['backdropNaming'] = dic
-    dic['backdropNaming']['number'] = int(number)
-    dic['backdropNaming']['backdrop'] = lfinal
+    dic['backdropNaming']['number'] = number
+    dic['backdropNaming']['backdrop'] = result["backdrop"]
 
     #Save in DB
     filename.backdropNaming = number
-    filename.save()
 
     return dic
 
 
-def proc_dead_code(lines, filename):
-
-    dead_code = lines.split("\n")[1:]
-    iterator = 0
-    lcharacter = []
-    lblocks = []
+def proc_dead_code(result, filename):
 
-    if dead_code:
-        d = ast.literal_eval(dead_code[0])
-        for keys, values in d.items():
-            lcharacter.append(keys)
-            lblocks.append(values)
-            iterator += len(values)
+    iterator = result["number"]
 
     dic = {}
     dic["deadCode"] = dic
     dic["deadCode"]["number"] = iterator
 
-    number = len(lcharacter)
-
-    for i in range(number):
-        dic["deadCode"][lcharacter[i].encode('utf-8')] = lblocks[i]
+    for sprite, blocks in result["sprites"].items():
+        dic["deadCode"][sprite.encode('utf-8')] = blocks
 
     filename.deadCode = iterator
-    filename.save()
 
     return dic
 
 
-"""
-def proc_initialization(lines, filename):
-
+def proc_initialization(result, filename):
 
     dic = {}
-    lLines = lines.split('.sb2')
-    d = ast.literal_eval(lLines[1])
-    keys = d.keys()
-    values = d.values()
-    items = d.items()
-    number = 0
-
-    for keys, values in items:
-        list = []
-        attribute = ""
-        internalkeys = values.keys()
-        internalvalues = values.values()
-        internalitems = values.items()
-        flag = False
-        counterFlag = False
-        i = 0
-        for internalkeys, internalvalues in internalitems:
-            if internalvalues == 1:
-                counterFlag = True
-                for value in list:
-                    if internalvalues == value:
-                        flag = True
-                if not flag:
-                    list.append(internalkeys)
-                    if len(list) < 2:
-                        attribute = str(internalkeys)
-                    else:
-                        attribute = attribute + ", " + str(internalkeys)
-        if counterFlag:
-            number = number + 1
-        d[keys] = attribute
-    dic["initialization"] = d
-    dic["initialization"]["number"] = number
+    dic["initialization"] = dic
+    dic["initialization"]["number"] = result["number"]
+
+    for sprite, attributes in result["sprites"].items():
+        dic["initialization"][sprite.encode('utf-8')] = ", ".join(attributes)
 
     #Save in DB
-    filename.initialization = number
-    filename.save()
+    filename.initialization = result["number"]
 
     return dic
 
-"""
 
 #____________________  INFORMATION TO SCRATCH BLOCKS  ________________________#
 
-def duplicate_script_scratch_block(code):
+def duplicate_script_scratch_block(result):
 
-    try:
-        code = code.split("\n")[1:][0]
-        if code == "":  #No duplicated scripts found
-            code = ""
-        else:
-            code = code[1:-1].split(",")
-    except:
-        code = ""
+    if result["scripts"]:
+        code = str(result["scripts"][0])[1:-1].split(",")
+    else:
+        code = ""   #No duplicated scripts found
 
     return code
 
@@ -850,7 +754,6 @@ def translate(request, d, filename):
         d_translate_es['Interactividad con el usuario'] = d['UserInteractivity']
         d_translate_es['Representación de la información'] = d['DataRepresentation']
         filename.language = "es"
-        filename.save()
         return d_translate_es
     elif request.LANGUAGE_CODE == "en":
         d_translate_en = {}
@@ -862,7 +765,6 @@ def translate(request, d, filename):
         d_translate_en['User interactivity'] = d['UserInteractivity']
         d_translate_en['Data representation'] = d['DataRepresentation']
         filename.language = "en"
-        filename.save()
         return d_translate_en
     elif request.LANGUAGE_CODE == "ca":
         d_translate_ca = {}
@@ -874,7 +776,6 @@ def translate(request, d, filename):
         d_translate_ca["Interactivitat de l'usuari"] = d['UserInteractivity']
         d_translate_ca['Representació de dades'] = d['DataRepresentation']
         filename.language = "ca"
-        filename.save()
         return d_translate_ca
     elif request.LANGUAGE_CODE == "gl":
         d_translate_gl = {}
@@ -886,7 +787,6 @@ def translate(request, d, filename):
         d_translate_gl["Interactividade do susario"] = d['UserInteractivity']
         d_translate_gl['Representación dos datos'] = d['DataRepresentation']
         filename.language = "gl"
-        filename.save()
         return d_translate_gl
 
     elif request.LANGUAGE_CODE == "pt":
@@ -899,7 +799,6 @@ def translate(request, d, filename):
         d_translate_pt["Interatividade com o usuário"] = d['UserInteractivity']
         d_translate_pt['Representação de dados'] = d['DataRepresentation']
         filename.language = "pt"
-        filename.save()
         return d_translate_pt
     
     elif request.LANGUAGE_CODE == "el":
@@ -912,7 +811,6 @@ def translate(request, d, filename):
         d_translate_el['Αλληλεπίδραση χρήστη'] = d['UserInteractivity']
         d_translate_el['Αναπαράσταση δεδομένων'] = d['DataRepresentation']
         filename.language = "el"
-        filename.save()
         return d_translate_el
 
     elif request.LANGUAGE_CODE == "eu":           
@@ -925,7 +823,6 @@ def translate(request, d, filename):
         d_translate_eu['Erabiltzailearen elkarreragiletasuna'] = d['UserInteractivity']
         d_translate_eu['Datu adierazlea'] = d['DataRepresentation']
         filename.language = "eu"
-        filename.save()
         return d_translate_eu
 
     elif request.LANGUAGE_CODE == "it":           
@@ -938,7 +835,6 @@ def translate(request, d, filename):
         d_translate_it['Interattività utente'] = d['UserInteractivity']
         d_translate_it['Rappresentazione dei dati'] = d['DataRepresentation']
         filename.language = "it"
-        filename.save()
         return d_translate_it
 
     elif request.LANGUAGE_CODE == "ru":
@@ -951,7 +847,6 @@ def translate(request, d, filename):
         d_translate_ru['Интерактивность'] = d['UserInteractivity']
         d_translate_ru['Представление данных'] = d['DataRepresentation']
         filename.language = "ru"
-        filename.save()
         return d_translate_ru
 
 
@@ -965,7 +860,6 @@ def translate(request, d, filename):
         d_translate_en['User interactivity'] = d['UserInteractivity']
         d_translate_en['Data representation'] = d['DataRepresentation']
         filename.language = "any"
-        filename.save()
         return d_translate_any
 
 ###############################################################################
@@ -1098,10 +992,14 @@ def download_certificate(request):
         else:
             language = 'en'
 
-        pyploma.generate(filename, level, language)
-        path_to_file = os.path.dirname(os.path.dirname(__file__)) + "/app/certificate/output.pdf"
-
-        pdf_data = open(path_to_file, 'r')
+        try:
+            pdf_data = pyploma.certificate(filename, level, language)
+        except pyploma.CertificateTimeout:
+            logger.error('Certificate of %s not ready in time', filename)
+            return render(request, 'error/500.html', status=503)
+        except pyploma.CertificateError as e:
+            logger.error('Certificate of %s failed: %s', filename, e)
+            return render(request, 'error/500.html', status=500)
         response = HttpResponse(pdf_data, content_type='application/pdf')
 
         try:
@@ -1154,7 +1052,8 @@ def plugin(request, urlProject):
 
     user = None
     idProject = process_string_url(urlProject)
-    d = generator_dic(request, idProject)
+    with metrics.trace('plugin'):
+        d = generator_dic(request, idProject)
     #Find if any error has occurred
     if d['Error'] == 'analyzing':
         return render(request, user + '/error_analyzing.html')
@@ -1174,7 +1073,6 @@ def plugin(request, urlProject):
     #Show the dashboard according the CT level
     else:
         user = "main"
-        base_dir = os.getcwd()
         if d["mastery"]["points"] >= 15:
             return render(request, user + '/dashboard-master.html', d)
 
@@ -1363,8 +1261,9 @@ def organization(request, name):
         if request.user.is_authenticated():
             username = request.user.username
             if username == name:
-                if Organization.objects.filter(username = username):
-                    user = Organization.objects.get(username=username)
+                user_kind = userKind.of_request(request)
+                if user_kind.is_organization:
+                    user = user_kind.profile
                     img = user.img
                     dic={'username':username,
                     "img":str(img)}
@@ -1388,67 +1287,57 @@ def stats(request,username):
     """Generator of the stats from Coders and Organizations"""
 
 
-    flagOrganization = 0
-    flagCoder = 0
-    if Organization.objects.filter(username=username):
-        flagOrganization = 1
-        page = 'organization'
-        user = Organization.objects.get(username=username)
-    elif Coder.objects.filter(username=username):
-        flagCoder = 1
-        page = 'coder'
-        user = Coder.objects.get(username=username)
+    user_kind = userKind.of_username(request, username)
+    if user_kind.kind is None:
+        raise Http404
+    page = user_kind.page
+    user = user_kind.profile
+    f = File.objects.filter(**user_kind.owner())
 
     date_joined= user.date_joined
     end = datetime.today()
     end = date(end.year, end.month,end.day)
     start = date(date_joined.year,date_joined.month,date_joined.day)
     dateList = date_range(start, end)
+
+    # Average score of every day in a single grouped query
+    daily_avg = f.filter(time__gte=start, time__lte=end) \
+                 .values('time').annotate(avg=Avg('score')).order_by()
+    daily_avg = dict((row['time'], row['avg']) for row in daily_avg)
+
     daily_score = []
     mydates = []
     for n in dateList:
         mydates.append(n.strftime("%d/%m"))
-        if flagOrganization:
-            points = File.objects.filter(organization=username).filter(time=n)
-        elif flagCoder:
-            points = File.objects.filter(coder=username).filter(time=n)
-        points = points.aggregate(Avg("score"))["score__avg"]
-        daily_score.append(points)
-
-    for n in daily_score:
-        if n==None:
-            daily_score[daily_score.index(n)]=0
-
-    if flagOrganization:
-        f = File.objects.filter(organization=username)
-    elif flagCoder:
-        f = File.objects.filter(coder=username)
-    if f:
+        daily_score.append(daily_avg.get(n) or 0)
+
+    skills = f.aggregate(projects=Count('id'),
+                         parallelism=Avg("parallelization"),
+                         abstraction=Avg("abstraction"),
+                         logic=Avg("logic"),
+                         synchronization=Avg("synchronization"),
+                         flowControl=Avg("flowControl"),
+                         userInteractivity=Avg("userInteractivity"),
+                         dataRepresentation=Avg("dataRepresentation"))
+    if skills["projects"]:
 
         #If the org has analyzed projects
-        parallelism = f.aggregate(Avg("parallelization"))
-        parallelism = int(parallelism["parallelization__avg"])
-        abstraction = f.aggregate(Avg("abstraction"))
-        abstraction = int(abstraction["abstraction__avg"])
-        logic = f.aggregate(Avg("logic"))
-        logic = int(logic["logic__avg"])
-        synchronization = f.aggregate(Avg("synchronization"))
-        synchronization = int(synchronization["synchronization__avg"])
-        flowControl = f.aggregate(Avg("flowControl"))
-        flowControl = int(flowControl["flowControl__avg"])
-        userInteractivity = f.aggregate(Avg("userInteractivity"))
-        userInteractivity = int(userInteractivity["userInteractivity__avg"])
-        dataRepresentation = f.aggregate(Avg("dataRepresentation"))
-        dataRepresentation = int(dataRepresentation["dataRepresentation__avg"])
-
-        deadCode = File.objects.all().aggregate(Avg("deadCode"))
-        deadCode = int(deadCode["deadCode__avg"])
-        duplicateScript = File.objects.all().aggregate(Avg("duplicateScript"))
-        duplicateScript = int(duplicateScript["duplicateScript__avg"])
-        spriteNaming = File.objects.all().aggregate(Avg("spriteNaming"))
-        spriteNaming = int(spriteNaming["spriteNaming__avg"])
-        initialization = File.objects.all().aggregate(Avg("initialization"))
-        initialization = int(initialization["initialization__avg"])
+        parallelism = int(skills["parallelism"])
+        abstraction = int(skills["abstraction"])
+        logic = int(skills["logic"])
+        synchronization = int(skills["synchronization"])
+        flowControl = int(skills["flowControl"])
+        userInteractivity = int(skills["userInteractivity"])
+        dataRepresentation = int(skills["dataRepresentation"])
+
+        smells = File.objects.all().aggregate(deadCode=Avg("deadCode"),
+                                              duplicateScript=Avg("duplicateScript"),
+                                              spriteNaming=Avg("spriteNaming"),
+                                              initialization=Avg("initialization"))
+        deadCode = int(smells["deadCode"])
+        duplicateScript = int(smells["duplicateScript"])
+        spriteNaming = int(smells["spriteNaming"])
+        initialization = int(smells["initialization"])
     else:
 
         #If the org hasn't analyzed projects yet
@@ -1486,26 +1375,22 @@ def settings(request,username):
     base_dir = os.getcwd()
     if base_dir == "/":
         base_dir = "/var/www/drscratchv3"
-    flagOrganization = 0
-    flagCoder = 0
-    if Organization.objects.filter(username=username):
-        page = 'organization'
-        user = Organization.objects.get(username=username)
-    elif Coder.objects.filter(username=username):
-        page = 'coder'
-        user = Coder.objects.get(username=username)
+    user_kind = userKind.of_username(request, username)
+    if user_kind.kind is None:
+        raise Http404
+    page = user_kind.page
+    user = user_kind.profile
 
     if request.method == "POST":
 
         #Saving image in DB
         user.img = request.FILES["img"]
-        os.chdir(base_dir+"/static/img")
         user.img.name = str(user.img)
 
-        if os.path.exists(user.img.name):
-            os.remove(user.img.name)
+        path_img = os.path.join(base_dir, "static", "img", user.img.name)
+        if os.path.exists(path_img):
+            os.remove(path_img)
 
-        os.chdir(base_dir)
         user.save()
 
     dic = {
@@ -1522,22 +1407,13 @@ def downloads(request,username, filename=""):
     """Allow to Coders and Organizations download the files.CSV already analyzed"""
 
 
-    flagOrganization = 0
-    flagCoder = 0
     #segmentation
-    if Organization.objects.filter(username=username):
-        flagOrganization = 1
-        user = Organization.objects.get(username=username)
-    elif Coder.objects.filter(username=username):
-        flagCoder = 1
-        user = Coder.objects.get(username=username)
-
-    if flagOrganization:
-        csv = CSVs.objects.all().filter(organization=username)
-        page = 'organization'
-    elif flagCoder:
-        csv = CSVs.objects.all().filter(coder=username)
-        page = 'coder'
+    user_kind = userKind.of_username(request, username)
+    if user_kind.kind is None:
+        raise Http404
+    user = user_kind.profile
+    csv = CSVs.objects.all().filter(**user_kind.owner())
+    page = user_kind.page
     #LIFO to show the files.CSV
 
     csv_len = len(csv)
@@ -1570,13 +1446,12 @@ def downloads(request,username, filename=""):
 
     if request.method == "POST":
         #Downloading CSV
-        filename = request.POST["csv"]
+        filename = os.path.basename(request.POST["csv"])
         path_to_file = os.path.dirname(os.path.dirname(__file__)) + \
                         "/csvs/Dr.Scratch/" + filename
-        csv_data = open(path_to_file, 'r')
-        response = HttpResponse(csv_data, content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename=%s' % smart_str(filename)
-        return response
+        if not os.path.exists(path_to_file):
+            raise Http404
+        return csvExport.file_response(request, path_to_file, filename)
 
     
     return render(request, page + '/downloads.html', dic)
@@ -1590,214 +1465,157 @@ def analyze_CSV(request):
 
     if request.method =='POST':
         if "_upload" in request.POST:
-            #Analize CSV file
-            csv_data = 0
-            flag_csv = False
+            #Save file .csv, the projects are analyzed by the csvworker command
             file = request.FILES['csvFile']
             file_name = request.user.username + "_" + str(datetime.now()) + \
                         ".csv"# file.name.encode('utf-8')
             dir_csvs = os.path.dirname(os.path.dirname(__file__)) + \
                         "/csvs/" + file_name
-            #Save file .csv
             with open(dir_csvs, 'wb+') as destination:
                 for chunk in file.chunks():
                     destination.write(chunk)
-            dictionary = {}
-            for line in open(dir_csvs, 'r'):
-                row = len(line.split(","))
-                type_csv = ""
-                username = request.user.username
-
-                #Check doesn't exist any old project.json
-                try:
-                    os.remove(dir_zips + "project.json")
-                except:
-                    print "No existe"
-                
-                if row == 2:
-                    type_csv = "2_row"
-                    code = line.split(",")[0]
-                    url = line.split(",")[1]
-                    url = url.split("\n")[0]
-                    method = "csv"
-                    if url.isdigit():
-                        idProject = url
-                    else:
-                        slashNum = url.count('/')
-                        if slashNum == 4:
-                            idProject = url.split("/")[-1]
-                        elif slashNum == 5:
-                            idProject = url.split('/')[-2]
-                    try:
-                        pathProject, file = send_request_getsb3(idProject, username, method)
-                        d = analyze_project(request, pathProject, file)
-                    except:
-                        d = ["Error analyzing project", url]
-
-                    try:
-                        os.remove(dir_zips + "project.json")
-                    except:
-                        print "No existe"
-
-                    dic = {}
-                    dic[line] = d
-                    dictionary.update(dic)
-                elif row == 1:
-                    type_csv = "1_row"
-                    url = line.split("\n")[0]
-                    method = "csv"
-                    if url.isdigit():
-                        idProject = url
-                    else:
-                        slashNum = url.count('/')
-                        if slashNum == 4:
-                            idProject = url.split("/")[-1]
-                        elif slashNum == 5:
-                            idProject = url.split('/')[-2]
-                    try:
-                        pathProject, file = send_request_getsb3(idProject, username, method)
-                        d = analyze_project(request, pathProject, file)
-                    except:
-                        d = ["Error analyzing project", url]
 
-                    try:
-                        os.remove(dir_zips + "project.json")
-                    except:
-                        print "No existe"
-
-
-                    dic = {}
-                    dic[url] = d
-                    dictionary.update(dic)
-
-            csv_data = generator_CSV(request, dictionary, file_name, type_csv)
+            username = request.user.username
 
             #segmentation
-            if Organization.objects.filter(username = username):
-                csv_save = CSVs(filename = file_name, 
-                                    directory = csv_data, 
-                                    organization = username)
-                
-                page = 'organization'
-            elif Coder.objects.filter(username = username):
-                csv_save = CSVs(filename = file_name, 
-                                    directory = csv_data, 
-                                    coder = username)
-                page = 'coder'
-            csv_save.save()
+            user_kind = userKind.of_request(request)
+            job = CSVJob(filename = file_name,
+                         upload = dir_csvs,
+                         language = request.LANGUAGE_CODE,
+                         **user_kind.owner())
+            page = user_kind.page
+            job.save()
 
             return HttpResponseRedirect('/' + page + "/downloads/" + username)
 
         elif "_download" in request.POST:
             #Export a CSV File
 
-            if request.user.is_authenticated():
-                username = request.user.username
-            csv = CSVs.objects.latest('date')
+            user_kind = userKind.of_request(request)
+            if user_kind.kind is None:
+                raise Http404
+            try:
+                csv = CSVs.objects.filter(**user_kind.owner()).latest('date')
+            except CSVs.DoesNotExist:
+                raise Http404
 
             path_to_file = os.path.dirname(os.path.dirname(__file__)) + \
                             "/csvs/Dr.Scratch/" + csv.filename
-            csv_data = open(path_to_file, 'r')
-            response = HttpResponse(csv_data, content_type='text/csv')
-            response['Content-Disposition'] = 'attachment; filename=%s' % smart_str(csv.filename)
-            return response
+            if not os.path.exists(path_to_file):
+                raise Http404
+            return csvExport.file_response(request, path_to_file, csv.filename)
 
     else:
         return HttpResponseRedirect("/organization")
 
 
-#_________________________GENERATOR CSV FOR ORGANIZATION____________________________#
+def metrics_view(request):
+    """Timings of the stages of the analyses in the text format of Prometheus"""
 
-def generator_CSV(request, dictionary, filename, type_csv):
-    """Generator of a csv file"""
+    allowed = getattr(django_settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    if not request.user.is_staff and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.prometheus(), content_type='text/plain; version=0.0.4')
 
-    csv_directory = os.path.dirname(os.path.dirname(__file__)) + \
-                                        "/csvs/Dr.Scratch/"
-    csv_data = csv_directory + filename
-    writer = csv.writer(open(csv_data, "wb"))
-    dic = org.translate_CT(request.LANGUAGE_CODE)
 
-    if type_csv == "2_row":
-        writer.writerow([dic["code"], dic["url"], dic["mastery"],
-                        dic["abstraction"], dic["parallelism"],
-                        dic["logic"], dic["sync"],
-                        dic["flow_control"], dic["user_inter"], dic["data_rep"],
-                        dic["dup_scripts"],dic["sprite_naming"],
-                        dic["dead_code"], dic["attr_init"]])
-
-    elif type_csv == "1_row":
-        writer.writerow([dic["url"], dic["mastery"],
-                        dic["abstraction"], dic["parallelism"],
-                        dic["logic"], dic["sync"],
-                        dic["flow_control"], dic["user_inter"], dic["data_rep"],
-                        dic["dup_scripts"],dic["sprite_naming"],
-                        dic["dead_code"], dic["attr_init"]])
-
-    for key, value in dictionary.items():
-        total = 0
-        flag = False
-        try:
-            if value[0] == "Error analyzing project":
-                if type_csv == "2_row":
-                    row1 = key.split(",")[0]
-                    row2 = key.split(",")[1]
-                    row2 = row2.split("\n")[0]
-                    writer.writerow([row1, row2, dic["error"]])
-                elif type_csv == "1_row":
-                    row1 = key.split(",")[0]
-                    writer.writerow([row1,dic["error"]])
-        except:
-            total = 0
-            row1 = key.split(",")[0]
-            if type_csv == "2_row":
-                row2 = key.split(",")[1]
-                row2 = row2.split("\n")[0]
-
-            for key, subvalue in value.items():
-                if key == "duplicateScript":
-                    for key, sub2value in subvalue.items():
-                        if key == "number":
-                            row11 = sub2value
-                if key == "spriteNaming":
-                    for key, sub2value in subvalue.items():
-                        if key == "number":
-                            row12 = sub2value
-                if key == "deadCode":
-                    for key, sub2value in subvalue.items():
-                        if key == "number":
-                            row13 = sub2value
-                if key == "initialization":
-                    for key, sub2value in subvalue.items():
-                        if key == "number":
-                            row14 = sub2value
-
-            for key, value in value.items():
-                if key == "mastery":
-                    for key, subvalue in value.items():
-                        if key!="maxi" and key!="points":
-                            if key == dic["parallelism"]:
-                                row5 = subvalue
-                            elif key == dic["abstraction"]:
-                                row4 = subvalue
-                            elif key == dic["logic"]:
-                                row6 = subvalue
-                            elif key == dic["sync"]:
-                                row7 = subvalue
-                            elif key == dic["flow_control"]:
-                                row8 = subvalue
-                            elif key == dic["user_inter"]:
-                                row9 = subvalue
-                            elif key == dic["data_rep"]:
-                                row10 = subvalue
-                            total = total + subvalue
-                    row3 = total
-            if type_csv == "2_row":
-                writer.writerow([row1,row2,row3,row4,row5,row6,row7,row8,
-                            row9,row10,row11,row12,row13,row14])
-            elif type_csv == "1_row":
-                writer.writerow([row1,row3,row4,row5,row6,row7,row8,
-                                row9,row10,row11,row12,row13,row14])
-    return csv_data
+def analysis_cache(request):
+    """Hit and miss counters of the cache of analyses"""
+
+    if not request.user.is_staff:
+        return HttpResponseRedirect('/')
+
+    return HttpResponse(json.dumps(analysisCache.stats()),
+                        content_type='application/json')
+
+
+def csv_job_status(job):
+    """Progress of a CSVJob"""
+
+    if job.total:
+        progress = round(100.0 * job.done / job.total, 1)
+    else:
+        progress = 0.0
+
+    return {'id': job.pk,
+            'filename': job.filename,
+            'status': job.status,
+            'total': job.total,
+            'done': job.done,
+            'errors': job.errors,
+            'progress': progress,
+            'date': job.date.isoformat(),
+            'finished': job.finished.isoformat() if job.finished else None}
+
+
+def user_csv_jobs(request):
+    """CSVJobs of the organization or coder logged in"""
+
+    user_kind = userKind.of_request(request)
+    if user_kind.kind is None:
+        return CSVJob.objects.none()
+    return CSVJob.objects.filter(**user_kind.owner())
+
+
+def csv_jobs(request):
+    """Status of all the CSVJobs of the user, newest first"""
+
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect('/')
+
+    jobs = [csv_job_status(job) for job in user_csv_jobs(request).order_by('-date')]
+    return HttpResponse(json.dumps({"jobs": jobs}),
+                        content_type='application/json')
+
+
+def csv_job(request, id_job):
+    """Status and progress of one CSVJob"""
+
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect('/')
+
+    try:
+        job = user_csv_jobs(request).get(pk=id_job)
+    except CSVJob.DoesNotExist:
+        return HttpResponse(json.dumps({"Error": "no_exists"}), status=404,
+                            content_type='application/json')
+
+    return HttpResponse(json.dumps(csv_job_status(job)),
+                        content_type='application/json')
+
+
+def csv_job_download(request, id_job):
+    """Download the rows of a CSVJob analyzed so far"""
+
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect('/')
+
+    try:
+        job = user_csv_jobs(request).get(pk=id_job)
+    except CSVJob.DoesNotExist:
+        return HttpResponse(status=404)
+
+    path_to_file = os.path.dirname(os.path.dirname(__file__)) + \
+                    "/csvs/Dr.Scratch/" + job.filename
+    if not os.path.exists(path_to_file):
+        return HttpResponse(status=404)
+
+    return csvExport.file_response(request, path_to_file, job.filename)
+
+
+def projects_csv(request):
+    """CSV with the results of every project analyzed by the user, made on the fly"""
+
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect('/')
+
+    user_kind = userKind.of_request(request)
+    if user_kind.kind is None:
+        raise Http404
+
+    files = File.objects.filter(**user_kind.owner())
+    dic = org.translate_CT(request.LANGUAGE_CODE)
+    return csvExport.stream_csv(csvExport.files_rows(files, dic),
+                                request.user.username + "_projects.csv")
 
 
 
@@ -1969,8 +1787,9 @@ def coder(request, name):
         if request.user.is_authenticated():
             username = request.user.username
             if username == name:
-                if Coder.objects.filter(username = username):
-                    user = Coder.objects.get(username=username)
+                user_kind = userKind.of_request(request)
+                if user_kind.is_coder:
+                    user = user_kind.profile
                     img = user.img
                     dic={'username':username,
                     "img":str(img)}
@@ -3,4 +3,6 @@
 python manage.py flush --no-input
 python manage.py collectstatic --no-input --clear
 python manage.py migrate
+# Analyses of the uploaded CSVs, queued by the web server
+python manage.py csvworker &
 python manage.py runserver 0.0.0.0:8000
\ No newline at end of file
@@ -72,6 +72,10 @@ DATABASES = {
         'PORT': os.environ.get('DRSCRATCH_DATABASE_PORT'),
         'OPTIONS': {
                'autocommit': True,
+        },
+        # The threads of the tests need a file with SQLite, not its in-memory database
+        'TEST': {
+               'NAME': os.environ.get('DRSCRATCH_TEST_DATABASE_NAME'),
         }
     }
 }
@@ -101,6 +105,65 @@ LANGUAGES = (
 SITE_ROOT = os.path.dirname(os.path.realpath(__name__))
 LOCALE_PATHS = (os.path.join(BASE_DIR, 'locale'),)
 
+# Analysis executor: worker processes at a time, seconds per analysis
+# and megabytes of memory per worker
+ANALYSIS_WORKERS = int(os.environ.get('DRSCRATCH_ANALYSIS_WORKERS', 2))
+ANALYSIS_TIMEOUT = int(os.environ.get('DRSCRATCH_ANALYSIS_TIMEOUT', 60))
+ANALYSIS_MEMORY_LIMIT = int(os.environ.get('DRSCRATCH_ANALYSIS_MEMORY_LIMIT', 1024))
+
+# Profiles of the analyses slower than ANALYSIS_PROFILE_THRESHOLD seconds,
+# or killed for their timeout, 0 disables them: the newest ones are kept
+# in profiles/ up to ANALYSIS_PROFILE_MAX_SIZE megabytes, and only a
+# fraction ANALYSIS_PROFILE_RATE of the analyses are profiled
+ANALYSIS_PROFILE_THRESHOLD = float(os.environ.get('DRSCRATCH_ANALYSIS_PROFILE_THRESHOLD', 0))
+ANALYSIS_PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+ANALYSIS_PROFILE_MAX_SIZE = int(os.environ.get('DRSCRATCH_ANALYSIS_PROFILE_MAX_SIZE', 100))
+ANALYSIS_PROFILE_RATE = float(os.environ.get('DRSCRATCH_ANALYSIS_PROFILE_RATE', 1.0))
+
+# Cache of the results of the analyzers: entries and seconds to live
+ANALYSIS_CACHE_SIZE = int(os.environ.get('DRSCRATCH_ANALYSIS_CACHE_SIZE', 10000))
+ANALYSIS_CACHE_TTL = int(os.environ.get('DRSCRATCH_ANALYSIS_CACHE_TTL', 30 * 24 * 3600))
+
+# Projects analyzed by URL are kept in uploads/, written in background
+ARCHIVE_PROJECTS = os.environ.get('DRSCRATCH_ARCHIVE_PROJECTS', 'true') == 'true'
+ARCHIVE_ASYNC = os.environ.get('DRSCRATCH_ARCHIVE_ASYNC', 'true') == 'true'
+
+# Downloads from the Scratch servers: requests in flight, retries of a
+# failed request and requests per second to every host
+FETCH_CONCURRENCY = int(os.environ.get('DRSCRATCH_FETCH_CONCURRENCY', 8))
+FETCH_RETRIES = int(os.environ.get('DRSCRATCH_FETCH_RETRIES', 3))
+FETCH_RATE = float(os.environ.get('DRSCRATCH_FETCH_RATE', 10))
+# Server of old projects, asked for the projects missing in Scratch, e.g.
+# http://127.0.0.1:3030/api/{} (the id goes in {}); none by default
+FETCH_OLD_PROJECT_URL = os.environ.get('DRSCRATCH_FETCH_OLD_PROJECT_URL') or None
+
+# Certificates: pdflatex processes at a time, seconds per certificate and
+# certificates kept in certificates/
+CERTIFICATE_WORKERS = int(os.environ.get('DRSCRATCH_CERTIFICATE_WORKERS', 2))
+CERTIFICATE_TIMEOUT = int(os.environ.get('DRSCRATCH_CERTIFICATE_TIMEOUT', 30))
+CERTIFICATE_CACHE_SIZE = int(os.environ.get('DRSCRATCH_CERTIFICATE_CACHE_SIZE', 10000))
+
+# Timings of the analyses: /metrics is answered to these addresses and to
+# staff users, and every analysis writes a JSON line in the app.metrics logger
+METRICS_ALLOWED_IPS = os.environ.get('DRSCRATCH_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'app.metrics': {
+            'handlers': ['console'],
+            'level': os.environ.get('DRSCRATCH_METRICS_LOG', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 # Send Email
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
@@ -65,6 +65,14 @@ urlpatterns = [
 
     # Upload a .CSV
     url(r'^analyze_CSV$', app_views.analyze_CSV, name='csv'),
+    url(r'^analyze_CSV/jobs$', app_views.csv_jobs, name='csv_jobs'),
+    url(r'^analyze_CSV/jobs/(\d+)$', app_views.csv_job, name='csv_job'),
+    url(r'^analyze_CSV/jobs/(\d+)/csv$', app_views.csv_job_download, name='csv_job_download'),
+    url(r'^analyze_CSV/projects$', app_views.projects_csv, name='projects_csv'),
+
+    # Counters of the cache of analyses
+    url(r'^analysis_cache$', app_views.analysis_cache, name='analysis_cache'),
+    url(r'^metrics$', app_views.metrics_view, name='metrics'),
 
     # Plugins
     url(r'^plugin/(.*)', app_views.plugin, name='plugin'),